@@ -0,0 +1,47 @@
+"""
+Fixtures for the benchmark suite.
+
+Benchmarks use pytest-benchmark, and run against synthetic curricula from
+:py:mod:`curriculum_model.db.synthetic`. Each scale (number of courses) is
+generated once per run, into a SQLite file.
+
+Scales are set with the ``CM_BENCH_SCALES`` environment variable (comma separated,
+default ``50``), e.g. ::
+
+    CM_BENCH_SCALES=50,500,5000 pytest benchmarks --benchmark-autosave
+
+Regressions against the last saved run are checked with ::
+
+    pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:10%
+"""
+import os
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from curriculum_model.db import schema
+from curriculum_model.db.synthetic import generate
+
+pytest.importorskip("pytest_benchmark")
+
+SCALES = [int(s) for s in os.environ.get("CM_BENCH_SCALES", "50").split(",")]
+
+
+class Synthetic():
+    """A generated database, and the curriculum in it."""
+
+    def __init__(self, engine, curriculum_id, scale):
+        self.engine = engine
+        self.curriculum_id = curriculum_id
+        self.scale = scale
+        self.Session = sessionmaker(bind=engine)
+
+
+@pytest.fixture(scope="session", params=SCALES, ids=lambda s: f"{s}_courses")
+def synthetic(request, tmp_path_factory):
+    path = tmp_path_factory.mktemp("bench") / f"synthetic_{request.param}.db"
+    engine = create_engine(f"sqlite:///{path}")
+    schema.Base.metadata.create_all(engine)
+    with engine.begin() as con:
+        curriculum_id = generate(con, request.param, seed=request.param)
+    yield Synthetic(engine, curriculum_id, request.param)
+    engine.dispose()
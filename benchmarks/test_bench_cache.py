@@ -0,0 +1,26 @@
+"""
+Benchmarks for repeated lookups through the query cache
+"""
+from sqlalchemy import select
+from curriculum_model.db.cache import QueryCache
+from curriculum_model.db.schema import Course
+
+
+def _courses(session, curriculum_id):
+    return session.execute(select(Course.course_id, Course.pathway)
+                           .where(Course.curriculum_id == curriculum_id)).all()
+
+
+def test_uncached_courses(benchmark, synthetic):
+    """A curriculum's courses, from the database every time."""
+    with synthetic.Session() as session:
+        assert benchmark(_courses, session, synthetic.curriculum_id)
+
+
+def test_cached_courses(benchmark, synthetic):
+    """The same lookup, answered from the query cache."""
+    cache = QueryCache()
+    with cache.attach(synthetic.Session()) as session:
+        _courses(session, synthetic.curriculum_id)
+        assert benchmark(_courses, session, synthetic.curriculum_id)
+    assert cache.hits > 0
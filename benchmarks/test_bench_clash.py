@@ -0,0 +1,13 @@
+"""
+Benchmarks for finding timetable clashes with week bitsets
+"""
+from curriculum_model.calc.clash import load_clash_index
+
+
+def test_clashes(benchmark, synthetic):
+    """Build the clash index and check every student."""
+    def run():
+        with synthetic.engine.connect() as con:
+            index = load_clash_index(con, synthetic.curriculum_id)
+        return sum(1 for _ in index.all_clashes())
+    assert benchmark(run) >= 0
@@ -0,0 +1,46 @@
+"""
+Benchmarks for loading and copying curricula
+"""
+from curriculum_model.db.schema import CGroup, Component, Cost, CostWeek, Course, CourseSession
+from curriculum_model.db.subtree import copy_subtree, read_subtree
+
+
+def test_load_curriculum(benchmark, synthetic):
+    """Load every object of the curriculum through the ORM."""
+    def load():
+        session = synthetic.Session()
+        n = 0
+        for model in (Course, CourseSession, CGroup, Component):
+            n += len(session.query(model)
+                     .filter(model.curriculum_id == synthetic.curriculum_id).all())
+        n += len(session.query(Cost).join(Component)
+                 .filter(Component.curriculum_id == synthetic.curriculum_id).all())
+        n += len(session.query(CostWeek).join(Cost).join(Component)
+                 .filter(Component.curriculum_id == synthetic.curriculum_id).all())
+        session.close()
+        return n
+    assert benchmark(load) > 0
+
+
+def _copy(synthetic, n_targets):
+    session = synthetic.Session()
+    courses = session.query(Course.course_id) \
+        .filter(Course.curriculum_id == synthetic.curriculum_id) \
+        .order_by(Course.course_id).limit(n_targets + 1).all()
+    source = session.query(CourseSession.course_session_id) \
+        .filter(CourseSession.curriculum_id == synthetic.curriculum_id) \
+        .order_by(CourseSession.course_session_id).limit(1).scalar()
+    roots = read_subtree(session, 'course_session', [source])
+    copy_subtree(session, roots, 'course', [c for c, in courses[1:]])
+    session.rollback()
+    session.close()
+
+
+def test_copy_course_session(benchmark, synthetic):
+    """Copy a course session, and everything below it, to another course."""
+    benchmark.pedantic(_copy, (synthetic, 1), rounds=5)
+
+
+def test_copy_course_session_fan_out(benchmark, synthetic):
+    """Copy a course session, and everything below it, to ten courses at once."""
+    benchmark.pedantic(_copy, (synthetic, 10), rounds=5)
@@ -0,0 +1,21 @@
+"""
+Benchmarks for streaming export
+"""
+import os
+from sqlalchemy import select
+from curriculum_model.db.export import export
+from curriculum_model.db.schema import Component, Cost, CostWeek
+
+
+def test_export_cost_weeks(benchmark, synthetic, tmp_path):
+    """Stream every cost week of the curriculum to CSV."""
+    stmt = select(Cost.cost_id, Cost.cost_type, Cost.mins_per_group, CostWeek.acad_week) \
+        .join(CostWeek, CostWeek.cost_id == Cost.cost_id) \
+        .join(Component, Component.component_id == Cost.component_id) \
+        .where(Component.curriculum_id == synthetic.curriculum_id)
+    path = os.path.join(tmp_path, "cost_weeks.csv")
+
+    def run():
+        with synthetic.engine.connect() as con:
+            return export(con, stmt, path, 'csv')
+    assert benchmark(run) > 0
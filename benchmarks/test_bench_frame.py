@@ -0,0 +1,52 @@
+"""
+Benchmarks for loading curricula into compact frames (compare with test_load_curriculum)
+"""
+import gc
+import tracemalloc
+from curriculum_model.calc.frame import load_curriculum
+from curriculum_model.db.schema import CGroup, Component, Cost, CostWeek, Course, CourseSession
+
+
+def test_load_frame(benchmark, synthetic):
+    """Load the curriculum into a CurriculumFrame."""
+    def load():
+        with synthetic.engine.connect() as con:
+            return load_curriculum(con, synthetic.curriculum_id)
+    frame = benchmark(load)
+    benchmark.extra_info['nbytes'] = frame.nbytes()
+    assert len(frame.cost_week) > 0
+
+
+def test_frame_memory(benchmark, synthetic):
+    """Memory held by the frame, against the same curriculum's ORM instances."""
+    def load_frame():
+        with synthetic.engine.connect() as con:
+            return load_curriculum(con, synthetic.curriculum_id)
+
+    def load_orm():
+        session = synthetic.Session()
+        objs = []
+        for model in (Course, CourseSession, CGroup, Component):
+            objs += session.query(model).filter(model.curriculum_id == synthetic.curriculum_id).all()
+        objs += session.query(Cost).join(Component) \
+            .filter(Component.curriculum_id == synthetic.curriculum_id).all()
+        objs += session.query(CostWeek).join(Cost).join(Component) \
+            .filter(Component.curriculum_id == synthetic.curriculum_id).all()
+        return session, objs
+
+    def traced(load):
+        gc.collect()
+        tracemalloc.start()
+        try:
+            held = load()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del held
+        return current, peak
+
+    frame_bytes, frame_peak = benchmark.pedantic(traced, args=(load_frame,), rounds=1)
+    orm_bytes, orm_peak = traced(load_orm)
+    benchmark.extra_info.update({'frame_bytes': frame_bytes, 'frame_peak': frame_peak,
+                                 'orm_bytes': orm_bytes, 'orm_peak': orm_peak})
+    assert frame_bytes * 10 < orm_bytes
@@ -0,0 +1,15 @@
+"""
+Benchmarks for resolving students and group counts across a curriculum
+"""
+from curriculum_model.calc.frame import load_curriculum
+from curriculum_model.calc.groups import group_counts, student_numbers
+from curriculum_model.db.synthetic import USAGE_ID
+
+
+def test_group_counts(benchmark, synthetic):
+    """Students per component and groups per cost, from a loaded frame."""
+    with synthetic.engine.connect() as con:
+        frame = load_curriculum(con, synthetic.curriculum_id)
+        students = student_numbers(con, frame.encoding, 2020, USAGE_ID)
+    counts = benchmark(group_counts, frame, students)
+    assert len(counts.groups) == len(frame.cost)
@@ -0,0 +1,21 @@
+"""
+Benchmarks for Monte Carlo costing of a curriculum
+"""
+from curriculum_model.calc.costing import costing, rates
+from curriculum_model.calc.frame import load_curriculum
+from curriculum_model.calc.groups import group_counts, student_numbers
+from curriculum_model.calc.sensitivity import simulate
+from curriculum_model.db.refdata import RefCache
+from curriculum_model.db.synthetic import USAGE_ID
+
+
+def test_simulate(benchmark, synthetic):
+    """Hours and non-pay by cost centre for 1,000 samples of student numbers."""
+    with synthetic.engine.connect() as con:
+        frame = load_curriculum(con, synthetic.curriculum_id)
+        students = student_numbers(con, frame.encoding, 2020, USAGE_ID)
+        cost_types = RefCache().table(con, 'cost_type')
+    r = rates(frame, cost_types)
+    allocation = costing(frame, group_counts(frame, students), cost_types).allocation
+    result = benchmark(simulate, frame, students, r, allocation, 1000, seed=0)
+    assert len(result) == 1000
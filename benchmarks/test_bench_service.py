@@ -0,0 +1,13 @@
+"""
+Benchmarks for answering costing queries from a warm service
+"""
+from curriculum_model.service import CostingService
+
+
+def test_warm_costs(benchmark, synthetic):
+    """Hours and non-pay by department, once the curriculum is held in memory."""
+    service = CostingService(synthetic.engine)
+    path = f"/curricula/{synthetic.curriculum_id}/costs"
+    service.handle('GET', path)
+    status, body = benchmark(service.handle, 'GET', path, {'by': 'department'})
+    assert status == 200 and body
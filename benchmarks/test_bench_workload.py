@@ -0,0 +1,13 @@
+"""
+Benchmarks for building the staff × week workload matrix
+"""
+from curriculum_model.calc.workload import load_workload
+
+
+def test_load_workload(benchmark, synthetic):
+    """Load staffing and weeks, and accumulate hours per member of staff per week."""
+    def load():
+        with synthetic.engine.connect() as con:
+            return load_workload(con, synthetic.curriculum_id)
+    workload = benchmark(load)
+    assert len(workload) > 0
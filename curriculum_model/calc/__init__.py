@@ -0,0 +1,6 @@
+"""
+In-process calculations over curricula and student numbers.
+
+Modules in this package load what they need from the database in bulk, then work
+on numpy arrays rather than on ORM objects or row-by-row queries.
+"""
@@ -0,0 +1,140 @@
+"""
+Detection of students whose timetabling groups run in the same weeks.
+
+Each timetabling group's Celcat weeks (its cost's ``cost_week`` rows, through
+``calendar_map``) are held as a bitset in a Python int, with bit n set if the
+group runs in week n. Students are indexed to the groups they're members of, so
+checking a student is a handful of ``&`` operations rather than a self-join of
+``tt_tgroup_membership``.
+
+Only weeks are known here, not days or times, so a clash means two groups that
+*could* collide and need checking on the timetable.
+"""
+from collections import namedtuple
+from sqlalchemy import and_, select
+from curriculum_model.db.export import stream_chunks
+from curriculum_model.db.schema import CalendarMap, Component, Cost, CostWeek, TGroup, TGroupMember
+
+Clash = namedtuple('Clash', ['student_id', 'tgroup_a', 'tgroup_b', 'weeks'])
+
+
+def week_bits(weeks):
+    """
+    Returns the bitset of an iterable of week numbers.
+    """
+    bits = 0
+    for w in weeks:
+        bits |= 1 << w
+    return bits
+
+
+def bit_weeks(bits):
+    """
+    Returns the week numbers in a bitset, in order.
+    """
+    weeks = []
+    while bits:
+        low = bits & -bits
+        weeks.append(low.bit_length() - 1)
+        bits ^= low
+    return weeks
+
+
+class ClashIndex():
+    """
+    Week bitsets of timetabling groups, and the groups of each student.
+
+    Parameters
+    ----------
+    tgroup_weeks : dict
+        tgroup_id to bitset of Celcat weeks.
+    student_groups : dict
+        student_id to a tuple of tgroup_ids.
+    """
+
+    def __init__(self, tgroup_weeks, student_groups):
+        self.tgroup_weeks = tgroup_weeks
+        self.student_groups = student_groups
+
+    def clashes(self, student_id):
+        """
+        Returns the clashes of one student.
+        """
+        groups = self.student_groups.get(student_id, ())
+        result = []
+        seen = 0
+        for i, a in enumerate(groups):
+            bits = self.tgroup_weeks.get(a, 0)
+            # Only look for the other group if this one overlaps any earlier one
+            if bits & seen:
+                for b in groups[:i]:
+                    overlap = bits & self.tgroup_weeks.get(b, 0)
+                    if overlap:
+                        result.append(Clash(student_id, b, a, bit_weeks(overlap)))
+            seen |= bits
+        return result
+
+    def all_clashes(self):
+        """
+        Yields every clash, by student.
+        """
+        for student_id in self.student_groups:
+            yield from self.clashes(student_id)
+
+    def group_clashes(self):
+        """
+        Returns the number of students affected by each clashing pair of groups.
+
+        Returns
+        -------
+        dict
+            (tgroup_a, tgroup_b) to number of students.
+        """
+        counts = {}
+        for clash in self.all_clashes():
+            pair = (clash.tgroup_a, clash.tgroup_b)
+            counts[pair] = counts.get(pair, 0) + 1
+        return counts
+
+
+def load_clash_index(con, curriculum_id, chunk_size=20000):
+    """
+    Builds the clash index for a curriculum's timetabling groups.
+
+    Parameters
+    ----------
+    con : Session or Connection
+        Connection to the database.
+    curriculum_id : int
+        ID of the curriculum.
+    chunk_size : int, optional
+        Number of rows fetched at a time.
+
+    Returns
+    -------
+    ClashIndex
+    """
+    cost_weeks = {}
+    weeks_stmt = select(CostWeek.cost_id, CalendarMap.celcat_week) \
+        .join(Cost, Cost.cost_id == CostWeek.cost_id) \
+        .join(Component, Component.component_id == Cost.component_id) \
+        .join(CalendarMap, and_(CalendarMap.curriculum_id == Component.curriculum_id,
+                                CalendarMap.calendar_type == Component.calendar_type,
+                                CalendarMap.acad_week == CostWeek.acad_week)) \
+        .where(Component.curriculum_id == curriculum_id)
+    for chunk in stream_chunks(con, weeks_stmt, chunk_size):
+        for cost_id, week in chunk:
+            cost_weeks[cost_id] = cost_weeks.get(cost_id, 0) | (1 << week)
+    tgroup_weeks = {}
+    members = {}
+    member_stmt = select(TGroupMember.student_id, TGroup.tgroup_id, TGroup.cost_id) \
+        .join(TGroup, TGroup.tgroup_id == TGroupMember.tgroup_id) \
+        .join(Cost, Cost.cost_id == TGroup.cost_id) \
+        .join(Component, Component.component_id == Cost.component_id) \
+        .where(Component.curriculum_id == curriculum_id) \
+        .order_by(TGroupMember.student_id, TGroup.tgroup_id)
+    for chunk in stream_chunks(con, member_stmt, chunk_size):
+        for student_id, tgroup_id, cost_id in chunk:
+            tgroup_weeks[tgroup_id] = cost_weeks.get(cost_id, 0)
+            members.setdefault(student_id, []).append(tgroup_id)
+    return ClashIndex(tgroup_weeks, {s: tuple(g) for s, g in members.items()})
@@ -0,0 +1,180 @@
+"""
+Multi-year comparison of curriculum hours, non-pay and fee income.
+
+:py:func:`compare` loads the hours, non-pay and fee income views for several
+academic years in one pass each, and aggregates them into a :py:class:`Cube` of
+year × key, where the key is either cost centre or area of study. Rows are read
+in chunks and accumulated with numpy, so memory is bounded by the size of the
+cube rather than the number of rows.
+"""
+import numpy as np
+from sqlalchemy import select
+from curriculum_model.db.queries import view_column, view_query
+from curriculum_model.db.schema import Costc, Curriculum
+from curriculum_model.db.schema import views
+
+MEASURES = ['hours', 'nonpay', 'income', 'students']
+
+# View, key columns (by cube key) and value column of each measure
+_SOURCES = {'hours': (views.CurriculumHours, {'costc': 'costc'}, 'hours'),
+            'nonpay': (views.CurriculumNonPay, {'costc': 'costc'}, 'amount'),
+            'income': (views.FeeIncomeInputCostc, {'costc': 'CostC', 'aos_code': 'aos_code'}, 'Income'),
+            'students': (views.FeeIncomeInputCostc, {'costc': 'CostC', 'aos_code': 'aos_code'}, 'Students')}
+
+
+class Cube():
+    """
+    Measures aggregated by academic year and cost centre (or area of study).
+
+    Parameters
+    ----------
+    years : list
+        Academic years, in order; the first axis of each measure.
+    keys : list
+        Cost centres or areas of study; the second axis of each measure.
+    measures : dict
+        Measure name to a 2D array of shape (len(years), len(keys)).
+    """
+
+    def __init__(self, years, keys, measures):
+        self.years = list(years)
+        self.keys = list(keys)
+        self.measures = measures
+
+    def __getitem__(self, measure):
+        return self.measures[measure]
+
+    def value(self, measure, year, key):
+        """
+        Returns a single value from the cube.
+        """
+        return self.measures[measure][self.years.index(year), self.keys.index(key)]
+
+    def change(self, measure):
+        """
+        Returns the year-on-year change of a measure, with shape (len(years) - 1, len(keys)).
+        """
+        return np.diff(self.measures[measure], axis=0)
+
+    def to_rows(self):
+        """
+        Yields dictionaries of year, key and each measure; useful for export.
+        """
+        for i, year in enumerate(self.years):
+            for j, key in enumerate(self.keys):
+                row = {'acad_year': year, 'key': key}
+                for name, values in self.measures.items():
+                    row[name] = float(values[i, j])
+                yield row
+
+
+def compare(con, acad_years, usage_id, key='costc', measures=None, chunk_size=10000):
+    """
+    Builds a cube of measures for several academic years.
+
+    Curricula are chosen by acad_year and usage_id (using ``IX_curriculum``); each
+    measure's view is then read once for all of the years.
+
+    Parameters
+    ----------
+    con : Session or Connection
+        Connection to the database.
+    acad_years : list
+        Academic years to compare.
+    usage_id : str
+        Student number usage (and curriculum usage).
+    key : str, optional
+        'costc' or 'aos_code'. Hours and non-pay are attributed to the primary
+        area of study of their cost centre when comparing by area of study.
+    measures : list, optional
+        Measures to include; defaults to all of MEASURES.
+    chunk_size : int, optional
+        Number of rows aggregated at a time.
+
+    Returns
+    -------
+    Cube
+    """
+    if key not in ('costc', 'aos_code'):
+        raise ValueError("key must be 'costc' or 'aos_code'.")
+    measures = MEASURES if measures is None else measures
+    years = sorted(acad_years)
+    year_index = {y: i for i, y in enumerate(years)}
+    curriculum_ids = con.execute(select(Curriculum.curriculum_id)
+                                 .where(Curriculum.acad_year.in_(years),
+                                        Curriculum.usage_id == usage_id)).scalars().all()
+    primary_aos = dict(con.execute(select(Costc.costc, Costc.primary_aos_code)).all()) \
+        if key == 'aos_code' else None
+    acc = _Accumulator(len(years), measures)
+    # Group measures by view, so each view is only read once
+    by_view = {}
+    for m in measures:
+        by_view.setdefault(_SOURCES[m][0], []).append(m)
+    for view, view_measures in by_view.items():
+        key_map = _SOURCES[view_measures[0]][1]
+        mapped = key not in key_map
+        key_col = view.c[key_map['costc' if mapped else key]]
+        year_col = view_column(view, 'acad_year')
+        value_cols = [view.c[_SOURCES[m][2]] for m in view_measures]
+        filters = {'acad_year': years, 'usage_id': usage_id}
+        if view_column(view, 'curriculum_id') is not None:
+            filters['curriculum_id'] = curriculum_ids
+        stmt = view_query(view, **filters) \
+            .with_only_columns(year_col, key_col, *value_cols)
+        result = con.execute(stmt)
+        while True:
+            chunk = result.fetchmany(chunk_size)
+            if not chunk:
+                break
+            year_codes = np.fromiter((year_index[r[0]] for r in chunk),
+                                     dtype=np.int64, count=len(chunk))
+            keys = [r[1] for r in chunk]
+            if mapped:
+                keys = [primary_aos.get(k) for k in keys]
+            key_codes = acc.encode(keys)
+            for i, m in enumerate(view_measures):
+                values = np.fromiter((0 if r[2+i] is None else r[2+i] for r in chunk),
+                                     dtype=np.float64, count=len(chunk))
+                acc.add(m, year_codes, key_codes, values)
+    results = acc.result()
+    return Cube(years, acc.keys, results)
+
+
+class _Accumulator():
+    """Sums values into year × key arrays, growing as new keys are seen."""
+
+    def __init__(self, n_years, measures):
+        self.n_years = n_years
+        self.keys = []
+        self._codes = {}
+        self._values = {m: np.zeros((n_years, 64)) for m in measures}
+
+    def encode(self, keys):
+        codes = np.empty(len(keys), dtype=np.int64)
+        for i, k in enumerate(keys):
+            code = self._codes.get(k)
+            if code is None:
+                code = self._codes[k] = len(self.keys)
+                self.keys.append(k)
+            codes[i] = code
+        capacity = next(iter(self._values.values())).shape[1]
+        if len(self.keys) > capacity:
+            new_capacity = max(capacity * 2, len(self.keys))
+            for m, values in self._values.items():
+                grown = np.zeros((self.n_years, new_capacity))
+                grown[:, :capacity] = values
+                self._values[m] = grown
+        return codes
+
+    def add(self, measure, year_codes, key_codes, values):
+        values_2d = self._values[measure]
+        flat = year_codes * values_2d.shape[1] + key_codes
+        values_2d += np.bincount(flat, weights=values,
+                                 minlength=values_2d.size).reshape(values_2d.shape)
+
+    def result(self):
+        # Sort keys so that cubes from different runs line up
+        order = sorted(range(len(self.keys)),
+                       key=lambda i: (self.keys[i] is None, str(self.keys[i])))
+        self.keys = [self.keys[i] for i in order]
+        return {m: values[:, order] for m, values in self._values.items()}
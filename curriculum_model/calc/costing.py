@@ -0,0 +1,252 @@
+"""
+Hours and non-pay of every cost in a curriculum, split across cost centres.
+
+Each cost runs ``groups`` times (from :py:func:`~curriculum_model.calc.groups.group_counts`)
+in each of its weeks. Pay costs deliver ``mins_per_group`` minutes per group per
+week with ``number_of_staff`` staff; non-pay costs spend ``cost_per_group`` per
+group per week. Both are scaled by the cost type's ``cost_multiplier``.
+
+Costs are attributed to the cost centres of the course sessions whose students
+take them, in proportion to the students each course session contributes to the
+cost's component. The attribution is held as a sparse cost × cost centre
+:py:class:`Allocation`, so any array of values by cost (or samples × costs) is
+summed by cost centre with one ``np.bincount``.
+"""
+import numpy as np
+from curriculum_model.calc.encoding import NULL
+
+
+class Allocation():
+    """
+    Sparse split of each cost across cost centres.
+
+    The three arrays are parallel; the fractions of each cost sum to 1, or are
+    empty if no students take it.
+
+    Parameters
+    ----------
+    cost_idx : numpy.ndarray
+        Row position of the cost in the frame's cost table.
+    costc : numpy.ndarray
+        Cost centre code.
+    fraction : numpy.ndarray
+        Share of the cost attributed to the cost centre.
+    n_costc : int
+        Number of cost centre codes.
+    """
+
+    def __init__(self, cost_idx, costc, fraction, n_costc):
+        keep = costc != NULL
+        self.cost_idx = cost_idx[keep]
+        self.costc = costc[keep]
+        self.fraction = fraction[keep]
+        self.n_costc = n_costc
+
+    def __len__(self):
+        return len(self.cost_idx)
+
+    def by_costc(self, values):
+        """
+        Sums values by cost centre.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            Values by cost, along the last axis; e.g. hours per cost, or
+            (samples × costs).
+
+        Returns
+        -------
+        numpy.ndarray
+            Values by cost centre code, with the same leading axes.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        flat = values.reshape(-1, values.shape[-1])[:, self.cost_idx] * self.fraction
+        # Offset each row's codes so that one bincount sums every row
+        offsets = np.arange(flat.shape[0])[:, None] * self.n_costc
+        sums = np.bincount((self.costc[None, :] + offsets).ravel(), weights=flat.ravel(),
+                           minlength=flat.shape[0] * self.n_costc)
+        return sums.reshape(values.shape[:-1] + (self.n_costc,))
+
+
+class Costing():
+    """
+    Hours and non-pay per cost of a curriculum.
+
+    Parameters
+    ----------
+    frame : CurriculumFrame
+        The curriculum.
+    counts : GroupCounts
+        Students and groups per cost.
+    hours : numpy.ndarray
+        Staff hours per cost over the year; zero for non-pay costs.
+    nonpay : numpy.ndarray
+        Non-pay amount per cost over the year; zero for pay costs.
+    allocation : Allocation
+        Split of each cost across cost centres.
+    """
+
+    def __init__(self, frame, counts, hours, nonpay, allocation):
+        self.frame = frame
+        self.counts = counts
+        self.hours = hours
+        self.nonpay = nonpay
+        self.allocation = allocation
+
+    def by_costc(self):
+        """
+        Returns {costc: {'hours': ..., 'nonpay': ...}} for cost centres with any cost.
+        """
+        hours = self.allocation.by_costc(self.hours)
+        nonpay = self.allocation.by_costc(self.nonpay)
+        book = self.frame.encoding['costc']
+        return {book.value(code): {'hours': float(hours[code]), 'nonpay': float(nonpay[code])}
+                for code in np.flatnonzero((hours != 0) | (nonpay != 0))}
+
+    def totals(self):
+        """
+        Returns total hours and non-pay of the curriculum.
+        """
+        return {'hours': float(self.hours.sum()), 'nonpay': float(self.nonpay.sum())}
+
+
+class Rates():
+    """
+    Hours and non-pay of one group of each cost, over the year.
+
+    Multiplying by the number of groups (for one set of student numbers, or a
+    samples × costs array of them) gives each cost's hours and non-pay.
+
+    Parameters
+    ----------
+    hours : numpy.ndarray
+        Staff hours per group, by cost.
+    nonpay : numpy.ndarray
+        Non-pay per group, by cost.
+    is_pay : numpy.ndarray
+        Whether each cost's type is pay.
+    weeks : numpy.ndarray
+        Number of weeks each cost runs.
+    """
+
+    def __init__(self, hours, nonpay, is_pay, weeks):
+        self.hours = hours
+        self.nonpay = nonpay
+        self.is_pay = is_pay
+        self.weeks = weeks
+
+
+def rates(frame, cost_types):
+    """
+    Works out each cost's hours and non-pay per group.
+
+    Parameters
+    ----------
+    frame : CurriculumFrame
+        The curriculum.
+    cost_types : RefTable
+        The cost_type table, e.g. ``reference_cache.table(con, 'cost_type')``.
+
+    Returns
+    -------
+    Rates
+    """
+    cost = frame.cost
+    multiplier, is_pay = _cost_type_arrays(frame.encoding['cost_type'], cost_types)
+    known = cost.cost_type != NULL
+    cost_multiplier = np.where(known, multiplier[np.where(known, cost.cost_type, 0)], 1.0)
+    cost_is_pay = known & is_pay[np.where(known, cost.cost_type, 0)]
+    weeks = np.bincount(frame.cost_week.cost_idx, minlength=len(cost)).astype(np.float64)
+    staff = np.where(np.isnan(cost.number_of_staff), 1.0, cost.number_of_staff)
+    hours = np.where(cost_is_pay, cost.mins_per_group * staff / 60, 0.0) * weeks * cost_multiplier
+    nonpay = np.where(cost_is_pay, 0.0, cost.cost_per_group) * weeks * cost_multiplier
+    return Rates(hours, nonpay, cost_is_pay, weeks)
+
+
+def allocate(frame, counts):
+    """
+    Splits each cost across the cost centres of the course sessions that take it.
+
+    Parameters
+    ----------
+    frame : CurriculumFrame
+        The curriculum.
+    counts : GroupCounts
+        Students at each level, from :py:func:`~curriculum_model.calc.groups.group_counts`.
+
+    Returns
+    -------
+    Allocation
+    """
+    cs, comp, cost = frame.course_session, frame.component, frame.cost
+    csc, cgc = frame.course_session_config, frame.cgroup_config
+    n_costc = len(frame.encoding['costc'])
+    # Students each course session sends to each component: join csc to cgc on cgroup
+    order, offsets = cgc.group('cgroup_idx')
+    csc_rows, within = _expand(offsets[csc.cgroup_idx + 1] - offsets[csc.cgroup_idx])
+    cgc_rows = order[offsets[csc.cgroup_idx[csc_rows]] + within]
+    ratio_total = np.bincount(cgc.cgroup_idx, weights=cgc.ratio, minlength=len(frame.cgroup))
+    share = np.divide(cgc.ratio[cgc_rows], ratio_total[cgc.cgroup_idx[cgc_rows]],
+                      out=np.zeros(len(cgc_rows)), where=ratio_total[cgc.cgroup_idx[cgc_rows]] > 0)
+    students = counts.course_session[csc.course_session_idx[csc_rows]] * share
+    # Sum by (component, costc), then divide by the component's students
+    pair_comp = cgc.component_idx[cgc_rows].astype(np.int64)
+    pair_costc = cs.costc[csc.course_session_idx[csc_rows]].astype(np.int64)
+    pairs, inverse = np.unique(pair_comp * (n_costc + 1) + (pair_costc + 1), return_inverse=True)
+    pair_students = np.bincount(inverse, weights=students, minlength=len(pairs))
+    pair_comp, pair_costc = pairs // (n_costc + 1), pairs % (n_costc + 1) - 1
+    comp_students = np.bincount(pair_comp, weights=pair_students, minlength=len(comp))
+    keep = pair_students > 0
+    pair_comp, pair_costc = pair_comp[keep], pair_costc[keep]
+    fraction = pair_students[keep] / comp_students[pair_comp]
+    # Each cost takes its component's split: join cost to pairs on component
+    pair_offsets = np.zeros(len(comp) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(pair_comp, minlength=len(comp)), out=pair_offsets[1:])
+    start = pair_offsets[cost.component_idx]
+    cost_rows, within = _expand(pair_offsets[cost.component_idx + 1] - start)
+    pair_rows = start[cost_rows] + within
+    return Allocation(cost_rows, pair_costc[pair_rows].astype(np.int32), fraction[pair_rows], n_costc)
+
+
+def costing(frame, counts, cost_types):
+    """
+    Costs a curriculum for one set of student numbers.
+
+    Parameters
+    ----------
+    frame : CurriculumFrame
+        The curriculum.
+    counts : GroupCounts
+        From :py:func:`~curriculum_model.calc.groups.group_counts`.
+    cost_types : RefTable
+        The cost_type table.
+
+    Returns
+    -------
+    Costing
+    """
+    r = rates(frame, cost_types)
+    return Costing(frame, counts, counts.groups * r.hours, counts.groups * r.nonpay,
+                   allocate(frame, counts))
+
+
+def _cost_type_arrays(book, cost_types):
+    multiplier = np.ones(len(book))
+    is_pay = np.zeros(len(book), dtype=bool)
+    for code, value in enumerate(book.values):
+        record = cost_types.get(value)
+        if record is not None:
+            multiplier[code] = 1.0 if record.cost_multiplier is None else record.cost_multiplier
+            is_pay[code] = bool(record.is_pay)
+    return multiplier, is_pay
+
+
+def _expand(counts):
+    """
+    Repeats each row position by its count, returning the repeated rows and each one's
+    position within its run.
+    """
+    rows = np.repeat(np.arange(len(counts)), counts)
+    within = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return rows, within
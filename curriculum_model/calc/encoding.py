@@ -0,0 +1,141 @@
+"""
+Dictionary encoding of the short string keys used throughout the schema.
+
+Cost centres, areas of study, module codes, room types, cost types, fee statuses
+and so on are CHAR/VARCHAR keys. Grouping and joining on them as Python strings
+is slow, so :py:class:`Encoding` maps each reference table's key to dense integer
+codes once, in key order, and calculations group and join on the codes. Values
+are only decoded when results are output.
+
+Code -1 stands for NULL. Values missing from the reference table (e.g. module
+codes on components that aren't in ``module``) are appended to the codebook when
+encoded, so their codes sort after the reference values.
+"""
+import threading
+import numpy as np
+from sqlalchemy import select
+from curriculum_model.db.schema import (aos_code, Calendar, CgroupStrand, Costc, CostType, Department,
+                                        FeeStatus, Module, RoomType)
+
+NULL = -1
+
+# Codebook name to the reference table column holding its values
+KEYS = {'aos_code': aos_code.aos_code,
+        'calendar_type': Calendar.calendar_type,
+        'costc': Costc.costc,
+        'cost_type': CostType.cost_type,
+        'department': Department.department_id,
+        'fee_status': FeeStatus.fee_status_id,
+        'module_code': Module.module_code,
+        'room_type': RoomType.room_type,
+        'strand': CgroupStrand.strand_id}
+
+
+class Codebook():
+    """
+    Two-way mapping between the values of a key and dense integer codes.
+
+    Parameters
+    ----------
+    name : str
+        Name of the key, e.g. 'costc'.
+    values : iterable
+        Initial values; value i gets code i.
+    """
+    __slots__ = ('name', 'values', '_codes', '_lock')
+
+    def __init__(self, name, values=()):
+        self.name = name
+        self.values = []
+        self._codes = {}
+        self._lock = threading.Lock()
+        for v in values:
+            self.code(v)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, value):
+        return value in self._codes
+
+    def code(self, value):
+        """
+        Returns the code of a single value, adding it if it's new.
+        """
+        if value is None:
+            return NULL
+        code = self._codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(value)
+                if code is None:
+                    code = self._codes[value] = len(self.values)
+                    self.values.append(value)
+        return code
+
+    def encode(self, values):
+        """
+        Returns an int32 array of codes for a sequence of values.
+        """
+        get = self._codes.get
+        codes = np.fromiter((get(v, -2) for v in values), dtype=np.int32)
+        missing = np.flatnonzero(codes == -2)
+        for i in missing:
+            codes[i] = self.code(values[i])
+        return codes
+
+    def decode(self, codes):
+        """
+        Returns an object array of the values for an array of codes (None for NULL).
+        """
+        codes = np.asarray(codes)
+        lookup = np.empty(len(self.values) + 1, dtype=object)
+        lookup[:-1] = self.values
+        lookup[-1] = None
+        return lookup[np.where(codes == NULL, len(self.values), codes)]
+
+    def value(self, code):
+        """
+        Returns the value of a single code (None for NULL).
+        """
+        return None if code == NULL else self.values[code]
+
+
+class Encoding():
+    """
+    A set of codebooks, one per key in KEYS.
+
+    Parameters
+    ----------
+    codebooks : dict
+        Name to Codebook.
+    """
+
+    def __init__(self, codebooks):
+        self.codebooks = codebooks
+
+    def __getitem__(self, name):
+        return self.codebooks[name]
+
+    def __contains__(self, name):
+        return name in self.codebooks
+
+    @classmethod
+    def load(cls, con):
+        """
+        Builds codebooks from the reference tables, with one SELECT each.
+        """
+        return cls({name: Codebook(name, con.execute(select(col).order_by(col)).scalars())
+                    for name, col in KEYS.items()})
+
+    def encode(self, name, values):
+        """
+        Shortcut for ``encoding[name].encode(values)``.
+        """
+        return self.codebooks[name].encode(values)
+
+    def decode(self, name, codes):
+        """
+        Shortcut for ``encoding[name].decode(codes)``.
+        """
+        return self.codebooks[name].decode(codes)
@@ -0,0 +1,149 @@
+"""
+Student numbers and group counts for every cost in a curriculum.
+
+Students flow down the curriculum graph:
+
+* course session: the student numbers of each of its courses' area of study, for
+  the session's year of study (via ``course_config``);
+* component group: the sum over the course sessions it's configured in (via
+  ``course_session_config``);
+* component: each of its groups' students, split across the group's mutually
+  exclusive components in proportion to ``cgroup_config.ratio``;
+* cost: its component's students, in groups of at most ``max_group_size``.
+
+Each step is a sparse matrix-vector product over the config table, held as COO
+index arrays in a :py:class:`~curriculum_model.calc.frame.CurriculumFrame`, and
+computed with ``np.bincount``, so the whole curriculum is resolved in one pass
+per table rather than by walking the tree.
+"""
+import numpy as np
+from sqlalchemy import func, select
+from curriculum_model.db.schema import SN, SNInstance
+
+# Tolerance when rounding up to whole groups, so that ratio splits like 3 × 1/3 don't add a group
+_EPSILON = 1e-9
+
+
+class GroupCounts():
+    """
+    Students at each level of a curriculum, and the number of groups per cost.
+
+    Arrays are aligned with the rows of the corresponding frame table.
+
+    Parameters
+    ----------
+    frame : CurriculumFrame
+        The curriculum.
+    course_session, cgroup, component, cost : numpy.ndarray
+        Students per row of each table.
+    groups : numpy.ndarray
+        Number of groups per cost.
+    """
+
+    def __init__(self, frame, course_session, cgroup, component, cost, groups):
+        self.frame = frame
+        self.course_session = course_session
+        self.cgroup = cgroup
+        self.component = component
+        self.cost = cost
+        self.groups = groups
+
+    def rows(self):
+        """
+        Yields (cost_id, component_id, students, groups) for each cost.
+        """
+        cost = self.frame.cost
+        component_ids = self.frame.component.component_id[cost.component_idx]
+        for cost_id, component_id, students, groups in zip(cost.cost_id, component_ids,
+                                                           self.cost, self.groups):
+            yield int(cost_id), int(component_id), float(students), int(groups)
+
+
+def latest_instances(acad_year, usage_id):
+    """
+    Returns a SELECT of the latest non-suppressed student number instance for each cost centre.
+    """
+    return select(func.max(SNInstance.instance_id)) \
+        .where(SNInstance.acad_year == acad_year,
+               SNInstance.usage_id == usage_id,
+               ~SNInstance.surpress) \
+        .group_by(SNInstance.costc)
+
+
+def student_numbers(con, encoding, acad_year, usage_id):
+    """
+    Loads student numbers as an array of area of study code × session.
+
+    The latest instance for each cost centre (by instance_id) is used, skipping
+    suppressed instances; student numbers are summed over fee status and origin.
+
+    Parameters
+    ----------
+    con : Session or Connection
+        Connection to the database.
+    encoding : Encoding
+        Encoding used for the curriculum's frame.
+    acad_year : int
+        Academic year.
+    usage_id : str
+        Student number usage.
+
+    Returns
+    -------
+    numpy.ndarray
+        Students, indexed by [aos_code code, session].
+    """
+    rows = con.execute(select(SN.aos_code, SN.session, func.sum(SN.student_count))
+                       .where(SN.instance_id.in_(latest_instances(acad_year, usage_id)))
+                       .group_by(SN.aos_code, SN.session)).all()
+    aos = encoding.encode('aos_code', [r[0] for r in rows])
+    sessions = np.array([r[1] for r in rows], dtype=np.int64)
+    counts = np.array([float(r[2]) for r in rows], dtype=np.float64)
+    n_sessions = int(sessions.max()) + 1 if len(rows) else 1
+    students = np.zeros((len(encoding['aos_code']), n_sessions))
+    np.add.at(students, (aos, sessions), counts)
+    return students
+
+
+def group_counts(frame, students):
+    """
+    Resolves students and group counts for every cost in a curriculum.
+
+    Parameters
+    ----------
+    frame : CurriculumFrame
+        The curriculum.
+    students : numpy.ndarray
+        Students by area of study code and session, from :py:func:`student_numbers`
+        (with the same encoding as the frame).
+
+    Returns
+    -------
+    GroupCounts
+    """
+    course, cs, cg, comp, cost = (frame.course, frame.course_session, frame.cgroup,
+                                  frame.component, frame.cost)
+    # Course sessions: students of each course's area of study in the session's year
+    cc = frame.course_config
+    aos = course.aos_code[cc.course_idx]
+    session = cs.session[cc.course_session_idx]
+    known = (aos >= 0) & (aos < students.shape[0]) & (session >= 0) & (session < students.shape[1])
+    weights = np.zeros(len(cc))
+    weights[known] = students[aos[known], session[known]]
+    cs_students = np.bincount(cc.course_session_idx, weights=weights, minlength=len(cs))
+    # Component groups: pooled over the course sessions they're in
+    csc = frame.course_session_config
+    cg_students = np.bincount(csc.cgroup_idx, weights=cs_students[csc.course_session_idx],
+                              minlength=len(cg))
+    # Components: split across each group by ratio
+    cgc = frame.cgroup_config
+    ratio_total = np.bincount(cgc.cgroup_idx, weights=cgc.ratio, minlength=len(cg))
+    share = np.divide(cgc.ratio, ratio_total[cgc.cgroup_idx],
+                      out=np.zeros(len(cgc)), where=ratio_total[cgc.cgroup_idx] > 0)
+    comp_students = np.bincount(cgc.component_idx, weights=cg_students[cgc.cgroup_idx] * share,
+                                minlength=len(comp))
+    # Costs
+    cost_students = comp_students[cost.component_idx]
+    groups = np.ceil(cost_students / np.maximum(cost.max_group_size, 1) - _EPSILON)
+    groups = np.maximum(groups, 0).astype(np.int64)
+    return GroupCounts(frame, cs_students, cg_students, comp_students, cost_students, groups)
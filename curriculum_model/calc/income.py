@@ -0,0 +1,109 @@
+"""
+Student numbers and gross fee income for an academic year and usage.
+
+:py:func:`fee_income` reads the latest student number instances (as
+:py:func:`~curriculum_model.calc.groups.student_numbers` does), summed by area of
+study, session and fee status, and prices each row with the fee for the area of
+study's fee category, the fee status and the session, less any waiver. The
+result is held as parallel arrays of codes and values, so it can be summed by
+area of study, fee status or department without going back to the database.
+"""
+import numpy as np
+from sqlalchemy import func, select
+from curriculum_model.calc.encoding import NULL
+from curriculum_model.calc.groups import latest_instances
+from curriculum_model.db.schema import aos_code, Fee, SN
+
+# Key: codebook of the codes summed by
+KEYS = {'aos_code': 'aos_code', 'fee_status': 'fee_status'}
+
+
+class FeeIncome():
+    """
+    Students and income by area of study, session and fee status.
+
+    Parameters
+    ----------
+    encoding : Encoding
+        Codebooks of the codes.
+    aos_code, fee_status : numpy.ndarray
+        Codes of each row.
+    session : numpy.ndarray
+        Year of study of each row.
+    students, income : numpy.ndarray
+        Values of each row.
+    """
+
+    def __init__(self, encoding, aos_code, session, fee_status, students, income):
+        self.encoding = encoding
+        self.aos_code = aos_code
+        self.session = session
+        self.fee_status = fee_status
+        self.students = students
+        self.income = income
+
+    def __len__(self):
+        return len(self.students)
+
+    def by_code(self, key='aos_code'):
+        """
+        Returns (students, income) arrays indexed by the codes of a key in KEYS.
+        """
+        codes = getattr(self, key)
+        n = len(self.encoding[KEYS[key]])
+        keep = codes != NULL
+        return (np.bincount(codes[keep], weights=self.students[keep], minlength=n),
+                np.bincount(codes[keep], weights=self.income[keep], minlength=n))
+
+    def by(self, key='aos_code'):
+        """
+        Returns {key value: {'students': ..., 'income': ...}} for values with any students.
+        """
+        students, income = self.by_code(key)
+        book = self.encoding[KEYS[key]]
+        return {book.value(code): {'students': float(students[code]), 'income': float(income[code])}
+                for code in np.flatnonzero((students != 0) | (income != 0))}
+
+    def totals(self):
+        """
+        Returns total students and income.
+        """
+        return {'students': float(self.students.sum()), 'income': float(self.income.sum())}
+
+
+def fee_income(con, encoding, acad_year, usage_id):
+    """
+    Loads student numbers and prices them.
+
+    Rows without a matching fee have no income.
+
+    Parameters
+    ----------
+    con : Session or Connection
+        Connection to the database.
+    encoding : Encoding
+        Codebooks to encode keys with.
+    acad_year : int
+        Academic year.
+    usage_id : str
+        Student number usage.
+
+    Returns
+    -------
+    FeeIncome
+    """
+    rows = con.execute(select(SN.aos_code, SN.session, SN.fee_status_id, func.sum(SN.student_count))
+                       .where(SN.instance_id.in_(latest_instances(acad_year, usage_id)))
+                       .group_by(SN.aos_code, SN.session, SN.fee_status_id)).all()
+    categories = dict(con.execute(select(aos_code.aos_code, aos_code.fee_cat_id)).all())
+    fees = {(r.fee_cat_id, r.fee_status_id, r.session): float(r.gross_fee) - float(r.waiver or 0)
+            for r in con.execute(select(Fee.fee_cat_id, Fee.fee_status_id, Fee.session, Fee.gross_fee,
+                                        Fee.waiver).where(Fee.acad_year == acad_year))}
+    students = np.array([float(r[3]) for r in rows], dtype=np.float64)
+    net_fee = np.array([fees.get((categories.get(r[0]), r[2], r[1]), 0.0) for r in rows],
+                       dtype=np.float64)
+    return FeeIncome(encoding,
+                     encoding.encode('aos_code', [r[0] for r in rows]),
+                     np.array([r[1] for r in rows], dtype=np.int64),
+                     encoding.encode('fee_status', [r[2] for r in rows]),
+                     students, students * net_fee)
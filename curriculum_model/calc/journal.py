@@ -0,0 +1,191 @@
+"""
+General ledger budget journal of a curriculum's non-pay.
+
+Each non-pay cost spends ``cost_per_group`` (scaled by its cost type's
+``cost_multiplier``) per group in each of its weeks. :py:func:`journal` posts
+that to the cost type's ``nominal_account``, in the financial period of the
+week (academic week → Celcat week through ``calendar_map``, then → period
+through ``week``), split across cost centres with the costing's
+:py:class:`~curriculum_model.calc.costing.Allocation`.
+
+Cost weeks are processed a chunk at a time and summed into a dense cost centre
+× account × period array, so memory doesn't grow with the number of cost weeks.
+:py:meth:`Journal.rows` then yields the non-zero lines in ledger order, for
+streaming to a CSV or fixed-width import file with the writers in
+:py:mod:`curriculum_model.db.export`.
+"""
+import numpy as np
+from sqlalchemy import Numeric, column, select
+from curriculum_model.calc.costing import _expand
+from curriculum_model.calc.encoding import NULL
+from curriculum_model.db.schema import CalendarMap, Costc, CostType, Curriculum, Week
+
+# Columns of a journal line, typed (and so sized, in fixed-width files) like their sources
+COLUMNS = [column('acad_year', Curriculum.acad_year.type),
+           column('period', Week.period.type),
+           column('costc', Costc.costc.type),
+           column('account', CostType.nominal_account.type),
+           column('amount', Numeric(15, 2)),
+           column('description', Curriculum.description.type)]
+
+
+class Journal():
+    """
+    Amounts by cost centre, account and period.
+
+    Parameters
+    ----------
+    acad_year : int
+        Academic year of the curriculum.
+    costc : list
+        Cost centres; the first axis of ``amounts``.
+    accounts : numpy.ndarray
+        Nominal accounts, in order; the second axis.
+    amounts : numpy.ndarray
+        Amounts, of shape (cost centres, accounts, periods); period p is index p.
+    unmapped : float
+        Amount in weeks without a financial period, which isn't in ``amounts``.
+    untyped : float
+        Amount on costs without a nominal account (no cost type, or one missing
+        from the cost types), in weeks with a period; also not in ``amounts``.
+    """
+
+    def __init__(self, acad_year, costc, accounts, amounts, unmapped=0.0, untyped=0.0):
+        self.acad_year = acad_year
+        self.costc = list(costc)
+        self.accounts = accounts
+        self.amounts = amounts
+        self.unmapped = unmapped
+        self.untyped = untyped
+
+    def __len__(self):
+        return int(np.count_nonzero(self.amounts))
+
+    def total(self):
+        """
+        Returns the total amount journalled.
+        """
+        return float(self.amounts.sum())
+
+    def by_period(self):
+        """
+        Returns the total amount in each period, as a dictionary.
+        """
+        totals = self.amounts.sum(axis=(0, 1))
+        return {int(p): float(totals[p]) for p in np.flatnonzero(totals)}
+
+    def rows(self, description='', decimals=2):
+        """
+        Yields a tuple per non-zero line, with the fields of COLUMNS, ordered by
+        period, cost centre and account.
+
+        Amounts are rounded to ``decimals`` places.
+        """
+        for p in range(self.amounts.shape[2]):
+            for i, j in zip(*np.nonzero(self.amounts[:, :, p])):
+                yield (self.acad_year, p, self.costc[i], int(self.accounts[j]),
+                       round(float(self.amounts[i, j, p]), decimals), description)
+
+
+def week_periods(con, curriculum_id, encoding, weeks):
+    """
+    Returns the financial period of each academic week of a curriculum's calendars.
+
+    Parameters
+    ----------
+    con : Session or Connection
+        Connection to the database.
+    curriculum_id : int
+        ID of the curriculum.
+    encoding : Encoding
+        Encoding of the curriculum's frame.
+    weeks : RefTable
+        The week table, e.g. ``reference_cache.table(con, 'week')``.
+
+    Returns
+    -------
+    numpy.ndarray
+        Periods, indexed by [calendar_type code, acad_week]; NULL where unmapped.
+    """
+    rows = con.execute(select(CalendarMap.calendar_type, CalendarMap.acad_week, CalendarMap.celcat_week)
+                       .where(CalendarMap.curriculum_id == curriculum_id)).all()
+    calendars = encoding.encode('calendar_type', [r[0] for r in rows])
+    n_weeks = max([r[1] for r in rows], default=0) + 1
+    periods = np.full((len(encoding['calendar_type']), n_weeks), NULL, dtype=np.int64)
+    for code, (_, acad_week, celcat_week) in zip(calendars, rows):
+        week = weeks.get(celcat_week)
+        if week is not None:
+            periods[code, acad_week] = week.period
+    return periods
+
+
+def journal(frame, counts, rates, allocation, periods, cost_types, acad_year, chunk_size=100000):
+    """
+    Builds the non-pay journal of a curriculum.
+
+    Parameters
+    ----------
+    frame : CurriculumFrame
+        The curriculum.
+    counts : GroupCounts
+        Groups per cost, from :py:func:`~curriculum_model.calc.groups.group_counts`.
+    rates : Rates
+        From :py:func:`~curriculum_model.calc.costing.rates`.
+    allocation : Allocation
+        From :py:func:`~curriculum_model.calc.costing.allocate`.
+    periods : numpy.ndarray
+        From :py:func:`week_periods`.
+    cost_types : RefTable
+        The cost_type table.
+    acad_year : int
+        Academic year, for the journal lines.
+    chunk_size : int, optional
+        Number of cost weeks processed at a time.
+
+    Returns
+    -------
+    Journal
+    """
+    cost, cost_week, comp = frame.cost, frame.cost_week, frame.component
+    # Nominal account of each cost
+    book = frame.encoding['cost_type']
+    type_account = np.array([getattr(cost_types.get(v), 'nominal_account', NULL) for v in book.values]
+                            + [NULL], dtype=np.int64)
+    accounts, cost_account = np.unique(type_account[cost.cost_type], return_inverse=True)
+    # Non-pay per week of each cost
+    per_week = np.divide(counts.groups * rates.nonpay, rates.weeks, out=np.zeros(len(cost)),
+                         where=rates.weeks > 0)
+    # Allocation entries grouped by cost
+    order = np.argsort(allocation.cost_idx, kind='stable')
+    offsets = np.zeros(len(cost) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(allocation.cost_idx, minlength=len(cost)), out=offsets[1:])
+    n_costc, n_accounts, n_periods = allocation.n_costc, len(accounts), max(int(periods.max(initial=0)) + 1, 1)
+    amounts = np.zeros(n_costc * n_accounts * n_periods)
+    unmapped = 0.0
+    for start in range(0, len(cost_week), chunk_size):
+        cost_idx = cost_week.cost_idx[start:start+chunk_size]
+        acad_week = cost_week.acad_week[start:start+chunk_size]
+        calendar = comp.calendar_type[cost.component_idx[cost_idx]]
+        known = (calendar != NULL) & (acad_week >= 0) & (acad_week < periods.shape[1])
+        period = np.full(len(cost_idx), NULL, dtype=np.int64)
+        period[known] = periods[calendar[known], acad_week[known]]
+        unmapped += float(per_week[cost_idx[period == NULL]].sum())
+        keep = (period != NULL) & (per_week[cost_idx] != 0)
+        cost_idx, period = cost_idx[keep], period[keep]
+        # One line per (cost week, cost centre the cost is split to)
+        rows, within = _expand(offsets[cost_idx + 1] - offsets[cost_idx])
+        entries = order[offsets[cost_idx[rows]] + within]
+        line_cost = cost_idx[rows]
+        flat = (allocation.costc[entries].astype(np.int64) * n_accounts + cost_account[line_cost]) \
+            * n_periods + period[rows]
+        amounts += np.bincount(flat, weights=per_week[line_cost] * allocation.fraction[entries],
+                               minlength=len(amounts))
+    amounts = amounts.reshape(n_costc, n_accounts, n_periods)
+    # Set aside the account of costs without a type, and drop cost centres with nothing posted
+    valid = accounts != NULL
+    untyped = float(amounts[:, ~valid].sum())
+    amounts = amounts[:, valid]
+    used = np.flatnonzero(amounts.any(axis=(1, 2)))
+    costc_book = frame.encoding['costc']
+    return Journal(acad_year, [costc_book.value(c) for c in used], accounts[valid],
+                   amounts[used], unmapped, untyped)
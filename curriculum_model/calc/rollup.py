@@ -0,0 +1,189 @@
+"""
+In-memory hierarchy of cost centres and areas of study, for fast rollups.
+
+Reports roll results up from cost centre to department, or from cost centre to
+its primary area of study, and from area of study to department. Rather than
+joining ``costc``, ``aos_code`` and ``department`` on every query,
+:py:class:`RollupIndex` holds each mapping as an int array from one key's codes
+to the parent's codes. Any array of values by cost centre code can then be
+rolled up with a single ``np.bincount``.
+
+:py:class:`RollupCache` keeps one index per process, and rebuilds it when the
+reference data version stamp (see :py:func:`curriculum_model.db.refdata.bump_version`)
+changes.
+"""
+import threading
+import time
+import numpy as np
+from sqlalchemy import select
+from curriculum_model.calc.encoding import NULL, Encoding
+from curriculum_model.db.refdata import reference_cache
+from curriculum_model.db.schema import aos_code, Costc
+
+# Rollup name: (child codebook, parent codebook)
+ROLLUPS = {'costc_department': ('costc', 'department'),
+           'costc_aos': ('costc', 'aos_code'),
+           'aos_department': ('aos_code', 'department')}
+
+
+class RollupIndex():
+    """
+    Parent codes of each cost centre and area of study code.
+
+    Parameters
+    ----------
+    encoding : Encoding
+        Codebooks the codes refer to.
+    parents : dict
+        Rollup name (from ROLLUPS) to an int32 array of parent codes, indexed by
+        child code; NULL where there is no parent.
+    version : str, optional
+        Reference data version the index was built from.
+    """
+
+    def __init__(self, encoding, parents, version=None):
+        self.encoding = encoding
+        self.parents = parents
+        self.version = version
+
+    def rollup(self, values, name='costc_department'):
+        """
+        Sums values up to their parents.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            Values by child code, along the last axis; e.g. an array of hours by
+            cost centre, or (years × cost centres).
+        name : str, optional
+            One of ROLLUPS.
+
+        Returns
+        -------
+        numpy.ndarray
+            Values by parent code, with the same leading axes. Children without a
+            parent are left out.
+        """
+        parents = self.parents[name]
+        values = np.asarray(values, dtype=np.float64)
+        n_children = values.shape[-1]
+        # Codes added to the codebook since the index was built have no parent
+        parent_codes = np.full(n_children, NULL, dtype=np.int32)
+        parent_codes[:min(n_children, len(parents))] = parents[:n_children]
+        keep = parent_codes != NULL
+        n_parents = len(self.encoding[ROLLUPS[name][1]])
+        flat = values.reshape(-1, n_children)[:, keep]
+        # Offset each row's parents so that one bincount sums every row
+        offsets = np.arange(flat.shape[0])[:, None] * n_parents
+        sums = np.bincount((parent_codes[keep][None, :] + offsets).ravel(), weights=flat.ravel(),
+                           minlength=flat.shape[0] * n_parents)
+        return sums.reshape(values.shape[:-1] + (n_parents,))
+
+    def children(self, parent, name='costc_department'):
+        """
+        Returns the child keys of a parent key, for drill-down.
+        """
+        child_book, parent_book = (self.encoding[b] for b in ROLLUPS[name])
+        if parent not in parent_book:
+            return []
+        codes = np.flatnonzero(self.parents[name] == parent_book.code(parent))
+        return [child_book.values[c] for c in codes]
+
+    def by_key(self, keys, values, book='costc'):
+        """
+        Returns an array of values by code, from parallel sequences of keys and values.
+
+        Useful to roll up results keyed by string, e.g. the keys of a comparison cube.
+        """
+        codebook = self.encoding[book]
+        codes = codebook.encode(list(keys))
+        values = np.asarray(values, dtype=np.float64)
+        keep = codes != NULL
+        out = np.zeros(values.shape[:-1] + (len(codebook),))
+        np.add.at(out, (..., codes[keep]), values[..., keep])
+        return out
+
+
+def load_rollup(con, encoding=None):
+    """
+    Builds a :py:class:`RollupIndex` from the costc and aos_code tables.
+
+    Parameters
+    ----------
+    con : Session or Connection
+        Connection to the database.
+    encoding : Encoding, optional
+        Codebooks to use; loaded from the database if omitted.
+
+    Returns
+    -------
+    RollupIndex
+    """
+    version = reference_cache.version(con)
+    if encoding is None:
+        encoding = Encoding.load(con)
+    costc = con.execute(select(Costc.costc, Costc.department_id, Costc.primary_aos_code)).all()
+    aos = con.execute(select(aos_code.aos_code, aos_code.department_id)).all()
+    parents = {'costc_department': _parent_codes(encoding, 'costc', 'department',
+                                                 [(r[0], r[1]) for r in costc]),
+               'costc_aos': _parent_codes(encoding, 'costc', 'aos_code',
+                                          [(r[0], r[2]) for r in costc]),
+               'aos_department': _parent_codes(encoding, 'aos_code', 'department', aos)}
+    return RollupIndex(encoding, parents, version)
+
+
+def _parent_codes(encoding, child_book, parent_book, pairs):
+    child_book, parent_book = encoding[child_book], encoding[parent_book]
+    # Fixed-width CHAR/NCHAR keys of different lengths are compared without padding
+    parent_codes = {v.rstrip(): i for i, v in enumerate(parent_book.values)}
+    child_codes = child_book.encode([c for c, _ in pairs])
+    parents = np.full(len(child_book), NULL, dtype=np.int32)
+    for code, (_, parent) in zip(child_codes, pairs):
+        if parent is not None:
+            parents[code] = parent_codes.get(parent.rstrip(), NULL)
+    return parents
+
+
+class RollupCache():
+    """
+    Holds a :py:class:`RollupIndex`, rebuilding it when reference data changes.
+
+    Parameters
+    ----------
+    ttl : float, optional
+        Seconds between checks of the reference data version stamp. None means the
+        index is held until invalidated; 0 checks on every call.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._index = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def get(self, con):
+        """
+        Returns the current index, (re)building it if necessary.
+        """
+        with self._lock:
+            if self._index is not None:
+                if self.ttl is None or time.monotonic() - self._checked_at < self.ttl:
+                    return self._index
+                version = reference_cache.version(con)
+                if version is not None and version == self._index.version:
+                    self._checked_at = time.monotonic()
+                    return self._index
+            self._index = load_rollup(con)
+            self._checked_at = time.monotonic()
+            return self._index
+
+    def invalidate(self):
+        """
+        Drops the index, so that it's rebuilt on next use.
+        """
+        with self._lock:
+            self._index = None
+
+
+# Shared index for the process
+rollup_cache = RollupCache()
@@ -0,0 +1,282 @@
+"""
+Monte Carlo sensitivity of curriculum cost to uncertain student numbers.
+
+Groups are ``ceil(students / max_group_size)``, so hours and non-pay are step
+functions of student numbers, and a point estimate can sit just below a cliff.
+:py:func:`simulate` draws many sets of student numbers per area of study and
+session, and costs the curriculum for all of them at once.
+
+Everything between student numbers and students per cost is linear (sums over
+config links and ratio splits), so it is composed once into a sparse map from
+(area of study, session) cells to components. Each chunk of samples is then
+pushed through the map, rounded up to groups per cost, and multiplied by each
+cost's hours and non-pay per group (:py:func:`~curriculum_model.calc.costing.rates`).
+Memory is bounded by ``chunk_size`` × the number of costs.
+
+Costs are split across cost centres with the :py:class:`~curriculum_model.calc.costing.Allocation`
+of the point estimate, i.e. each cost centre's share of a cost doesn't vary
+between samples.
+"""
+import numpy as np
+from curriculum_model.calc.groups import _EPSILON
+
+# Kinds of distribution, and what spread means for each
+DISTRIBUTIONS = {'fixed': "no uncertainty",
+                 'normal': "standard deviation, as a fraction of the estimate",
+                 'uniform': "half-width, as a fraction of the estimate",
+                 'poisson': "ignored; the variance is the estimate"}
+
+
+class Uncertainty():
+    """
+    Distribution of student numbers around their estimate.
+
+    Parameters
+    ----------
+    kind : str, optional
+        One of DISTRIBUTIONS.
+    spread : float, optional
+        Width of the distribution; see DISTRIBUTIONS.
+    """
+
+    def __init__(self, kind='normal', spread=0.1):
+        if kind not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown distribution {kind}; use one of {', '.join(DISTRIBUTIONS)}.")
+        self.kind = kind
+        self.spread = spread
+
+    def draw(self, rng, estimate, n):
+        """
+        Returns n samples of each estimate, as an array of shape (n, len(estimate)).
+
+        Samples are never negative.
+        """
+        estimate = np.asarray(estimate, dtype=np.float64)
+        if self.kind == 'fixed':
+            return np.broadcast_to(estimate, (n, len(estimate))).copy()
+        if self.kind == 'normal':
+            samples = rng.normal(estimate, self.spread * estimate, (n, len(estimate)))
+        elif self.kind == 'uniform':
+            samples = rng.uniform(estimate * (1 - self.spread), estimate * (1 + self.spread),
+                                  (n, len(estimate)))
+        else:
+            samples = rng.poisson(estimate, (n, len(estimate))).astype(np.float64)
+        return np.maximum(samples, 0)
+
+
+class Sensitivity():
+    """
+    Sampled hours and non-pay by cost centre.
+
+    Parameters
+    ----------
+    costc : list
+        Cost centres; the columns of each measure.
+    measures : dict
+        Measure name ('hours', 'nonpay') to an array of (samples × cost centres).
+    point : dict
+        Measure name to the point estimate by cost centre.
+    """
+
+    def __init__(self, costc, measures, point):
+        self.costc = list(costc)
+        self.measures = measures
+        self.point = point
+
+    def __len__(self):
+        return next(iter(self.measures.values())).shape[0]
+
+    def totals(self, measure='hours'):
+        """
+        Returns the curriculum total of a measure in each sample.
+        """
+        return self.measures[measure].sum(axis=1)
+
+    def percentiles(self, measure='hours', q=(5, 50, 95)):
+        """
+        Returns percentiles of a measure, with shape (len(q), cost centres).
+        """
+        return np.percentile(self.measures[measure], q, axis=0)
+
+    def to_rows(self, q=(5, 50, 95)):
+        """
+        Yields a dictionary per cost centre of the point estimate, mean and percentiles
+        of each measure; useful for export.
+        """
+        stats = {}
+        for name, values in self.measures.items():
+            stats[name] = (self.point[name], values.mean(axis=0), self.percentiles(name, q))
+        for j, costc in enumerate(self.costc):
+            row = {'costc': costc}
+            for name, (point, mean, pct) in stats.items():
+                row[f"{name}_point"] = float(point[j])
+                row[f"{name}_mean"] = float(mean[j])
+                for k, p in enumerate(q):
+                    row[f"{name}_p{p:g}"] = float(pct[k, j])
+            yield row
+
+
+def cell_map(frame, shape):
+    """
+    Composes the linear map from student numbers to students per component.
+
+    Parameters
+    ----------
+    frame : CurriculumFrame
+        The curriculum.
+    shape : tuple
+        Shape of the student number array, (area of study codes, sessions).
+
+    Returns
+    -------
+    tuple
+        (cell, component_idx, weight) arrays: component ``component_idx`` gets
+        ``weight`` times the students of cell ``cell``, where
+        cell = aos_code code × n_sessions + session.
+    """
+    course, cs, n_comp = frame.course, frame.course_session, len(frame.component)
+    cc, csc, cgc = frame.course_config, frame.course_session_config, frame.cgroup_config
+    n_aos, n_sessions = shape
+    aos = course.aos_code[cc.course_idx].astype(np.int64)
+    session = cs.session[cc.course_session_idx]
+    known = (aos >= 0) & (aos < n_aos) & (session >= 0) & (session < n_sessions)
+    # Cells to course sessions
+    cells = (aos * n_sessions + session)[known]
+    level = (cells, cc.course_session_idx[known], np.ones(known.sum()))
+    # Course sessions to groups, then groups to components (split by ratio)
+    level = _join(level, csc.course_session_idx, csc.cgroup_idx, np.ones(len(csc)), len(cs))
+    ratio_total = np.bincount(cgc.cgroup_idx, weights=cgc.ratio, minlength=len(frame.cgroup))
+    share = np.divide(cgc.ratio, ratio_total[cgc.cgroup_idx], out=np.zeros(len(cgc)),
+                      where=ratio_total[cgc.cgroup_idx] > 0)
+    level = _join(level, cgc.cgroup_idx, cgc.component_idx, share, len(frame.cgroup))
+    # Merge repeated (cell, component) pairs
+    pairs, inverse = np.unique(level[0] * n_comp + level[1], return_inverse=True)
+    weight = np.bincount(inverse, weights=level[2], minlength=len(pairs))
+    return pairs // max(n_comp, 1), pairs % max(n_comp, 1), weight
+
+
+def simulate(frame, students, rates, allocation, n_samples=10000, uncertainty=None, overrides=None,
+             whole_students=True, chunk_size=500, seed=None):
+    """
+    Costs a curriculum for many samples of student numbers.
+
+    Parameters
+    ----------
+    frame : CurriculumFrame
+        The curriculum.
+    students : numpy.ndarray
+        Estimated students by area of study code and session, from
+        :py:func:`~curriculum_model.calc.groups.student_numbers`.
+    rates : Rates
+        Hours and non-pay per group, from :py:func:`~curriculum_model.calc.costing.rates`.
+    allocation : Allocation
+        Split of costs across cost centres, from :py:func:`~curriculum_model.calc.costing.allocate`.
+    n_samples : int, optional
+        Number of samples.
+    uncertainty : Uncertainty, optional
+        Distribution of every area of study's student numbers; 10% normal by default.
+    overrides : dict, optional
+        Distributions for particular cells, keyed by aos_code, or (aos_code, session).
+    whole_students : bool, optional
+        Round sampled student numbers to whole students.
+    chunk_size : int, optional
+        Number of samples costed at a time.
+    seed : int, optional
+        Seed for the random number generator.
+
+    Returns
+    -------
+    Sensitivity
+    """
+    uncertainty = Uncertainty() if uncertainty is None else uncertainty
+    rng = np.random.default_rng(seed)
+    n_sessions = students.shape[1]
+    cell, component_idx, weight = cell_map(frame, students.shape)
+    # Only cells feeding a cost need sampling
+    used, cell_pos = np.unique(cell, return_inverse=True)
+    estimate = students.ravel()[used]
+    groups = _cell_distributions(frame.encoding['aos_code'], used, n_sessions, uncertainty, overrides or {})
+    to_component = _SegmentSum(cell_pos, component_idx, weight, len(frame.component))
+    cost_component = frame.cost.component_idx
+    # Hours (first n_costc columns) and non-pay (the rest) of one group of each cost, by cost centre
+    n_costc = allocation.n_costc
+    alloc_pay = rates.is_pay[allocation.cost_idx]
+    per_group = np.where(rates.is_pay, rates.hours, rates.nonpay)
+    to_costc = _SegmentSum(allocation.cost_idx, allocation.costc + np.where(alloc_pay, 0, n_costc),
+                           per_group[allocation.cost_idx] * allocation.fraction, 2 * n_costc)
+    max_group = np.maximum(frame.cost.max_group_size, 1)
+    chunks = []
+    for start in range(0, n_samples, chunk_size):
+        n = min(chunk_size, n_samples - start)
+        sample = np.empty((n, len(used)))
+        for dist, cols in groups:
+            sample[:, cols] = dist.draw(rng, estimate[cols], n)
+        if whole_students:
+            sample = np.round(sample)
+        cost_students = to_component(sample)[:, cost_component]
+        n_groups = np.maximum(np.ceil(cost_students / max_group - _EPSILON), 0)
+        chunks.append(to_costc(n_groups))
+    sampled = np.concatenate(chunks) if chunks else np.empty((0, 2 * n_costc))
+    measures = {'hours': sampled[:, :n_costc], 'nonpay': sampled[:, n_costc:]}
+    # Point estimate, through the same maps
+    point_students = to_component(estimate[None, :])[:, cost_component]
+    point_groups = np.maximum(np.ceil(point_students / max_group - _EPSILON), 0)
+    point = to_costc(point_groups)[0]
+    point = {'hours': point[:n_costc], 'nonpay': point[n_costc:]}
+    # Keep cost centres with any cost
+    keep = np.flatnonzero(sum(np.abs(v).sum(axis=0) for v in measures.values())
+                          + sum(np.abs(v) for v in point.values()))
+    book = frame.encoding['costc']
+    return Sensitivity([book.value(c) for c in keep],
+                       {m: v[:, keep] for m, v in measures.items()},
+                       {m: v[keep] for m, v in point.items()})
+
+
+def _cell_distributions(aos_book, cells, n_sessions, default, overrides):
+    """Groups cell columns by the distribution they're drawn from."""
+    chosen = []
+    for cell in cells:
+        aos, session = aos_book.value(int(cell // n_sessions)), int(cell % n_sessions)
+        chosen.append(overrides.get((aos, session), overrides.get(aos, default)))
+    groups = {}
+    for col, dist in enumerate(chosen):
+        groups.setdefault(id(dist), (dist, []))[1].append(col)
+    return [(dist, np.array(cols, dtype=np.int64)) for dist, cols in groups.values()]
+
+
+def _join(level, keys, targets, weights, n_keys):
+    """
+    Follows sparse (source, key, weight) triplets through links from key to target.
+
+    Returns (source, target, weight × link weight) triplets.
+    """
+    sources, level_keys, level_weights = level
+    order = np.argsort(keys, kind='stable')
+    offsets = np.zeros(n_keys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n_keys), out=offsets[1:])
+    counts = offsets[level_keys + 1] - offsets[level_keys]
+    rows = np.repeat(np.arange(len(level_keys)), counts)
+    within = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    links = order[offsets[level_keys[rows]] + within]
+    return sources[rows], targets[links], level_weights[rows] * weights[links]
+
+
+class _SegmentSum():
+    """
+    Sparse linear map between the columns of 2D arrays: ``out[:, dst] += x[:, src] * weight``.
+
+    Terms are sorted by destination once, so each call is a gather and one ``np.add.reduceat``.
+    """
+
+    def __init__(self, src, dst, weight, n_dst):
+        order = np.argsort(dst, kind='stable')
+        self.src = src[order]
+        self.weight = weight[order]
+        self.targets, self.starts = np.unique(dst[order], return_index=True)
+        self.n_dst = n_dst
+
+    def __call__(self, x):
+        out = np.zeros((x.shape[0], self.n_dst))
+        if len(self.src):
+            out[:, self.targets] = np.add.reduceat(x[:, self.src] * self.weight, self.starts, axis=1)
+        return out
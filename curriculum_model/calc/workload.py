@@ -0,0 +1,164 @@
+"""
+Teaching load per member of staff, per Celcat week.
+
+:py:func:`load_workload` reads two result sets for a curriculum: the staff
+assigned to each pay cost's timetabling groups (``tt_tgroup_staffing``), with the
+cost's weekly hours, and the Celcat weeks each cost runs in (``cost_week``
+through ``calendar_map``). The two are joined on cost in numpy, and hours are
+accumulated into a staff × week matrix with one ``np.bincount``.
+
+Each member of staff assigned to a group is counted as delivering the whole of
+``mins_per_group`` (scaled by the cost type's ``cost_multiplier``) in every week
+the cost runs.
+"""
+import numpy as np
+from sqlalchemy import and_, select
+from curriculum_model.calc.encoding import Codebook
+from curriculum_model.db.export import stream_chunks
+from curriculum_model.db.schema import (CalendarMap, Component, Cost, CostType, CostWeek, TGroup,
+                                        TGroupStaffing)
+
+
+class Workload():
+    """
+    Hours per member of staff per week.
+
+    Parameters
+    ----------
+    staff : list
+        Staff IDs; the rows of ``hours``.
+    weeks : numpy.ndarray
+        Celcat weeks, in order; the columns of ``hours``.
+    hours : numpy.ndarray
+        Hours, of shape (len(staff), len(weeks)).
+    """
+
+    def __init__(self, staff, weeks, hours):
+        self.staff = list(staff)
+        self.weeks = weeks
+        self.hours = hours
+
+    def __len__(self):
+        return len(self.staff)
+
+    def totals(self):
+        """
+        Returns total hours per member of staff.
+        """
+        return self.hours.sum(axis=1)
+
+    def staff_hours(self, staff_id):
+        """
+        Returns the weekly hours of one member of staff.
+        """
+        return self.hours[self.staff.index(staff_id)]
+
+    def over(self, weekly_hours=None, total_hours=None):
+        """
+        Returns staff over either threshold, busiest first.
+
+        Parameters
+        ----------
+        weekly_hours : float, optional
+            Flag staff with more hours than this in any week.
+        total_hours : float, optional
+            Flag staff with more hours than this over the year.
+
+        Returns
+        -------
+        list
+            Tuples of (staff_id, total hours, peak weekly hours, number of weeks over weekly_hours).
+        """
+        totals = self.totals()
+        peaks = self.hours.max(axis=1) if len(self.weeks) else np.zeros(len(self.staff))
+        weeks_over = (self.hours > weekly_hours).sum(axis=1) if weekly_hours is not None \
+            else np.zeros(len(self.staff), dtype=np.int64)
+        flagged = np.zeros(len(self.staff), dtype=bool)
+        if weekly_hours is not None:
+            flagged |= weeks_over > 0
+        if total_hours is not None:
+            flagged |= totals > total_hours
+        order = np.flatnonzero(flagged)
+        order = order[np.argsort(-totals[order], kind='stable')]
+        return [(self.staff[i], float(totals[i]), float(peaks[i]), int(weeks_over[i]))
+                for i in order]
+
+    def to_rows(self):
+        """
+        Yields (staff_id, celcat_week, hours) for each non-zero cell.
+        """
+        for i, j in zip(*np.nonzero(self.hours)):
+            yield self.staff[i], int(self.weeks[j]), float(self.hours[i, j])
+
+
+def load_workload(con, curriculum_id, chunk_size=20000):
+    """
+    Builds the staff × week workload of a curriculum.
+
+    Parameters
+    ----------
+    con : Session or Connection
+        Connection to the database.
+    curriculum_id : int
+        ID of the curriculum.
+    chunk_size : int, optional
+        Number of rows fetched at a time.
+
+    Returns
+    -------
+    Workload
+    """
+    # Celcat weeks of each cost, sorted by cost
+    weeks_stmt = select(CostWeek.cost_id, CalendarMap.celcat_week) \
+        .join(Cost, Cost.cost_id == CostWeek.cost_id) \
+        .join(Component, Component.component_id == Cost.component_id) \
+        .join(CalendarMap, and_(CalendarMap.curriculum_id == Component.curriculum_id,
+                                CalendarMap.calendar_type == Component.calendar_type,
+                                CalendarMap.acad_week == CostWeek.acad_week)) \
+        .where(Component.curriculum_id == curriculum_id) \
+        .order_by(CostWeek.cost_id)
+    week_cost, week_celcat = _fetch_arrays(con, weeks_stmt, chunk_size, 2)
+    weeks, week_codes = np.unique(week_celcat, return_inverse=True)
+    cost_ids, cost_start, cost_count = np.unique(week_cost, return_index=True, return_counts=True)
+    # Staff assigned to each pay cost, and its hours per group per week
+    staff = Codebook('staff_id')
+    staff_codes, staff_cost, staff_hours = [], [], []
+    staffing_stmt = select(TGroupStaffing.staff_id, TGroup.cost_id, Cost.mins_per_group,
+                           CostType.cost_multiplier) \
+        .join(TGroup, TGroup.tgroup_id == TGroupStaffing.tgroup_id) \
+        .join(Cost, Cost.cost_id == TGroup.cost_id) \
+        .join(CostType, CostType.cost_type == Cost.cost_type) \
+        .join(Component, Component.component_id == Cost.component_id) \
+        .where(Component.curriculum_id == curriculum_id, CostType.is_pay)
+    for chunk in stream_chunks(con, staffing_stmt, chunk_size):
+        staff_codes.append(staff.encode([r[0] for r in chunk]))
+        staff_cost.append(np.array([r[1] for r in chunk], dtype=np.int64))
+        staff_hours.append(np.array([r[2] * (1 if r[3] is None else r[3]) / 60 for r in chunk],
+                                    dtype=np.float64))
+    staff_codes = _concat(staff_codes, np.int32)
+    staff_cost = _concat(staff_cost, np.int64)
+    staff_hours = _concat(staff_hours, np.float64)
+    # Join staffing to weeks on cost: each staffing row repeats once per week of its cost
+    pos = np.searchsorted(cost_ids, staff_cost)
+    pos = np.minimum(pos, max(len(cost_ids) - 1, 0))
+    found = (cost_ids[pos] == staff_cost) if len(cost_ids) else np.zeros(len(staff_cost), bool)
+    counts = np.where(found, cost_count[pos] if len(cost_ids) else 0, 0)
+    rows = np.repeat(np.arange(len(staff_codes)), counts)
+    # Position of each repeated row within its cost's weeks
+    within = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    cols = week_codes[cost_start[pos[rows]] + within] if len(rows) else np.empty(0, np.int64)
+    flat = staff_codes[rows].astype(np.int64) * len(weeks) + cols
+    hours = np.bincount(flat, weights=staff_hours[rows], minlength=len(staff) * len(weeks))
+    return Workload(staff.values, weeks, hours.reshape(len(staff), len(weeks)))
+
+
+def _fetch_arrays(con, stmt, chunk_size, n_columns):
+    parts = [[] for _ in range(n_columns)]
+    for chunk in stream_chunks(con, stmt, chunk_size):
+        for i in range(n_columns):
+            parts[i].append(np.array([r[i] for r in chunk], dtype=np.int64))
+    return [_concat(p, np.int64) for p in parts]
+
+
+def _concat(parts, dtype):
+    return np.concatenate(parts) if parts else np.empty(0, dtype=dtype)
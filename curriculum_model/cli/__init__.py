@@ -1,16 +1,22 @@
 import click
 import sys
 import os
+from contextlib import nullcontext
 from importlib import import_module as imp
 from curriculum_model._version import __version__ as v
+from curriculum_model.db import DB
+from curriculum_model.db.profile import Profiler
 
 
 class Config(object):
 
-    def __init__(self, verbose=False, echo=False, environment='PRODUCTION'):
+    def __init__(self, verbose=False, echo=False, environment='PRODUCTION', profile=False):
         self.verbose = verbose
         self.echo = echo
         self.environment = environment.upper()
+        self.profiler = Profiler() if profile else None
+        # Open DB shared by every command, when running a batch
+        self.shared_db = None
 
     def verbose_print(self, str, bold=False):
         """
@@ -19,6 +25,25 @@ class Config(object):
         if self.verbose:
             click.secho(str, fg='green', bold=bold)
 
+    def phase(self, name):
+        """
+        Labels the statements run inside a with block, if profiling.
+        """
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.phase(name)
+
+    def db(self):
+        """
+        Returns a context manager giving the DB connection for a command.
+
+        Inside ``cm batch`` this is the batch's open connection, which is left open
+        on exit; otherwise a new connection to the configured environment.
+        """
+        if self.shared_db is not None:
+            return nullcontext(self.shared_db)
+        return DB(self.echo, self.environment, profiler=self.profiler)
+
 
 def add_subcommands(parent, file, package):
     """
@@ -48,14 +73,26 @@ def add_subcommands(parent, file, package):
 @click.option("--verbose", "-v", is_flag=True, help="Print more information to the console.")
 @click.option("--echo", "-e", is_flag=True, help="Print SQL run against database.")
 @click.option("--dbenv", "-d", type=str, help="Specify a DB environment (must correspond to section in config).", default="PRODUCTION")
+@click.option("--profile", "-p", is_flag=True, help="Print a summary of time spent in the database.")
+@click.option("--profile-out", type=click.Path(dir_okay=False, writable=True), help="Write a JSON trace of every statement to this file.")
 @click.pass_context
-def cm(config, verbose, dbenv, echo):
+def cm(config, verbose, dbenv, echo, profile, profile_out):
     """
     Entry point for the CLI.
     """
     # Define config object to be passed to subcommands via click.pass_obj
-    config.obj = Config(verbose, echo, dbenv)
+    config.obj = Config(verbose, echo, dbenv, profile or profile_out is not None)
     config.obj.verbose_print(f"Running Curriculum Model {v} CLI", True)
+    if config.obj.profiler is not None:
+        config.call_on_close(lambda: _profile_output(
+            config.obj.profiler, profile, profile_out))
+
+
+def _profile_output(profiler, show, path):
+    if show:
+        click.echo(profiler.report())
+    if path is not None:
+        profiler.write_json(path)
 
 
 add_subcommands(cm, __file__, __package__)
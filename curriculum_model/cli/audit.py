@@ -0,0 +1,30 @@
+import click
+from datetime import datetime, timedelta
+from curriculum_model.db.audit import compact as compact_audit
+
+
+@click.group()
+def audit():
+    """
+    Maintain the audit tables.
+    """
+    pass
+
+
+@audit.command()
+@click.option("--before", "-b", type=click.DateTime(), help="Compact history older than this date.")
+@click.option("--days", type=int, default=365, help="Compact history older than this many days (ignored if --before given).")
+@click.option("--chunk-size", type=int, default=5000, help="Width of the ID range removed in each transaction.")
+@click.pass_obj
+def compact(config, before, days, chunk_size):
+    """
+    Collapse old audit history into one snapshot per object.
+    """
+    if before is None:
+        before = datetime.now() - timedelta(days=days)
+    click.confirm(f"Compact audit history before {before:%Y-%m-%d %H:%M}?",
+                  abort=True)
+    with config.db() as db:
+        removed = compact_audit(db.engine, before, chunk_size,
+                                config.verbose_print)
+    click.echo(f"Removed {sum(removed.values())} audit rows.")
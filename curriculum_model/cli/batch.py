@@ -0,0 +1,85 @@
+import shlex
+import time
+import click
+
+
+@click.command()
+@click.argument("file", type=click.File('r'))
+@click.option("--transaction", "-t", is_flag=True, help="Run every command in one transaction, committed only if they all succeed.")
+@click.option("--keep-going", "-k", is_flag=True, help="Carry on after a command fails (not with --transaction).")
+@click.pass_obj
+def batch(config, file, transaction, keep_going):
+    """
+    Run the cm commands listed in a file, one per line, over one connection.
+
+    Each line is a command as it would follow ``cm`` on the command line, e.g.
+    ``copy course 12 40 41 -y``. Blank lines and lines starting with # are skipped.
+    The connection, and the reference data and rollup caches, are shared by every
+    command. Commands which work on the engine directly (replicate, db, audit)
+    run outside any --transaction.
+    """
+    if transaction and keep_going:
+        raise click.UsageError("--keep-going can't be used with --transaction.")
+    try:
+        lines = _parse(file)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    ctx = click.get_current_context()
+    group = ctx.parent.command
+    commands = []
+    for line_no, args in lines:
+        cmd = group.get_command(ctx.parent, args[0])
+        if cmd is None:
+            raise click.UsageError(f"Line {line_no}: no such command '{args[0]}'.")
+        commands.append((line_no, cmd, args))
+    failed = 0
+    with config.db() as db:
+        config.shared_db = db
+        trans = db.begin() if transaction else None
+        try:
+            for line_no, cmd, args in commands:
+                start = time.perf_counter()
+                config.verbose_print(f"[{line_no}] {' '.join(args)}", True)
+                try:
+                    with config.phase(f"batch line {line_no}"):
+                        with cmd.make_context(args[0], args[1:], parent=ctx.parent, obj=config) as sub_ctx:
+                            cmd.invoke(sub_ctx)
+                except Exception as e:
+                    if transaction or not keep_going:
+                        raise
+                    failed += 1
+                    click.secho(f"Line {line_no} failed: {_message(e)}", fg='red', err=True)
+                config.verbose_print(f"[{line_no}] done in {time.perf_counter() - start:.3f}s")
+        except Exception:
+            if trans is not None:
+                trans.rollback()
+                click.secho("Rolled back every command in the batch.", fg='red', err=True)
+            raise
+        else:
+            if trans is not None:
+                trans.commit()
+        finally:
+            config.shared_db = None
+    if failed:
+        raise click.ClickException(f"{failed} of {len(commands)} commands failed.")
+
+
+def _parse(file):
+    """
+    Returns the line number and arguments of each command in a batch file.
+    """
+    lines = []
+    for line_no, line in enumerate(file, start=1):
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        args = shlex.split(line, comments=True)
+        if args[0] == 'batch':
+            raise ValueError(f"Line {line_no}: batches can't be nested.")
+        lines.append((line_no, args))
+    return lines
+
+
+def _message(e):
+    if isinstance(e, click.ClickException):
+        return e.format_message()
+    return str(e) or type(e).__name__
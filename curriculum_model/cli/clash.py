@@ -0,0 +1,32 @@
+import csv
+import click
+from curriculum_model.calc.clash import load_clash_index
+
+
+@click.command()
+@click.argument("curriculum_id", type=int)
+@click.option("--output", "-o", type=click.Path(dir_okay=False, writable=True), help="Write every student's clashes to this CSV file.")
+@click.pass_obj
+def clash(config, curriculum_id, output):
+    """
+    Find students in timetabling groups that run in the same weeks.
+    """
+    with config.db() as db:
+        with config.phase("clash"):
+            index = load_clash_index(db.con, curriculum_id)
+    config.verbose_print(f"Checking {len(index.student_groups)} students in "
+                         f"{len(index.tgroup_weeks)} groups.")
+    if output is not None:
+        n = 0
+        with open(output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['student_id', 'tgroup_a', 'tgroup_b', 'weeks'])
+            for c in index.all_clashes():
+                writer.writerow([c.student_id, c.tgroup_a, c.tgroup_b,
+                                 ' '.join(str(w) for w in c.weeks)])
+                n += 1
+        click.echo(f"Wrote {n} clashes to {output}.")
+    else:
+        pairs = index.group_clashes()
+        for (a, b), n in sorted(pairs.items(), key=lambda p: -p[1]):
+            click.echo(f"Groups {a} and {b}: {n} students")
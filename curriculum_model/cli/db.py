@@ -0,0 +1,80 @@
+import time
+import click
+from sqlalchemy import func, select
+from curriculum_model.calc.clash import load_clash_index
+from curriculum_model.calc.frame import load_curriculum
+from curriculum_model.calc.workload import load_workload
+from curriculum_model.db import indexes as ix
+from curriculum_model.db.schema import Base, Course, Curriculum
+from curriculum_model.db.subtree import read_subtree
+
+
+@click.group()
+def db():
+    """
+    Maintain the database itself.
+    """
+    pass
+
+
+@db.command()
+@click.option("--create", "-c", is_flag=True, help="Create the proposed indexes.")
+@click.option("--yes", "-y", is_flag=True, help="Don't ask for confirmation before creating indexes.")
+@click.option("--time/--no-time", "timed", default=True, help="Time traversal workloads before and after creating indexes.")
+@click.option("--curriculum-id", type=int, help="Curriculum used for timings (default: the latest).")
+@click.option("--repeat", type=int, default=3, help="Number of times each workload is timed; the best is reported.")
+@click.pass_obj
+def indexes(config, create, yes, timed, curriculum_id, repeat):
+    """
+    Find (and optionally create) indexes missing on foreign key and filter columns.
+    """
+    if create and config.shared_db is not None and not yes:
+        raise click.UsageError("Give --yes to create indexes inside cm batch.")
+    with config.db() as database:
+        proposals = ix.advise(database.engine, Base.metadata)
+        if not proposals:
+            click.echo("No missing indexes.")
+            return
+        for p in proposals:
+            click.echo(f"{p.table}: {p.name} ({', '.join(p.columns)}) - {p.reason}")
+        if not create:
+            return
+        if not yes:
+            click.confirm(f"Create {len(proposals)} indexes?", abort=True)
+        if timed and curriculum_id is None:
+            with database.engine.connect() as con:
+                curriculum_id = con.execute(
+                    select(func.max(Curriculum.curriculum_id))).scalar()
+        before = _time_workloads(database.engine, curriculum_id, repeat) \
+            if timed and curriculum_id is not None else None
+        with config.phase("create indexes"):
+            ix.create(database.engine, Base.metadata,
+                      proposals, config.verbose_print)
+        click.echo(f"Created {len(proposals)} indexes.")
+        if before is not None:
+            after = _time_workloads(database.engine, curriculum_id, repeat)
+            click.echo(f"{'Workload':<20}{'Before (s)':>12}{'After (s)':>12}")
+            for name, seconds in before.items():
+                click.echo(f"{name:<20}{seconds:>12.3f}{after[name]:>12.3f}")
+
+
+def _time_workloads(engine, curriculum_id, repeat):
+    def copy_read(con):
+        course_ids = con.execute(select(Course.course_id)
+                                 .where(Course.curriculum_id == curriculum_id)).scalars().all()
+        read_subtree(con, 'course', course_ids)
+    workloads = {'copy (read)': copy_read,
+                 'frame': lambda con: load_curriculum(con, curriculum_id),
+                 'workload': lambda con: load_workload(con, curriculum_id),
+                 'clash': lambda con: load_clash_index(con, curriculum_id)}
+    timings = {}
+    with engine.connect() as con:
+        for name, workload in workloads.items():
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                workload(con)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings[name] = best
+    return timings
@@ -0,0 +1,76 @@
+import os
+import click
+from sqlalchemy import select
+from curriculum_model.calc.costing import costing, rates
+from curriculum_model.calc.frame import load_curriculum
+from curriculum_model.calc.groups import group_counts, student_numbers
+from curriculum_model.calc.journal import COLUMNS, journal as build_journal, week_periods
+from curriculum_model.db.export import CsvWriter, FixedWidthWriter
+from curriculum_model.db.refdata import reference_cache
+from curriculum_model.db.schema import Curriculum
+
+WRITERS = {'csv': CsvWriter, 'fixed': FixedWidthWriter}
+
+
+@click.command()
+@click.argument("curriculum_id", type=int)
+@click.argument("output", type=click.Path(dir_okay=False, writable=True, allow_dash=True), default="-")
+@click.option("--format", "-f", "fmt", type=click.Choice(list(WRITERS)), help="Output format (default: csv, or fixed for .txt/.dat files).")
+@click.option("--description", "-m", type=str, help="Description on each line (default: the curriculum's).")
+@click.pass_obj
+def journal(config, curriculum_id, output, fmt, description):
+    """
+    Write a general ledger journal of a curriculum's non-pay, by cost centre, account and period.
+    """
+    if fmt is None:
+        fmt = 'fixed' if os.path.splitext(output)[1].lower() in ('.txt', '.dat') else 'csv'
+    with config.db() as db:
+        curriculum = db.con.execute(select(Curriculum.acad_year, Curriculum.usage_id, Curriculum.description)
+                                    .where(Curriculum.curriculum_id == curriculum_id)).one_or_none()
+        if curriculum is None:
+            raise click.ClickException(f"No curriculum with ID {curriculum_id}.")
+        acad_year, usage_id, curriculum_description = curriculum
+        with config.phase("load"):
+            frame = load_curriculum(db.con, curriculum_id)
+            students = student_numbers(db.con, frame.encoding, acad_year, usage_id)
+            cost_types = reference_cache.table(db.con, 'cost_type')
+            periods = week_periods(db.con, curriculum_id, frame.encoding,
+                                   reference_cache.table(db.con, 'week'))
+    counts = group_counts(frame, students)
+    with config.phase("journal"):
+        result = build_journal(frame, counts, rates(frame, cost_types),
+                               costing(frame, counts, cost_types).allocation,
+                               periods, cost_types, acad_year)
+    try:
+        _write(fmt, output, result.rows(description or curriculum_description or ''))
+    except ValueError as e:
+        raise click.ClickException(f"Can't write the journal: {e}")
+    if result.unmapped:
+        click.echo(f"Warning: {result.unmapped:,.2f} of non-pay falls in weeks with no financial period.",
+                   err=True)
+    if result.untyped:
+        click.echo(f"Warning: {result.untyped:,.2f} of non-pay is on costs with no nominal account.",
+                   err=True)
+    if output != '-':
+        config.verbose_print(f"Wrote {len(result)} lines totalling {result.total():,.2f} to {output}.")
+
+
+def _write(fmt, output, rows):
+    """
+    Writes journal lines to a file, or '-' for stdout.
+
+    A file is written under a temporary name and renamed once complete, so a
+    failed write leaves neither a partial journal nor a damaged earlier one.
+    """
+    if output == '-':
+        with WRITERS[fmt](output, COLUMNS) as writer:
+            writer.write(rows)
+        return
+    partial = f"{output}.{os.getpid()}.partial"
+    try:
+        with WRITERS[fmt](partial, COLUMNS) as writer:
+            writer.write(rows)
+        os.replace(partial, output)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
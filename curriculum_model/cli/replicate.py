@@ -0,0 +1,25 @@
+import click
+import sqlalchemy
+from curriculum_model.db.replicate import Replicator
+from curriculum_model.db.schema import Base
+
+
+@click.command()
+@click.argument("target", type=click.Path(dir_okay=False, writable=True))
+@click.option("--full", is_flag=True, help="Reload every table, rather than only what changed.")
+@click.option("--chunk-size", type=int, default=5000, help="Number of rows read and written at a time.")
+@click.pass_obj
+def replicate(config, target, full, chunk_size):
+    """
+    Copy the database into (or update) a local SQLite file.
+    """
+    target_engine = sqlalchemy.create_engine(f"sqlite:///{target}", echo=config.echo)
+    try:
+        with config.db() as db:
+            with config.phase("replicate"):
+                results = Replicator(db.engine, target_engine, Base.metadata,
+                                     chunk_size, config.verbose_print).sync(full)
+    finally:
+        target_engine.dispose()
+    click.echo(f"Copied {sum(n for _, n in results.values())} rows from "
+               f"{len(results)} tables to {target}.")
@@ -0,0 +1,36 @@
+import os
+import click
+from curriculum_model.db.export import FORMATS, export
+from curriculum_model.db.queries import VIEWS, view_query
+
+
+@click.command()
+@click.argument("view", type=click.Choice(list(VIEWS)))
+@click.argument("output", type=click.Path(dir_okay=False, writable=True, allow_dash=True), default="-")
+@click.option("--format", "-f", "fmt", type=click.Choice(FORMATS), help="Output format (default: from the file extension, or csv).")
+@click.option("--acad-year", "-y", type=int, multiple=True, help="Academic year(s) to include.")
+@click.option("--usage-id", "-u", type=str, multiple=True, help="Student number usage(s) to include.")
+@click.option("--costc", "-c", type=str, multiple=True, help="Cost centre(s) to include.")
+@click.option("--chunk-size", type=int, default=5000, help="Number of rows held in memory at a time.")
+@click.pass_obj
+def report(config, view, output, fmt, acad_year, usage_id, costc, chunk_size):
+    """
+    Export a reporting view to CSV, XLSX or Parquet.
+    """
+    if fmt is None:
+        ext = os.path.splitext(output)[1].lstrip('.').lower()
+        fmt = ext if ext in FORMATS else 'csv'
+    if fmt != 'csv' and output == '-':
+        raise click.BadParameter(f"{fmt} output needs a file name.",
+                                 param_hint="output")
+    stmt = view_query(view, acad_year=acad_year or None,
+                      usage_id=usage_id or None, costc=costc or None)
+    with config.db() as db:
+        with config.phase(f"report {view}"):
+            try:
+                n = export(db.con, stmt, output, fmt, chunk_size)
+            except ImportError as e:
+                raise click.ClickException(
+                    f"{fmt} output needs an optional package: {e}")
+    if output != '-':
+        config.verbose_print(f"Wrote {n} rows to {output}.")
@@ -0,0 +1,77 @@
+import click
+import numpy as np
+from sqlalchemy import column, select
+from curriculum_model.calc.costing import costing, rates
+from curriculum_model.calc.frame import load_curriculum
+from curriculum_model.calc.groups import group_counts, student_numbers
+from curriculum_model.calc.sensitivity import DISTRIBUTIONS, Uncertainty, simulate
+from curriculum_model.db.export import CsvWriter
+from curriculum_model.db.refdata import reference_cache
+from curriculum_model.db.schema import Curriculum
+
+
+@click.command()
+@click.argument("curriculum_id", type=int)
+@click.option("--samples", "-n", type=int, default=10000, help="Number of sets of student numbers to draw.")
+@click.option("--distribution", type=click.Choice(list(DISTRIBUTIONS)), default='normal', help="Distribution of student numbers around the estimate.")
+@click.option("--spread", type=float, default=0.1, help="Width of the distribution, as a fraction of the estimate.")
+@click.option("--override", "overrides", multiple=True, callback=lambda ctx, param, value: _overrides(value),
+              metavar="AOS[:SESSION]=KIND[:SPREAD]",
+              help="Distribution for one area of study, or one session of it; repeatable. SPREAD defaults to --spread.")
+@click.option("--seed", type=int, help="Seed for the random number generator, for repeatable runs.")
+@click.option("--chunk-size", type=int, default=500, help="Number of samples costed at a time.")
+@click.option("--output", "-o", type=click.Path(dir_okay=False, writable=True), help="Write percentiles per cost centre to this CSV file.")
+@click.pass_obj
+def sensitivity(config, curriculum_id, samples, distribution, spread, overrides, seed, chunk_size, output):
+    """
+    Spread of curriculum hours and non-pay when student numbers are uncertain.
+    """
+    overrides = {key: Uncertainty(kind, spread if kind_spread is None else kind_spread)
+                 for key, (kind, kind_spread) in overrides.items()}
+    with config.db() as db:
+        curriculum = db.con.execute(select(Curriculum.acad_year, Curriculum.usage_id)
+                                    .where(Curriculum.curriculum_id == curriculum_id)).one_or_none()
+        if curriculum is None:
+            raise click.ClickException(f"No curriculum with ID {curriculum_id}.")
+        with config.phase("load"):
+            frame = load_curriculum(db.con, curriculum_id)
+            students = student_numbers(db.con, frame.encoding, *curriculum)
+            cost_types = reference_cache.table(db.con, 'cost_type')
+    r = rates(frame, cost_types)
+    allocation = costing(frame, group_counts(frame, students), cost_types).allocation
+    with config.phase("simulate"):
+        result = simulate(frame, students, r, allocation, samples, Uncertainty(distribution, spread),
+                          overrides=overrides, chunk_size=chunk_size, seed=seed)
+    config.verbose_print(f"{samples} samples over {len(frame.cost)} costs.")
+    for measure in result.measures:
+        totals = result.totals(measure)
+        p5, p50, p95 = np.percentile(totals, [5, 50, 95]) if len(totals) else (0, 0, 0)
+        click.echo(f"{measure}: point {result.point[measure].sum():,.0f}, "
+                   f"5% {p5:,.0f}, median {p50:,.0f}, 95% {p95:,.0f}")
+    if output is not None:
+        rows = result.to_rows()
+        first = next(rows, None)
+        names = list(first) if first is not None else ['costc']
+        with CsvWriter(output, [column(name) for name in names]) as writer:
+            if first is not None:
+                writer.write([tuple(first.values())])
+                writer.write(tuple(row.values()) for row in rows)
+
+
+def _overrides(values):
+    """Parses --override values into {aos_code or (aos_code, session): (kind, spread or None)}."""
+    parsed = {}
+    for value in values:
+        try:
+            cell, dist = value.split('=')
+            aos, _, session = cell.partition(':')
+            kind, _, spread = dist.partition(':')
+            key = (aos, int(session)) if session else aos
+            spread = float(spread) if spread else None
+        except ValueError:
+            raise click.BadParameter(f"{value} isn't AOS[:SESSION]=KIND[:SPREAD].", param_hint="--override")
+        if kind not in DISTRIBUTIONS:
+            raise click.BadParameter(f"Unknown distribution {kind}; use one of {', '.join(DISTRIBUTIONS)}.",
+                                     param_hint="--override")
+        parsed[key] = (kind, spread)
+    return parsed
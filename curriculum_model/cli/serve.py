@@ -0,0 +1,36 @@
+import click
+from curriculum_model.service import CostingService, make_server
+
+
+@click.command()
+@click.argument("curriculum_ids", type=int, nargs=-1)
+@click.option("--host", type=str, default="127.0.0.1", help="Address to listen on.")
+@click.option("--port", type=int, default=8080, help="Port to listen on.")
+@click.option("--workers", type=int, default=8, help="Number of threads handling requests.")
+@click.option("--refresh", type=float, default=60, help="Seconds between checks for changed curricula and student numbers.")
+@click.pass_obj
+def serve(config, curriculum_ids, host, port, workers, refresh):
+    """
+    Answer costing, fee income and student number queries over HTTP, from memory.
+
+    Curricula given are loaded at start-up; others are loaded when first asked for.
+    """
+    with config.db() as db:
+        service = CostingService(db.engine, refresh, config.verbose_print)
+        for curriculum_id in curriculum_ids:
+            with config.phase(f"load curriculum {curriculum_id}"):
+                try:
+                    service.curriculum(curriculum_id)
+                except KeyError as e:
+                    raise click.ClickException(e.args[0])
+        server = make_server(service, host, port, workers)
+        service.start()
+        click.echo(f"Serving on http://{server.server_address[0]}:{server.server_address[1]}/ "
+                   "(Ctrl+C to stop).")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            service.stop()
+            server.server_close()
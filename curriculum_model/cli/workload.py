@@ -0,0 +1,28 @@
+import csv
+import click
+from curriculum_model.calc.workload import load_workload
+
+
+@click.command()
+@click.argument("curriculum_id", type=int)
+@click.option("--weekly-hours", "-w", type=float, default=20, help="Flag staff with more hours than this in any week.")
+@click.option("--total-hours", "-t", type=float, default=550, help="Flag staff with more hours than this over the year.")
+@click.option("--output", "-o", type=click.Path(dir_okay=False, writable=True), help="Write every member of staff's hours per week to this CSV file.")
+@click.pass_obj
+def workload(config, curriculum_id, weekly_hours, total_hours, output):
+    """
+    Total teaching hours per member of staff, and flag anyone over the thresholds.
+    """
+    with config.db() as db:
+        with config.phase("workload"):
+            load = load_workload(db.con, curriculum_id)
+    config.verbose_print(
+        f"{len(load)} staff over {len(load.weeks)} weeks.")
+    for staff_id, total, peak, weeks_over in load.over(weekly_hours, total_hours):
+        click.echo(f"{staff_id}: {total:.1f} hours, peak {peak:.1f} per week, "
+                   f"{weeks_over} weeks over {weekly_hours:g}")
+    if output is not None:
+        with open(output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['staff_id', 'celcat_week', 'hours'])
+            writer.writerows(load.to_rows())
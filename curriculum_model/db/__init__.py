@@ -38,9 +38,14 @@ class DB():
         Whether or not to output instructions sent to DB. 
     config_section : str
         Name of the section in the config file. 
+    profiler : curriculum_model.db.profile.Profiler, optional
+        If given, records every statement run on the engine.
+    query_cache : curriculum_model.db.cache.QueryCache, optional
+        If given, caches the results of SELECTs run through sessions.
     """
 
-    def __init__(self, echo=False, config_section="PRODUCTION", config_name='local_config.ini'):
+    def __init__(self, echo=False, config_section="PRODUCTION", config_name='local_config.ini', profiler=None,
+                 query_cache=None):
         fldr = resource_path(os.path.dirname(
             os.path.dirname(os.path.dirname(__file__))))
         self._config_file = os.path.join(fldr, config_name)
@@ -52,9 +57,13 @@ class DB():
         except KeyError:
             raise FileNotFoundError("Local config file not found.")
         self.echo = echo
+        self.profiler = profiler
+        self.query_cache = query_cache
 
     def __enter__(self):
         self.engine = sqlalchemy.create_engine(self.uri, echo=self.echo)
+        if self.profiler is not None:
+            self.profiler.attach(self.engine)
         self._sfactory = sqlalchemy.orm.sessionmaker(bind=self.engine)
         self.con = self.engine.connect()
         if self.test_mode:
@@ -68,10 +77,30 @@ class DB():
     def session(self):
         """
         Returns an SQLAlchemy session object, for ORM work. 
+
+        If the DB has a query cache, it is attached to the session.
         """
         s = self._sfactory()
+        if self.query_cache is not None:
+            self.query_cache.attach(s)
         return s
 
+    def begin(self):
+        """
+        Begins a transaction on the connection, which later sessions join.
+
+        Sessions' commits then only take effect when the returned transaction is
+        committed; a rollback in any session rolls back the whole transaction.
+
+        Returns
+        -------
+        Transaction
+            The outer transaction, to commit or roll back.
+        """
+        trans = self.con.begin()
+        self._sfactory = sqlalchemy.orm.sessionmaker(bind=self.con)
+        return trans
+
 # Map taking string names to table objects
 
 
@@ -92,7 +121,12 @@ def table_map(sqlalchemy_base):
         Map of tablename to corresponding object. 
     """
     tm = {}
-    for model in sqlalchemy_base._decl_class_registry.values():
+    # SQLAlchemy 1.4 moved the class registry on to the declarative registry
+    if hasattr(sqlalchemy_base, 'registry'):
+        registry = sqlalchemy_base.registry._class_registry
+    else:
+        registry = sqlalchemy_base._decl_class_registry
+    for model in registry.values():
         if hasattr(model, '__tablename__'):
             tm[model.__tablename__] = model
     return tm
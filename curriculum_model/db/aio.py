@@ -0,0 +1,138 @@
+"""
+Asyncio access to the database, for running many independent reads at once.
+
+:py:class:`AsyncDB` reads the same config file and sections as
+:py:class:`curriculum_model.db.DB`. If the section's URI names an asyncio driver
+(e.g. ``sqlite+aiosqlite``), SQLAlchemy's asyncio extension is used directly.
+Other drivers, including pyodbc, are blocking, so their statements are run on a
+pool of worker threads, each with its own pooled connection; either way, queries
+awaited together run concurrently.
+
+:py:func:`fetch_views` uses this to pull several reporting views for several
+years in about the time of the slowest single query.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import sqlalchemy
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from curriculum_model.db import DB
+from curriculum_model.db.queries import view_query, view_table
+from curriculum_model.db.schema import Base, views
+
+# Views needed for a dashboard refresh
+DASHBOARD_VIEWS = [views.CurriculumHours,
+                   views.CurriculumNonPay,
+                   views.FeeIncomeInputCostc,
+                   views.SNInterfacePivot]
+
+
+class AsyncDB(DB):
+    """Asyncio counterpart to :py:class:`curriculum_model.db.DB`
+
+    Use with ``async with``.
+
+    Parameters
+    ----------
+    echo : boolean
+        Whether or not to output instructions sent to DB.
+    config_section : str
+        Name of the section in the config file.
+    max_workers : int
+        Maximum number of concurrent queries, when the driver is blocking.
+    """
+
+    def __init__(self, echo=False, config_section="PRODUCTION", config_name='local_config.ini',
+                 profiler=None, max_workers=8):
+        super().__init__(echo, config_section, config_name, profiler)
+        self.max_workers = max_workers
+        self.is_async = make_url(self.uri).get_dialect().is_async
+
+    async def __aenter__(self):
+        if self.is_async:
+            self.engine = create_async_engine(self.uri, echo=self.echo)
+            if self.profiler is not None:
+                self.profiler.attach(self.engine.sync_engine)
+            if self.test_mode:
+                async with self.engine.begin() as con:
+                    await con.run_sync(Base.metadata.create_all)
+        else:
+            self.engine = sqlalchemy.create_engine(self.uri, echo=self.echo)
+            if self.profiler is not None:
+                self.profiler.attach(self.engine)
+            self._executor = ThreadPoolExecutor(self.max_workers)
+            if self.test_mode:
+                await self._run(Base.metadata.create_all, self.engine)
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        if self.is_async:
+            await self.engine.dispose()
+        else:
+            self._executor.shutdown(wait=True)
+            self.engine.dispose()
+
+    async def fetch(self, stmt):
+        """
+        Runs a statement on its own connection and returns all rows.
+        """
+        if self.is_async:
+            async with self.engine.connect() as con:
+                result = await con.execute(stmt)
+                return result.all()
+        return await self._run(self._fetch, stmt)
+
+    async def gather(self, *stmts):
+        """
+        Runs statements concurrently, returning their rows in the same order.
+        """
+        return await asyncio.gather(*(self.fetch(s) for s in stmts))
+
+    def _fetch(self, stmt):
+        with self.engine.connect() as con:
+            return con.execute(stmt).all()
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+
+async def fetch_views(adb, acad_years, usage_id=None, view_list=None):
+    """
+    Fetches reporting views for several years concurrently.
+
+    Parameters
+    ----------
+    adb : AsyncDB
+        Open async database.
+    acad_years : list
+        Academic years to fetch; each year of each view is a separate query.
+    usage_id : str, optional
+        Student number usage to filter on.
+    view_list : list, optional
+        Views (or view names) to fetch. Defaults to DASHBOARD_VIEWS.
+
+    Returns
+    -------
+    dict
+        (view name, acad_year) to list of rows.
+    """
+    view_list = DASHBOARD_VIEWS if view_list is None else [
+        view_table(v) for v in view_list]
+    keys = [(v.name, y) for v in view_list for y in acad_years]
+    stmts = [view_query(name, acad_year=y, usage_id=usage_id)
+             for name, y in keys]
+    results = await adb.gather(*stmts)
+    return dict(zip(keys, results))
+
+
+def run_views(acad_years, usage_id=None, view_list=None, **db_kwargs):
+    """
+    Synchronous wrapper around :py:func:`fetch_views`, opening its own AsyncDB.
+
+    Keyword arguments are passed to :py:class:`AsyncDB`.
+    """
+    async def run():
+        async with AsyncDB(**db_kwargs) as adb:
+            return await fetch_views(adb, acad_years, usage_id, view_list)
+    return asyncio.run(run())
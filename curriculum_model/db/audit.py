@@ -0,0 +1,212 @@
+"""
+Writing to, and pruning, the audit tables.
+
+:py:class:`AuditWriter` buffers row images and relationship changes made by bulk
+operations (copy, rollover, delete) and writes them with one executemany per
+table, rather than one insert per row.
+
+:py:func:`compact` collapses history older than a cut-off date into a single
+snapshot per object: for each object, only the latest image before the cut-off
+is kept. Work is done in primary key ranges, each in its own short transaction.
+"""
+import getpass
+from datetime import datetime
+from sqlalchemy import func, select
+from curriculum_model.db.schema import audit as audit_schema
+
+# Audit table for each audited table, and the column identifying the object
+AUDIT_TABLES = {'cgroup': (audit_schema.t_audit_cgroup, 'cgroup_id'),
+                'component': (audit_schema.t_audit_component, 'component_id'),
+                'cost': (audit_schema.t_audit_cost, 'cost_id'),
+                'course': (audit_schema.t_audit_course, 'course_id'),
+                'course_session': (audit_schema.t_audit_course_session, 'course_session_id')}
+
+INSERT = 'insert'
+UPDATE = 'update'
+DELETE = 'delete'
+
+
+class AuditWriter():
+    """
+    Buffers audit events and writes them in batches.
+
+    Events are written when the buffer reaches ``batch_size``, on :py:meth:`flush`,
+    or on leaving a ``with`` block without an exception. Writes use the caller's
+    connection or session, so they are committed (or rolled back) along with the
+    changes they describe.
+
+    Parameters
+    ----------
+    con : Session or Connection
+        Where to write the events.
+    username : str, optional
+        Name recorded against relationship changes. Defaults to the OS user.
+    batch_size : int, optional
+        Number of buffered events which triggers a flush.
+    """
+
+    def __init__(self, con, username=None, batch_size=500):
+        self.con = con
+        self.username = getpass.getuser() if username is None else username
+        self.batch_size = batch_size
+        self._buffer = {}
+        self._count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self.flush()
+        else:
+            self.discard()
+
+    def record(self, obj, cmd=INSERT, datestamp=None):
+        """
+        Buffers an image of an ORM object's row.
+
+        Parameters
+        ----------
+        obj : Base
+            Instance of an audited table (course, course_session, cgroup, component or cost).
+        cmd : str
+            One of 'insert', 'update' or 'delete'.
+        datestamp : datetime, optional
+            When the change was made. Defaults to now.
+        """
+        tbl, _ = AUDIT_TABLES[obj.__tablename__]
+        row = {c.name: getattr(obj, c.name, None) for c in tbl.columns}
+        row['datestamp'] = datetime.now() if datestamp is None else datestamp
+        row['cmd'] = cmd
+        self._add(tbl, row)
+
+    def relationship(self, tbl, parent, child, cmd=INSERT, datestamp=None):
+        """
+        Buffers a change to a config (relationship) table.
+
+        Parameters
+        ----------
+        tbl : str
+            Name of the config table, e.g. 'course_config'.
+        parent : int
+            ID of the parent object.
+        child : int
+            ID of the child object.
+        cmd : str
+            One of 'insert' or 'delete'.
+        datestamp : datetime, optional
+            When the change was made. Defaults to now.
+        """
+        self._add(audit_schema.t_audit_relationships,
+                  {'tbl': tbl,
+                   'lcom_username': self.username,
+                   'cmd': cmd,
+                   'datestamp': datetime.now() if datestamp is None else datestamp,
+                   'parent': parent,
+                   'child': child})
+
+    def flush(self):
+        """
+        Writes all buffered events, one statement per audit table.
+
+        Returns
+        -------
+        int
+            Number of events written.
+        """
+        written = self._count
+        for tbl, rows in self._buffer.items():
+            if rows:
+                self.con.execute(tbl.insert(), rows)
+        self.discard()
+        return written
+
+    def discard(self):
+        """
+        Empties the buffer without writing.
+        """
+        self._buffer = {}
+        self._count = 0
+
+    def _add(self, tbl, row):
+        self._buffer.setdefault(tbl, []).append(row)
+        self._count += 1
+        if self._count >= self.batch_size:
+            self.flush()
+
+
+def compact(engine, before, chunk_size=5000, verbose_print=None):
+    """
+    Collapses audit history older than a date into one snapshot per object.
+
+    For each object in the audit tables, every image older than the latest one
+    before ``before`` is deleted. Actioned timetabling audit entries (``tt_audit``)
+    older than ``before`` are deleted outright.
+
+    Parameters
+    ----------
+    engine : Engine
+        SQLAlchemy engine; each chunk is committed separately.
+    before : datetime
+        Cut-off date. History on or after this date is untouched.
+    chunk_size : int, optional
+        Width of the ID range deleted in each transaction.
+    verbose_print : function, optional
+        Called with progress messages.
+
+    Returns
+    -------
+    dict
+        Number of rows deleted, by table name.
+    """
+    removed = {}
+    for tbl, id_col_name in AUDIT_TABLES.values():
+        id_col = tbl.c[id_col_name]
+        prior = tbl.alias()
+        latest = select(func.max(prior.c.datestamp)) \
+            .where(prior.c[id_col_name] == id_col,
+                   prior.c.datestamp < before) \
+            .scalar_subquery()
+        removed[tbl.name] = _chunked_delete(engine, tbl, id_col, before, chunk_size,
+                                            tbl.c.datestamp < latest)
+        _report(verbose_print, tbl.name, removed[tbl.name])
+    # Relationships have no single ID, so are chunked on the parent
+    tbl = audit_schema.t_audit_relationships
+    prior = tbl.alias()
+    latest = select(func.max(prior.c.datestamp)) \
+        .where(prior.c.tbl == tbl.c.tbl,
+               prior.c.parent == tbl.c.parent,
+               prior.c.child == tbl.c.child,
+               prior.c.datestamp < before) \
+        .scalar_subquery()
+    removed[tbl.name] = _chunked_delete(engine, tbl, tbl.c.parent, before, chunk_size,
+                                        tbl.c.datestamp < latest)
+    _report(verbose_print, tbl.name, removed[tbl.name])
+    # Timetabling audit entries are only needed until they've been actioned
+    tbl = audit_schema.Audit.__table__
+    removed[tbl.name] = _chunked_delete(engine, tbl, tbl.c.audit_id, before, chunk_size,
+                                        tbl.c.actioned)
+    _report(verbose_print, tbl.name, removed[tbl.name])
+    return removed
+
+
+def _chunked_delete(engine, tbl, id_col, before, chunk_size, condition):
+    with engine.connect() as con:
+        lo, hi = con.execute(select(func.min(id_col), func.max(id_col))
+                             .where(tbl.c.datestamp < before)).one()
+    if lo is None:
+        return 0
+    removed = 0
+    for start in range(lo, hi + 1, chunk_size):
+        stmt = tbl.delete().where(id_col >= start,
+                                  id_col < start + chunk_size,
+                                  tbl.c.datestamp < before,
+                                  condition)
+        with engine.begin() as con:
+            removed += con.execute(stmt).rowcount
+    return removed
+
+
+def _report(verbose_print, name, n):
+    if verbose_print is not None:
+        verbose_print(f"Removed {n} rows from {name}.")
@@ -0,0 +1,225 @@
+"""
+Opt-in cache of SELECT results for ORM sessions.
+
+Reporting and lookup code often runs the same SELECT many times in one process,
+e.g. fetching a curriculum by ID or a year's fee grid. A :py:class:`QueryCache`
+attached to a session (see :py:meth:`curriculum_model.db.DB.session`) answers
+repeats from memory. Results are held as ``FrozenResult`` objects, keyed by the
+compiled SQL and its parameters, in an LRU of at most ``max_size`` entries that
+each expire after ``ttl`` seconds.
+
+Entries are invalidated by the session's own writes:
+
+* a flush invalidates entries reading the tables it wrote;
+* bulk ``update()``/``delete()``/``insert()`` statements run through the session
+  invalidate entries reading their target table;
+* a commit or rollback invalidates the tables written in the transaction again,
+  since other sessions may have cached their old rows after the flush. Ending a
+  SAVEPOINT doesn't end the transaction, so the tables are held until the
+  outermost transaction ends.
+
+A result isn't stored if its tables were invalidated while it was being read, as
+it may hold rows from before the write.
+
+Statements reading a table written in the session's open transaction bypass the
+cache, so uncommitted rows are never shared with other sessions. Tables that
+aren't mapped (e.g. the reporting views in :py:mod:`curriculum_model.db.schema.views`)
+may depend on any table, so entries reading them are invalidated by every write.
+Writes by other processes aren't seen; use ``ttl`` to bound how stale results can be.
+
+Individual statements can skip the cache with
+``.execution_options(query_cache=False)``.
+"""
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import loading
+from sqlalchemy.sql.util import find_tables
+from curriculum_model.db.schema import Base
+
+# Key in session.info of the tables written in the open transaction
+_WRITTEN = 'query_cache_written'
+
+
+class QueryCache():
+    """
+    LRU cache of SELECT results, shared by the sessions it is attached to.
+
+    Parameters
+    ----------
+    max_size : int, optional
+        Most results held; the least recently used is dropped beyond that.
+    ttl : float, optional
+        Seconds a result is held for. None (the default) means until invalidated
+        or evicted.
+    """
+
+    def __init__(self, max_size=1000, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._by_table = {}
+        self._generations = {}
+        self._compiled = {}
+        self._mapped = {t.name for m in Base.registry.mappers for t in m.tables}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def attach(self, session):
+        """
+        Starts caching the SELECTs run by a session, and invalidating on its writes.
+        """
+        event.listen(session, 'do_orm_execute', self._execute)
+        event.listen(session, 'after_flush', self._after_flush)
+        event.listen(session, 'after_commit', self._after_commit)
+        event.listen(session, 'after_soft_rollback', self._after_rollback)
+        return session
+
+    def detach(self, session):
+        """
+        Stops caching for a session.
+        """
+        event.remove(session, 'do_orm_execute', self._execute)
+        event.remove(session, 'after_flush', self._after_flush)
+        event.remove(session, 'after_commit', self._after_commit)
+        event.remove(session, 'after_soft_rollback', self._after_rollback)
+
+    def stats(self):
+        """
+        Returns the counters, and the current number of entries, as a dictionary.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations, 'entries': len(self._entries)}
+
+    def clear(self):
+        """
+        Drops every entry; counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+
+    def invalidate(self, tables):
+        """
+        Drops the entries reading any of the given tables (by name).
+
+        Returns
+        -------
+        int
+            Number of entries dropped.
+        """
+        with self._lock:
+            keys = set(self._by_table.get(None, ()))
+            for name in list(tables) + [None]:
+                keys.update(self._by_table.get(name, ()))
+                self._generations[name] = self._generations.get(name, 0) + 1
+            for key in keys:
+                self._drop(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def _execute(self, state):
+        if not state.is_select:
+            if state.is_update or state.is_delete or state.is_insert:
+                self._written(state.session, [state.statement.table.name])
+            return None
+        options = state.execution_options
+        if not options.get('query_cache', True) or options.get('populate_existing') \
+                or getattr(state.statement, '_for_update_arg', None) is not None:
+            return None
+        key = self._key(state)
+        written = state.session.info.get(_WRITTEN, set())
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[1] > self.ttl:
+                self._drop(key)
+                entry = None
+        tables = self._tables(state.statement) if entry is None else entry[2]
+        if tables & written or (None in tables and written):
+            # Uncommitted rows mustn't be cached for, or hidden from, this session
+            return None
+        with self._lock:
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                generation = self._generation(tables)
+        if entry is None:
+            frozen = state.invoke_statement().freeze()
+            self._store(key, frozen, tables, generation)
+        else:
+            frozen = entry[0]
+        return loading.merge_frozen_result(state.session, state.statement, frozen, load=False)()
+
+    def _after_flush(self, session, flush_context):
+        tables = set()
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            tables.update(t.name for t in type(obj).__mapper__.tables)
+        self._written(session, tables)
+
+    def _after_commit(self, session):
+        # Also fires on releasing a SAVEPOINT, which is still inside the transaction
+        if not session.in_nested_transaction():
+            self._end_transaction(session)
+
+    def _after_rollback(self, session, previous_transaction):
+        if not previous_transaction.nested:
+            self._end_transaction(session)
+
+    def _end_transaction(self, session):
+        # Other sessions may have cached the old rows between our flush and now
+        written = session.info.pop(_WRITTEN, None)
+        if written:
+            self.invalidate(written)
+
+    def _written(self, session, tables):
+        if tables:
+            session.info.setdefault(_WRITTEN, set()).update(tables)
+            self.invalidate(tables)
+
+    def _tables(self, stmt):
+        """Names of the tables a statement reads; None stands for an unmapped table."""
+        names = {t.name for t in find_tables(stmt, include_aliases=True, include_joins=True)
+                 if hasattr(t, 'name')}
+        return {n if n in self._mapped else None for n in names}
+
+    def _key(self, state):
+        # SQLAlchemy's cache key identifies the statement's structure, so each shape of
+        # statement is compiled to SQL once; the key adds the parameter values to it
+        bind = state.session.get_bind(**state.bind_arguments)
+        sql = state.statement._generate_cache_key().to_offline_string(
+            self._compiled, state.statement, state.parameters or {})
+        return (str(bind.engine.url), sql)
+
+    def _generation(self, tables):
+        """Number of times each table has been invalidated; None counts every write."""
+        return {name: self._generations.get(name, 0) for name in tables}
+
+    def _store(self, key, frozen, tables, generation=None):
+        with self._lock:
+            if generation is not None and self._generation(tables) != generation:
+                # Written while the statement ran, so the result may be stale already
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (frozen, time.monotonic(), tables)
+            for name in tables:
+                self._by_table.setdefault(name, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            for name in entry[2]:
+                self._by_table.get(name, set()).discard(key)
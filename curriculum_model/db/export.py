@@ -0,0 +1,245 @@
+"""
+Streaming export of query results to CSV, XLSX or Parquet.
+
+Rows are fetched from a server-side cursor a chunk at a time and handed straight
+to a writer, so memory use doesn't depend on the size of the result, and the
+first rows are written as soon as the server returns them.
+
+CSV needs nothing beyond the standard library. XLSX needs openpyxl (written in
+write-only mode) and Parquet needs pyarrow (one row group per chunk); they are
+only imported when used.
+"""
+import csv
+import os
+import click
+from decimal import Decimal
+from sqlalchemy import types
+
+FORMATS = ['csv', 'xlsx', 'parquet']
+
+
+def stream_chunks(con, stmt, chunk_size=5000):
+    """
+    Yields each chunk of a query's results, as a list of rows.
+
+    Parameters
+    ----------
+    con : Connection
+        SQLAlchemy connection.
+    stmt : Select
+        Query to run.
+    chunk_size : int, optional
+        Number of rows fetched from the cursor at a time.
+    """
+    result = con.execution_options(stream_results=True).execute(stmt)
+    while True:
+        chunk = result.fetchmany(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+def export(con, stmt, path, fmt='csv', chunk_size=5000):
+    """
+    Streams the results of a query to a file.
+
+    Parameters
+    ----------
+    con : Connection
+        SQLAlchemy connection.
+    stmt : Select
+        Query to run.
+    path : str
+        Output file; '-' writes CSV to stdout.
+    fmt : str, optional
+        One of FORMATS.
+    chunk_size : int, optional
+        Number of rows held in memory at a time.
+
+    Returns
+    -------
+    int
+        Number of rows written.
+    """
+    writer_class = {'csv': CsvWriter, 'xlsx': XlsxWriter,
+                    'parquet': ParquetWriter}[fmt]
+    n = 0
+    with writer_class(path, list(stmt.selected_columns)) as writer:
+        for chunk in stream_chunks(con, stmt, chunk_size):
+            writer.write(chunk)
+            n += len(chunk)
+    return n
+
+
+class CsvWriter():
+    """
+    Writes chunks of rows to a CSV file, with a header row.
+
+    Parameters
+    ----------
+    path : str
+        Output file, or '-' for stdout.
+    columns : list
+        SQLAlchemy columns being written.
+    """
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+
+    def __enter__(self):
+        if self.path == '-':
+            self._file = click.get_text_stream('stdout')
+        else:
+            self._file = open(self.path, 'w', newline='')
+        self._csv = csv.writer(self._file)
+        self._csv.writerow([c.name for c in self.columns])
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if self.path != '-':
+            self._file.close()
+
+    def write(self, rows):
+        self._csv.writerows(rows)
+
+
+class XlsxWriter():
+    """
+    Writes chunks of rows to a single-sheet workbook, without holding it in memory.
+
+    Parameters are as for :py:class:`CsvWriter`.
+    """
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+
+    def __enter__(self):
+        from openpyxl import Workbook
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet()
+        self._ws.append([c.name for c in self.columns])
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if type is None:
+            self._wb.save(self.path)
+
+    def write(self, rows):
+        for row in rows:
+            self._ws.append([float(v) if isinstance(v, Decimal) else v
+                             for v in row])
+
+
+class ParquetWriter():
+    """
+    Writes each chunk of rows as a row group of a Parquet file.
+
+    The Parquet schema is taken from the column types, so it doesn't depend on the
+    values in the first chunk. Parameters are as for :py:class:`CsvWriter`.
+    """
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+
+    def __enter__(self):
+        import pyarrow
+        import pyarrow.parquet
+        self._pa = pyarrow
+        self._schema = pyarrow.schema([(c.name, self._arrow_type(c.type))
+                                       for c in self.columns])
+        self._writer = pyarrow.parquet.ParquetWriter(self.path, self._schema)
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self._writer.close()
+        if type is not None:
+            # Don't leave a file that looks complete but is missing rows
+            os.remove(self.path)
+
+    def write(self, rows):
+        data = {}
+        for i, c in enumerate(self.columns):
+            values = [r[i] for r in rows]
+            if isinstance(c.type, types.Numeric) and not isinstance(c.type, types.Integer):
+                values = [None if v is None else float(v) for v in values]
+            data[c.name] = values
+        self._writer.write_table(self._pa.table(data, schema=self._schema))
+
+    def _arrow_type(self, sql_type):
+        if isinstance(sql_type, types.Integer):
+            return self._pa.int64()
+        if isinstance(sql_type, (types.Numeric, types.Float)):
+            return self._pa.float64()
+        if isinstance(sql_type, types.DateTime):
+            return self._pa.timestamp('ms')
+        if isinstance(sql_type, types.Date):
+            return self._pa.date32()
+        if isinstance(sql_type, types.Boolean):
+            return self._pa.bool_()
+        return self._pa.string()
+
+
+class FixedWidthWriter():
+    """
+    Writes chunks of rows as fixed-width lines, without a header, e.g. for ledger imports.
+
+    Each field's width comes from its column type: the length of strings, and the
+    precision of numerics plus room for the sign and decimal point (written
+    right-aligned, to the column's scale). Other types are ``default_width`` wide.
+    A value too long for its field raises ValueError, rather than being truncated
+    into a different account or amount.
+
+    Parameters
+    ----------
+    path : str
+        Output file, or '-' for stdout.
+    columns : list
+        SQLAlchemy columns being written.
+    default_width : int, optional
+        Width of columns whose type has no length or precision.
+    """
+
+    def __init__(self, path, columns, default_width=10):
+        self.path = path
+        self.columns = columns
+        self._fields = [self._field(c.type, default_width) for c in columns]
+
+    def __enter__(self):
+        if self.path == '-':
+            self._file = click.get_text_stream('stdout')
+        else:
+            self._file = open(self.path, 'w', newline='')
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if self.path != '-':
+            self._file.close()
+
+    def write(self, rows):
+        self._file.writelines(''.join(self._format(v, *field) for v, field in zip(row, self._fields)) + '\n'
+                              for row in rows)
+
+    def _field(self, sql_type, default_width):
+        if isinstance(sql_type, types.String):
+            return (sql_type.length or default_width, '<', None)
+        if isinstance(sql_type, types.Numeric) and not isinstance(sql_type, types.Integer):
+            if sql_type.precision is None:
+                return (default_width, '>', sql_type.scale)
+            return (sql_type.precision + 1 + (1 if sql_type.scale else 0), '>', sql_type.scale)
+        if isinstance(sql_type, types.Integer):
+            return (default_width, '>', None)
+        return (default_width, '<', None)
+
+    def _format(self, value, width, align, scale):
+        if value is None:
+            text = ''
+        elif scale is not None:
+            text = f"{value:.{scale}f}"
+        else:
+            text = str(value)
+        if len(text) > width:
+            raise ValueError(f"{text} doesn't fit in {width} characters.")
+        return f"{text:{align}{width}}"
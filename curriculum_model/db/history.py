@@ -0,0 +1,236 @@
+"""
+Point-in-time reconstruction of a curriculum from the audit tables.
+
+The audit tables hold a datestamped image of each inserted, updated or deleted
+course, course_session, cgroup, component and cost row, and each change to the
+config (relationship) tables. :py:class:`Reconstructor` streams those rows for a
+curriculum in datestamp order, merging the tables as it goes, and replays them
+into a :py:class:`Snapshot`.
+
+Snapshots are checkpointed as the replay goes, so a later query only replays the
+rows between the nearest earlier checkpoint and the date asked for.
+
+.. note::
+
+    Audit history is append-only, so checkpoints stay valid as new rows arrive.
+    After :py:func:`curriculum_model.db.audit.compact` has run, snapshots before
+    the compaction cut-off only reflect the state at the cut-off.
+"""
+import heapq
+import threading
+from bisect import bisect_right
+from sqlalchemy import and_, or_, select
+from curriculum_model.db.audit import AUDIT_TABLES
+from curriculum_model.db.schema.audit import t_audit_relationships
+
+# Relationship tables, and the audit table holding their parent objects
+RELATIONSHIP_PARENTS = {'course_config': 'course',
+                        'course_session_config': 'course_session',
+                        'cgroup_config': 'cgroup'}
+
+_META_COLUMNS = ('datestamp', 'cmd')
+
+
+def is_delete(cmd):
+    """
+    Whether an audit ``cmd`` value records a deletion.
+    """
+    return cmd.strip().lower().startswith('del')
+
+
+class Snapshot():
+    """
+    The state of a curriculum at a point in time.
+
+    Parameters
+    ----------
+    datestamp : datetime
+        Time of the last change applied to the snapshot.
+    tables : dict
+        Table name to a dictionary of object ID to row (as a dictionary).
+    relationships : dict
+        Config table name to a set of (parent, child) tuples.
+    """
+    __slots__ = ('datestamp', 'tables', 'relationships')
+
+    def __init__(self, datestamp=None, tables=None, relationships=None):
+        self.datestamp = datestamp
+        self.tables = {t: {} for t in AUDIT_TABLES} if tables is None else tables
+        self.relationships = {t: set() for t in RELATIONSHIP_PARENTS} \
+            if relationships is None else relationships
+
+    def copy(self):
+        """
+        Returns an independent copy. Rows are replaced rather than mutated, so are shared.
+        """
+        return Snapshot(self.datestamp,
+                        {t: dict(rows) for t, rows in self.tables.items()},
+                        {t: set(pairs) for t, pairs in self.relationships.items()})
+
+    def rows(self, table):
+        """
+        Returns the rows of a table, as a list of dictionaries.
+        """
+        return list(self.tables[table].values())
+
+    def apply(self, table, datestamp, cmd, row):
+        """
+        Applies one audit row to the snapshot.
+        """
+        self.datestamp = datestamp
+        if table in RELATIONSHIP_PARENTS:
+            pair = (row['parent'], row['child'])
+            if is_delete(cmd):
+                self.relationships[table].discard(pair)
+            else:
+                self.relationships[table].add(pair)
+            return
+        obj_id = row[AUDIT_TABLES[table][1]]
+        if is_delete(cmd):
+            self.tables[table].pop(obj_id, None)
+        else:
+            self.tables[table][obj_id] = row
+
+
+class Reconstructor():
+    """
+    Rebuilds curricula as they were at a given time, from the audit tables.
+
+    Parameters
+    ----------
+    engine : Engine or Connection
+        Source of the audit tables.
+    checkpoint_every : int, optional
+        Number of replayed rows between checkpoints.
+    max_checkpoints : int, optional
+        Number of checkpoints kept per curriculum; when exceeded, every other one is dropped.
+    chunk_size : int, optional
+        Number of rows fetched at a time from each audit table.
+    """
+
+    def __init__(self, engine, checkpoint_every=5000, max_checkpoints=64, chunk_size=2000):
+        self.engine = engine
+        self.checkpoint_every = checkpoint_every
+        self.max_checkpoints = max_checkpoints
+        self.chunk_size = chunk_size
+        self._checkpoints = {}
+        self._lock = threading.Lock()
+
+    def at(self, curriculum_id, when):
+        """
+        Returns the state of a curriculum at a point in time.
+
+        Parameters
+        ----------
+        curriculum_id : int
+            ID of the curriculum.
+        when : datetime
+            Point in time; changes stamped on or before this are included.
+
+        Returns
+        -------
+        Snapshot
+        """
+        with self._lock:
+            stamps, snapshots = self._checkpoints.setdefault(
+                curriculum_id, ([], []))
+            i = bisect_right(stamps, when)
+            start = snapshots[i-1].copy() if i > 0 else Snapshot()
+        since = start.datestamp
+        snapshot = start
+        replayed = 0
+        last_stamp = since
+        for datestamp, table, cmd, row in self.stream(curriculum_id, since, when):
+            # Only checkpoint between datestamps, so resuming can't split a change
+            if replayed >= self.checkpoint_every and datestamp != last_stamp:
+                self._checkpoint(curriculum_id, snapshot.copy())
+                replayed = 0
+            snapshot.apply(table, datestamp, cmd, row)
+            last_stamp = datestamp
+            replayed += 1
+        if snapshot.datestamp is not None and snapshot.datestamp != since:
+            self._checkpoint(curriculum_id, snapshot.copy())
+        return snapshot
+
+    def clear(self, curriculum_id=None):
+        """
+        Drops cached checkpoints for a curriculum, or for all curricula.
+        """
+        with self._lock:
+            if curriculum_id is None:
+                self._checkpoints = {}
+            else:
+                self._checkpoints.pop(curriculum_id, None)
+
+    def stream(self, curriculum_id, since, until):
+        """
+        Yields (datestamp, table, cmd, row) for the curriculum's audit rows, in datestamp order.
+
+        Parameters
+        ----------
+        curriculum_id : int
+            ID of the curriculum.
+        since : datetime or None
+            Exclusive lower bound on datestamp.
+        until : datetime
+            Inclusive upper bound on datestamp.
+        """
+        streams = [self._table_stream(name, stmt)
+                   for name, stmt in self._statements(curriculum_id, since, until)]
+        for datestamp, _, table, cmd, row in heapq.merge(*streams, key=lambda r: (r[0], r[1])):
+            yield datestamp, table, cmd, row
+
+    def _statements(self, curriculum_id, since, until):
+        def bounded(tbl, stmt):
+            stmt = stmt.where(tbl.c.datestamp <= until)
+            if since is not None:
+                stmt = stmt.where(tbl.c.datestamp > since)
+            return stmt.order_by(tbl.c.datestamp)
+
+        component_ids = select(AUDIT_TABLES['component'][0].c.component_id) \
+            .where(AUDIT_TABLES['component'][0].c.curriculum_id == curriculum_id)
+        for name, (tbl, _) in AUDIT_TABLES.items():
+            if 'curriculum_id' in tbl.c:
+                stmt = select(tbl).where(tbl.c.curriculum_id == curriculum_id)
+            else:
+                # Costs are only linked to a curriculum through their component
+                stmt = select(tbl).where(tbl.c.component_id.in_(component_ids))
+            yield name, bounded(tbl, stmt)
+        rel = t_audit_relationships
+        parents = []
+        for rel_name, parent_name in RELATIONSHIP_PARENTS.items():
+            parent_tbl, parent_id = AUDIT_TABLES[parent_name]
+            parent_ids = select(parent_tbl.c[parent_id]) \
+                .where(parent_tbl.c.curriculum_id == curriculum_id)
+            parents.append(and_(rel.c.tbl == rel_name,
+                                rel.c.parent.in_(parent_ids)))
+        yield 'relationships', bounded(rel, select(rel).where(or_(*parents)))
+
+    def _table_stream(self, name, stmt):
+        # Position of the table in the merge breaks ties between equal datestamps
+        order = list(AUDIT_TABLES).index(name) if name in AUDIT_TABLES \
+            else len(AUDIT_TABLES)
+        with self.engine.connect() as con:
+            result = con.execution_options(stream_results=True).execute(stmt)
+            while True:
+                chunk = result.fetchmany(self.chunk_size)
+                if not chunk:
+                    break
+                for r in chunk:
+                    row = {k: v for k, v in r._mapping.items()
+                           if k not in _META_COLUMNS}
+                    table = row.pop('tbl') if name == 'relationships' else name
+                    yield r.datestamp, order, table, r.cmd, row
+
+    def _checkpoint(self, curriculum_id, snapshot):
+        with self._lock:
+            stamps, snapshots = self._checkpoints.setdefault(
+                curriculum_id, ([], []))
+            i = bisect_right(stamps, snapshot.datestamp)
+            if i > 0 and stamps[i-1] == snapshot.datestamp:
+                return
+            stamps.insert(i, snapshot.datestamp)
+            snapshots.insert(i, snapshot)
+            if len(stamps) > self.max_checkpoints:
+                del stamps[::2]
+                del snapshots[::2]
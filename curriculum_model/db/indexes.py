@@ -0,0 +1,116 @@
+"""
+Finding and creating the indexes that curriculum traversals rely on.
+
+Copying, costing and validation walk the curriculum through foreign keys
+(``cost.component_id``, ``course_session_config.cgroup_id`` and so on) and filter
+on ``curriculum_id``. Without an index whose leading column is the one filtered
+on, each step of the walk is a scan.
+
+:py:func:`advise` compares the schema with the live database: every index the
+schema declares, every foreign key to a table in TRAVERSED_TABLES, and every
+``curriculum_id`` column should be the leading column of some index (or of the
+primary key) in the database. Anything that isn't becomes a :py:class:`Proposal`,
+which :py:func:`create` builds. Foreign keys to small lookup tables (cost types,
+room types, ...) are left alone; they're only used to check values.
+"""
+from collections import namedtuple
+from sqlalchemy import Index, inspect
+
+# Columns filtered on throughout, whether or not they're foreign keys
+FILTER_COLUMNS = ['curriculum_id']
+
+# Tables walked from parent to child, so foreign keys to them need indexes
+TRAVERSED_TABLES = ['curriculum', 'course', 'course_session', 'cgroup', 'component', 'cost',
+                    'tt_tgroup', 'student_number_instance']
+
+Proposal = namedtuple('Proposal', ['table', 'name', 'columns', 'reason'])
+
+
+def advise(engine, metadata, traversed=TRAVERSED_TABLES):
+    """
+    Returns the indexes the database is missing.
+
+    Parameters
+    ----------
+    engine : Engine
+        The live database.
+    metadata : MetaData
+        The schema, e.g. ``Base.metadata``.
+    traversed : list, optional
+        Tables whose foreign keys should be indexed.
+
+    Returns
+    -------
+    list
+        A :py:class:`Proposal` per missing index, in table order.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    proposals = []
+    for tbl in metadata.sorted_tables:
+        if tbl.name not in existing_tables:
+            continue
+        covered = _live_prefixes(inspector, tbl.name)
+        wanted = []
+        for index in tbl.indexes:
+            wanted.append((index.name, [c.name for c in index.columns], "declared in schema"))
+        for col in tbl.columns:
+            targets = [fk.target_fullname for fk in col.foreign_keys
+                       if fk.target_fullname.split('.')[0] in traversed]
+            if targets:
+                reason = "foreign key to " + ', '.join(targets)
+            elif col.name in FILTER_COLUMNS and len(tbl.primary_key):
+                # Tables without a primary key are logs (e.g. audit) or views
+                reason = "filter column"
+            else:
+                continue
+            if not any(cols[0] == col.name for _, cols, _ in wanted):
+                wanted.append((f"ix_{tbl.name}_{col.name}", [col.name], reason))
+        for name, columns, reason in wanted:
+            if not _is_covered(covered, columns):
+                proposals.append(Proposal(tbl.name, name, columns, reason))
+                covered.append(tuple(columns))
+    return proposals
+
+
+def create(engine, metadata, proposals, verbose_print=None):
+    """
+    Creates proposed indexes, each in its own transaction.
+
+    Parameters
+    ----------
+    engine : Engine
+        The live database.
+    metadata : MetaData
+        The schema the proposals were made from.
+    proposals : list
+        Proposals from :py:func:`advise`.
+    verbose_print : function, optional
+        Called with a message as each index is created.
+    """
+    for p in proposals:
+        tbl = metadata.tables[p.table]
+        declared = [i for i in tbl.indexes if i.name == p.name]
+        index = declared[0] if declared else Index(p.name, *[tbl.c[c] for c in p.columns])
+        try:
+            with engine.begin() as con:
+                index.create(con)
+        finally:
+            if not declared:
+                # Don't leave new indexes attached to the schema's table
+                tbl.indexes.discard(index)
+        if verbose_print is not None:
+            verbose_print(f"Created {p.name} on {p.table} ({', '.join(p.columns)}).")
+
+
+def _live_prefixes(inspector, table_name):
+    prefixes = [tuple(i['column_names']) for i in inspector.get_indexes(table_name)]
+    pk = inspector.get_pk_constraint(table_name).get('constrained_columns') or []
+    if pk:
+        prefixes.append(tuple(pk))
+    return prefixes
+
+
+def _is_covered(prefixes, columns):
+    columns = tuple(columns)
+    return any(p[:len(columns)] == columns for p in prefixes)
@@ -0,0 +1,388 @@
+"""
+Materialised copies of the reporting views, with dependency-based invalidation.
+
+The reporting views are computed by the server on every read. :py:class:`MaterialisedViews`
+snapshots each view's rows per partition, i.e. per (acad_year, usage_id, curriculum_id),
+into a local cache database, and serves later reads from there.
+
+Each view has a list of base tables it is computed from
+(:py:data:`VIEW_DEPENDENCIES`). A partition is dropped when:
+
+* :py:meth:`MaterialisedViews.invalidate` is called for one of its base tables;
+* a session being watched (:py:meth:`MaterialisedViews.watch`) flushes changes to
+  one of its base tables, and again when that session's transaction commits or
+  rolls back, since partitions may have been materialised from the old rows in
+  between. Changes to rows with a ``curriculum_id`` only drop that curriculum's
+  partitions;
+* :py:meth:`MaterialisedViews.refresh_stale` finds that the partition's stamp has
+  changed. Stamps are taken from the audit tables (for curriculum structure), the
+  student number instances (for student numbers), and aggregates or checksums of
+  the tables without an audit trail (cost weeks, calendars, cost types and fees),
+  so this catches changes made by other applications.
+"""
+import hashlib
+import json
+import threading
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, and_, or_, create_engine, event, func, select, union_all
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import StaticPool
+from curriculum_model.db.audit import AUDIT_TABLES
+from curriculum_model.db.history import RELATIONSHIP_PARENTS
+from curriculum_model.db.queries import VIEWS, view_column, view_query, view_table
+from curriculum_model.db.schema import (aos_code, CalendarMap, Component, Cost, CostType, CostWeek,
+                                        Curriculum, Fee, SNInstance, SN)
+from curriculum_model.db.schema import views
+from curriculum_model.db.schema.audit import t_audit_relationships
+
+_CURRICULUM_TABLES = ['curriculum', 'course', 'course_config', 'course_session',
+                      'course_session_config', 'cgroup', 'cgroup_config', 'component',
+                      'cost', 'cost_week', 'calendar_map']
+_SN_TABLES = ['student_number', 'student_number_instance']
+
+# Base tables each view is computed from
+VIEW_DEPENDENCIES = {
+    views.CurriculumHours.name: _CURRICULUM_TABLES + _SN_TABLES + ['cost_type'],
+    views.CurriculumNonPay.name: _CURRICULUM_TABLES + _SN_TABLES + ['cost_type'],
+    views.FeeIncomeInputCostc.name: _SN_TABLES + ['fee', 'fee_status', 'aos_code', 'costc'],
+    views.SNInterfacePivot.name: _SN_TABLES + ['fee_status', 'aos_code', 'costc',
+                                               'student_number_usage'],
+}
+
+# Key in session.info of the base tables (and curricula) written in the open transaction
+_WRITTEN = 'matview_written'
+
+cache_metadata = MetaData()
+
+t_partition = Table(
+    'mv_partition', cache_metadata,
+    Column('partition_id', Integer, primary_key=True),
+    Column('view', String(50), nullable=False),
+    Column('acad_year', Integer, nullable=False),
+    Column('usage_id', String(20), nullable=False),
+    Column('curriculum_id', Integer),
+    Column('refreshed', DateTime, nullable=False),
+    Column('stamp', String(500)),
+    Column('depends_on', String(1000), nullable=False)
+)
+
+# Cache tables mirror each view, plus a partition column
+CACHE_TABLES = {name: Table(f"mv_{name}", cache_metadata,
+                            Column('_partition_id', Integer, index=True),
+                            *[Column(c.name, c.type) for c in view.columns])
+                for name, view in VIEWS.items()}
+
+
+class MaterialisedViews():
+    """
+    Local cache of reporting view partitions.
+
+    Parameters
+    ----------
+    cache_uri : str, optional
+        SQLAlchemy URI of the cache database. Defaults to an in-memory SQLite
+        database; use a file to keep the cache between runs.
+    """
+
+    def __init__(self, cache_uri='sqlite://'):
+        if make_url(cache_uri).database in (None, '', ':memory:'):
+            # Share the one in-memory database between threads
+            self.cache = create_engine(cache_uri, poolclass=StaticPool,
+                                       connect_args={'check_same_thread': False})
+        else:
+            self.cache = create_engine(cache_uri)
+        cache_metadata.create_all(self.cache)
+        self._lock = threading.RLock()
+
+    def read(self, con, view, acad_year, usage_id, curriculum_id=None):
+        """
+        Returns the rows of a view partition, computing and caching them on a miss.
+
+        Parameters
+        ----------
+        con : Session or Connection
+            Connection to the main database, used on a miss.
+        view : str or Table
+            The view, or its name.
+        acad_year : int
+            Academic year.
+        usage_id : str
+            Student number usage.
+        curriculum_id : int, optional
+            Curriculum, for the views which have one.
+
+        Returns
+        -------
+        list
+            Rows, with the view's columns.
+        """
+        view = view_table(view)
+        curriculum_id = self._curriculum_key(view, curriculum_id)
+        with self._lock:
+            partition_id = self._partition_id(
+                view.name, acad_year, usage_id, curriculum_id)
+            if partition_id is None:
+                partition_id = self.materialise(con, view, acad_year, usage_id,
+                                                curriculum_id)
+            cache_tbl = CACHE_TABLES[view.name]
+            cols = [cache_tbl.c[c.name] for c in view.columns]
+            with self.cache.connect() as cache_con:
+                return cache_con.execute(select(*cols)
+                                         .where(cache_tbl.c._partition_id == partition_id)).all()
+
+    def materialise(self, con, view, acad_year, usage_id, curriculum_id=None):
+        """
+        (Re)computes a partition from the view and stores it.
+
+        Returns
+        -------
+        int
+            ID of the partition.
+        """
+        view = view_table(view)
+        curriculum_id = self._curriculum_key(view, curriculum_id)
+        stamp = self.stamp(con, view, acad_year, usage_id, curriculum_id)
+        rows = con.execute(view_query(view, acad_year=acad_year, usage_id=usage_id,
+                                      curriculum_id=curriculum_id)).all()
+        with self._lock, self.cache.begin() as cache_con:
+            self._drop(cache_con, and_(t_partition.c.view == view.name,
+                                       t_partition.c.acad_year == acad_year,
+                                       t_partition.c.usage_id == usage_id,
+                                       t_partition.c.curriculum_id == curriculum_id
+                                       if curriculum_id is not None
+                                       else t_partition.c.curriculum_id.is_(None)))
+            partition_id = cache_con.execute(t_partition.insert().values(
+                view=view.name, acad_year=acad_year, usage_id=usage_id,
+                curriculum_id=curriculum_id, refreshed=datetime.now(), stamp=stamp,
+                depends_on=','.join(VIEW_DEPENDENCIES[view.name]))).inserted_primary_key[0]
+            if rows:
+                cache_con.execute(CACHE_TABLES[view.name].insert(),
+                                  [dict(r._mapping, _partition_id=partition_id) for r in rows])
+        return partition_id
+
+    def invalidate(self, table, acad_year=None, usage_id=None, curriculum_id=None):
+        """
+        Drops the cached partitions of every view depending on a base table.
+
+        Parameters
+        ----------
+        table : str
+            Name of the base table which changed.
+        acad_year, usage_id, curriculum_id : optional
+            Restrict to partitions matching these; None matches any.
+
+        Returns
+        -------
+        int
+            Number of partitions dropped.
+        """
+        dependent = [v for v, tables in VIEW_DEPENDENCIES.items()
+                     if table in tables]
+        if not dependent:
+            return 0
+        conditions = [t_partition.c.view.in_(dependent)]
+        for col_name, value in (('acad_year', acad_year), ('usage_id', usage_id)):
+            if value is not None:
+                conditions.append(t_partition.c[col_name] == value)
+        if curriculum_id is not None:
+            # Partitions without a curriculum cover all of them
+            conditions.append(or_(t_partition.c.curriculum_id == curriculum_id,
+                                  t_partition.c.curriculum_id.is_(None)))
+        with self._lock, self.cache.begin() as cache_con:
+            return self._drop(cache_con, and_(*conditions))
+
+    def clear(self):
+        """
+        Drops every cached partition.
+        """
+        with self._lock, self.cache.begin() as cache_con:
+            return self._drop(cache_con, t_partition.c.partition_id.isnot(None))
+
+    def refresh_stale(self, con, rematerialise=False):
+        """
+        Checks each cached partition's stamp against the database.
+
+        Parameters
+        ----------
+        con : Session or Connection
+            Connection to the main database.
+        rematerialise : bool, optional
+            Recompute stale partitions straight away, rather than on next read.
+
+        Returns
+        -------
+        list
+            (view, acad_year, usage_id, curriculum_id) of the stale partitions.
+        """
+        with self.cache.connect() as cache_con:
+            partitions = cache_con.execute(select(t_partition)).all()
+        stale = []
+        for p in partitions:
+            view = VIEWS[p.view]
+            if self.stamp(con, view, p.acad_year, p.usage_id, p.curriculum_id) != p.stamp:
+                stale.append((p.view, p.acad_year, p.usage_id, p.curriculum_id))
+                if rematerialise:
+                    self.materialise(con, view, p.acad_year,
+                                     p.usage_id, p.curriculum_id)
+                else:
+                    with self._lock, self.cache.begin() as cache_con:
+                        self._drop(cache_con, t_partition.c.partition_id == p.partition_id)
+        return stale
+
+    def stamp(self, con, view, acad_year, usage_id, curriculum_id=None):
+        """
+        Returns a string summarising the state of a partition's base data.
+
+        Parameters are as for :py:meth:`read`; see :py:func:`partition_stamp`.
+        """
+        return partition_stamp(con, view, acad_year, usage_id, curriculum_id)
+
+    def watch(self, session):
+        """
+        Invalidates partitions whenever a session (or sessionmaker) flushes changes
+        to base tables, and again when its transaction ends.
+        """
+        event.listen(session, 'after_flush', self._after_flush)
+        event.listen(session, 'after_commit', self._after_commit)
+        event.listen(session, 'after_soft_rollback', self._after_rollback)
+
+    def _after_flush(self, session, flush_context):
+        changed = {}
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            table = getattr(obj, '__tablename__', None)
+            if table is None:
+                continue
+            curriculum_ids = changed.setdefault(table, set())
+            curriculum_ids.add(getattr(obj, 'curriculum_id', None))
+        written = session.info.setdefault(_WRITTEN, {})
+        for table, curriculum_ids in changed.items():
+            written.setdefault(table, set()).update(curriculum_ids)
+        self._invalidate_changes(changed)
+
+    def _after_commit(self, session):
+        # Also fires on releasing a SAVEPOINT, which is still inside the transaction
+        if not session.in_nested_transaction():
+            self._end_transaction(session)
+
+    def _after_rollback(self, session, previous_transaction):
+        if not previous_transaction.nested:
+            self._end_transaction(session)
+
+    def _end_transaction(self, session):
+        # Partitions read by others between our flush and now hold the old rows
+        self._invalidate_changes(session.info.pop(_WRITTEN, {}))
+
+    def _invalidate_changes(self, changed):
+        for table, curriculum_ids in changed.items():
+            if None in curriculum_ids:
+                self.invalidate(table)
+            else:
+                for curriculum_id in curriculum_ids:
+                    self.invalidate(table, curriculum_id=curriculum_id)
+
+    def _partition_id(self, view_name, acad_year, usage_id, curriculum_id):
+        cond = t_partition.c.curriculum_id == curriculum_id if curriculum_id is not None \
+            else t_partition.c.curriculum_id.is_(None)
+        with self.cache.connect() as cache_con:
+            return cache_con.execute(select(t_partition.c.partition_id)
+                                     .where(t_partition.c.view == view_name,
+                                            t_partition.c.acad_year == acad_year,
+                                            t_partition.c.usage_id == usage_id,
+                                            cond)).scalar()
+
+    def _drop(self, cache_con, condition):
+        dropped = cache_con.execute(select(t_partition.c.partition_id, t_partition.c.view)
+                                    .where(condition)).all()
+        for partition_id, view_name in dropped:
+            cache_con.execute(CACHE_TABLES[view_name].delete()
+                              .where(CACHE_TABLES[view_name].c._partition_id == partition_id))
+        cache_con.execute(t_partition.delete().where(condition))
+        return len(dropped)
+
+    @staticmethod
+    def _curriculum_key(view, curriculum_id):
+        # Views without a curriculum column are partitioned on year and usage only
+        return curriculum_id if view_column(view, 'curriculum_id') is not None else None
+
+
+def partition_stamp(con, view, acad_year, usage_id, curriculum_id=None):
+    """
+    Returns a string summarising the state of a partition's base data.
+
+    The stamp changes when the student number instances for the year and usage
+    change, or (for views computed from curricula) when the audit trail records a
+    change to the curriculum, or its cost weeks or calendar change. Views using
+    cost types, or the fee grid, also checksum those tables. Parameters are as for
+    :py:meth:`MaterialisedViews.read`.
+    """
+    view = view_table(view)
+    depends_on = VIEW_DEPENDENCIES[view.name]
+    stamp = {}
+    sn_instances = select(SNInstance.instance_id) \
+        .where(SNInstance.acad_year == acad_year, SNInstance.usage_id == usage_id)
+    stamp['sn'] = [str(v) for v in con.execute(
+        select(func.count(), func.max(SNInstance.input_datetime))
+        .where(SNInstance.instance_id.in_(sn_instances))).one()]
+    stamp['sn'].append(str(con.execute(select(func.count()).select_from(SN)
+                                       .where(SN.instance_id.in_(sn_instances))).scalar()))
+    if 'curriculum' in depends_on:
+        if curriculum_id is None:
+            curriculum_ids = select(Curriculum.curriculum_id) \
+                .where(Curriculum.acad_year == acad_year, Curriculum.usage_id == usage_id)
+            stamp['curricula'] = con.execute(select(func.count())
+                                             .select_from(curriculum_ids.subquery())).scalar()
+        else:
+            curriculum_ids = [curriculum_id]
+        stamp['curriculum'] = str(con.execute(
+            select(func.max(_audit_stamps(curriculum_ids).c.datestamp))).scalar())
+        # Cost weeks and calendars are edited without an audit entry
+        cost_ids = select(Cost.cost_id).join(Component, Cost.component_id == Component.component_id) \
+            .where(Component.curriculum_id.in_(curriculum_ids))
+        stamp['cost_week'] = [str(v) for v in con.execute(
+            select(func.count(), func.sum(CostWeek.acad_week), func.sum(CostWeek.cost_id * CostWeek.acad_week))
+            .where(CostWeek.cost_id.in_(cost_ids))).one()]
+        stamp['calendar_map'] = _checksum(con, select(CalendarMap.curriculum_id, CalendarMap.calendar_type,
+                                                      CalendarMap.acad_week, CalendarMap.celcat_week)
+                                          .where(CalendarMap.curriculum_id.in_(curriculum_ids))
+                                          .order_by(CalendarMap.curriculum_id, CalendarMap.calendar_type,
+                                                    CalendarMap.acad_week))
+    if 'cost_type' in depends_on:
+        stamp['cost_type'] = _checksum(con, select(CostType.__table__).order_by(CostType.cost_type))
+    if 'fee' in depends_on:
+        # The year's fee grid, and the fee category of each area of study
+        stamp['fee'] = _checksum(con, select(Fee.fee_cat_id, Fee.fee_status_id, Fee.session, Fee.gross_fee,
+                                             Fee.waiver)
+                                 .where(Fee.acad_year == acad_year)
+                                 .order_by(Fee.fee_cat_id, Fee.fee_status_id, Fee.session))
+        stamp['fee'] += _checksum(con, select(aos_code.aos_code, aos_code.fee_cat_id)
+                                  .order_by(aos_code.aos_code))
+    return json.dumps(stamp)
+
+
+def _checksum(con, stmt):
+    # Number of rows and a digest of them, for tables small enough to read in full
+    rows = con.execute(stmt).all()
+    return [len(rows), hashlib.sha1(repr([tuple(r) for r in rows]).encode()).hexdigest()]
+
+
+def _audit_stamps(curriculum_ids):
+    # Latest change to each audited table, for the curricula
+    parts = []
+    component_tbl = AUDIT_TABLES['component'][0]
+    component_ids = select(component_tbl.c.component_id) \
+        .where(component_tbl.c.curriculum_id.in_(curriculum_ids))
+    for tbl, _ in AUDIT_TABLES.values():
+        if 'curriculum_id' in tbl.c:
+            cond = tbl.c.curriculum_id.in_(curriculum_ids)
+        else:
+            cond = tbl.c.component_id.in_(component_ids)
+        parts.append(select(func.max(tbl.c.datestamp)
+                            .label('datestamp')).where(cond))
+    rel = t_audit_relationships
+    for rel_name, parent_name in RELATIONSHIP_PARENTS.items():
+        parent_tbl, parent_id = AUDIT_TABLES[parent_name]
+        parts.append(select(func.max(rel.c.datestamp).label('datestamp'))
+                     .where(rel.c.tbl == rel_name,
+                            rel.c.parent.in_(select(parent_tbl.c[parent_id])
+                                             .where(parent_tbl.c.curriculum_id.in_(curriculum_ids)))))
+    return union_all(*parts).subquery()
@@ -0,0 +1,137 @@
+"""
+Timing and query counting for statements run against the database.
+
+A :py:class:`Profiler` listens to an engine's cursor events and records the
+latency and row count of every statement, along with the phase of work it was
+run in. Phases are named by wrapping code in :py:meth:`Profiler.phase`, and nest.
+
+.. note::
+
+    Row counts come from the DBAPI cursor, so for SELECTs they depend on the driver;
+    pyodbc and sqlite3 report -1, which is recorded as None.
+"""
+import json
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from sqlalchemy import event
+
+Statement = namedtuple('Statement', ['phase', 'statement', 'seconds', 'rows', 'executemany'])
+
+
+class Profiler():
+    """
+    Records statements executed on one or more engines.
+    """
+
+    def __init__(self):
+        self.statements = []
+        self.phase_seconds = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def attach(self, engine):
+        """
+        Starts recording statements executed by an engine.
+        """
+        event.listen(engine, 'before_cursor_execute', self._before)
+        event.listen(engine, 'after_cursor_execute', self._after)
+
+    def detach(self, engine):
+        """
+        Stops recording statements executed by an engine.
+        """
+        event.remove(engine, 'before_cursor_execute', self._before)
+        event.remove(engine, 'after_cursor_execute', self._after)
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager labelling statements run inside it, and timing the whole phase.
+
+        Parameters
+        ----------
+        name : str
+            Name of the phase, e.g. 'load cost'. Nested phases are joined with ' > '.
+        """
+        stack = self._stack()
+        stack.append(name)
+        label = self.current_phase()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            with self._lock:
+                self.phase_seconds[label] = self.phase_seconds.get(
+                    label, 0) + elapsed
+
+    def current_phase(self):
+        """
+        Returns the label of the innermost phase in the current thread.
+        """
+        stack = self._stack()
+        return ' > '.join(stack) if stack else None
+
+    def summary(self):
+        """
+        Aggregates recorded statements by phase.
+
+        Returns
+        -------
+        list
+            Dictionaries with phase, statements, rows, seconds (in SQL), max_seconds
+            and wall_seconds (whole phase), slowest first.
+        """
+        phases = {}
+        for s in self.statements:
+            p = phases.setdefault(s.phase, {'phase': s.phase, 'statements': 0, 'rows': 0,
+                                            'seconds': 0.0, 'max_seconds': 0.0})
+            p['statements'] += 1
+            p['rows'] += s.rows or 0
+            p['seconds'] += s.seconds
+            p['max_seconds'] = max(p['max_seconds'], s.seconds)
+        for p in phases.values():
+            p['wall_seconds'] = self.phase_seconds.get(p['phase'])
+        return sorted(phases.values(), key=lambda p: p['seconds'], reverse=True)
+
+    def report(self):
+        """
+        Returns the summary as a printable table.
+        """
+        lines = [f"{'Phase':<40} {'Queries':>8} {'Rows':>8} {'SQL (s)':>9} {'Max (s)':>9} {'Wall (s)':>9}"]
+        for p in self.summary():
+            wall = '' if p['wall_seconds'] is None else f"{p['wall_seconds']:.3f}"
+            lines.append(f"{str(p['phase'] or '(none)'):<40.40} {p['statements']:>8} {p['rows']:>8} " +
+                         f"{p['seconds']:>9.3f} {p['max_seconds']:>9.3f} {wall:>9}")
+        total = sum(s.seconds for s in self.statements)
+        lines.append(f"{len(self.statements)} statements, {total:.3f}s in SQL, " +
+                     f"{time.perf_counter() - self._started:.3f}s elapsed.")
+        return '\n'.join(lines)
+
+    def write_json(self, path):
+        """
+        Writes every recorded statement, and the summary, to a JSON file.
+        """
+        trace = {'summary': self.summary(),
+                 'statements': [s._asdict() for s in self.statements]}
+        with open(path, 'w') as f:
+            json.dump(trace, f, indent=2)
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        context._cm_profile_start = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._cm_profile_start
+        rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        with self._lock:
+            self.statements.append(Statement(self.current_phase(), statement,
+                                             elapsed, rows, executemany))
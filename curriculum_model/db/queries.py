@@ -0,0 +1,89 @@
+"""
+Reusable queries against the reporting views.
+
+The views in :py:mod:`curriculum_model.db.schema.views` don't share column names
+for the same thing (``acad_year`` is ``Year`` in one, ``costc`` is ``CostC`` or
+``primary_costc`` in others), so :py:data:`VIEW_FILTERS` maps the common filter
+names to each view's columns, and :py:func:`view_query` builds a filtered SELECT.
+"""
+from sqlalchemy import select
+from curriculum_model.db.schema import views
+
+# Views by name in the DB
+VIEWS = {v.name: v for v in (views.FeeIncomeInputCostc,
+                             views.CurriculumHours,
+                             views.CurriculumNonPay,
+                             views.SNInterfacePivot)}
+
+# Common filter names to column names, for each view
+VIEW_FILTERS = {
+    views.FeeIncomeInputCostc.name: {'acad_year': 'Year',
+                                     'usage_id': 'usage_id',
+                                     'costc': 'CostC',
+                                     'aos_code': 'aos_code'},
+    views.CurriculumHours.name: {'acad_year': 'acad_year',
+                                 'usage_id': 'usage_id',
+                                 'curriculum_id': 'curriculum_id',
+                                 'costc': 'costc'},
+    views.CurriculumNonPay.name: {'acad_year': 'acad_year',
+                                  'usage_id': 'usage_id',
+                                  'curriculum_id': 'curriculum_id',
+                                  'costc': 'costc'},
+    views.SNInterfacePivot.name: {'acad_year': 'acad_year',
+                                  'usage_id': 'usage_id',
+                                  'costc': 'primary_costc',
+                                  'aos_code': 'primary_aos_code'},
+}
+
+
+def view_table(view):
+    """
+    Returns the Table for a view, given either its name or the Table itself.
+    """
+    if isinstance(view, str):
+        try:
+            return VIEWS[view]
+        except KeyError:
+            raise KeyError(f"{view} is not a reporting view; " +
+                           f"choose from {', '.join(VIEWS)}.")
+    return view
+
+
+def view_column(view, filter_name):
+    """
+    Returns the column of a view corresponding to a common filter name, or None.
+    """
+    view = view_table(view)
+    column_name = VIEW_FILTERS[view.name].get(filter_name)
+    return None if column_name is None else view.c[column_name]
+
+
+def view_query(view, **filters):
+    """
+    Builds a SELECT of every column in a view, filtered on common column names.
+
+    Parameters
+    ----------
+    view : str or Table
+        The view, or its name.
+    **filters
+        Values for acad_year, usage_id, curriculum_id, costc or aos_code. A list or
+        tuple filters on any of its values; None is ignored.
+
+    Returns
+    -------
+    Select
+    """
+    view = view_table(view)
+    stmt = select(view)
+    for filter_name, value in filters.items():
+        if value is None:
+            continue
+        col = view_column(view, filter_name)
+        if col is None:
+            raise ValueError(f"{view.name} can't be filtered on {filter_name}.")
+        if isinstance(value, (list, tuple, set)):
+            stmt = stmt.where(col.in_(list(value)))
+        else:
+            stmt = stmt.where(col == value)
+    return stmt
@@ -0,0 +1,248 @@
+"""
+Process-level cache of the small reference tables.
+
+Tables like ``cost_type`` or ``week`` are read by almost everything that costs,
+validates or reports on a curriculum, but they change a handful of times a year.
+:py:class:`RefCache` loads each one once into immutable records, indexed by
+primary key, so that lookups don't need a round-trip to the database.
+
+Cached tables are invalidated in one of three ways:
+
+* explicitly, with :py:meth:`RefCache.invalidate`;
+* after ``ttl`` seconds, if a TTL is given;
+* when the version stamp in the ``_parameter`` table changes. The stamp is only
+  read when the TTL expires, so with a version parameter the TTL becomes the
+  interval at which the (very cheap) version check is made.
+
+Anything that edits reference data should call :py:func:`bump_version`, so that
+other processes pick up the change. The process-wide :py:data:`reference_cache`
+checks the stamp every :py:data:`SHARED_TTL` seconds, so a long-running process
+(e.g. a long ``cm batch``) sees a bump within that time.
+"""
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import select
+from curriculum_model.db import table_map
+from curriculum_model.db.schema import Base, parameter
+
+# Tables small and static enough to be held in memory
+REFERENCE_TABLES = ['calendar',
+                    'cgroup_strand',
+                    'component_staffing',
+                    'cost_type',
+                    'fee_status',
+                    'hecos_code',
+                    'room_type',
+                    'tt_stage',
+                    'week']
+
+# Name of the row in _parameter holding the reference data version stamp
+VERSION_PARAMETER = 'refdata_version'
+
+# Seconds between version checks by the shared reference_cache
+SHARED_TTL = 60
+
+
+class RefTable():
+    """
+    Immutable snapshot of a reference table.
+
+    Rows are held as namedtuples (which use ``__slots__``), indexed by primary key.
+    Single-column keys are looked up by value, composite keys by tuple.
+
+    Parameters
+    ----------
+    name : str
+        Name of the table in the DB.
+    record : type
+        Namedtuple class of the rows.
+    rows : iterable
+        Rows to hold, as records.
+    key : list
+        Names of the primary key columns.
+    """
+    __slots__ = ('name', 'record', 'key', '_index', '_secondary')
+
+    def __init__(self, name, record, rows, key):
+        self.name = name
+        self.record = record
+        self.key = tuple(key)
+        if len(key) == 1:
+            self._index = {getattr(r, key[0]): r for r in rows}
+        else:
+            self._index = {tuple(getattr(r, k) for k in key): r for r in rows}
+        self._secondary = {}
+
+    def __getitem__(self, key):
+        return self._index[key]
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._index.values())
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, key, default=None):
+        return self._index.get(key, default)
+
+    def keys(self):
+        return self._index.keys()
+
+    def index_by(self, column):
+        """
+        Returns a dictionary of the values in a non-key column to tuples of records.
+
+        Built on first use, then kept with the snapshot.
+        """
+        if column not in self._secondary:
+            index = {}
+            for r in self._index.values():
+                index.setdefault(getattr(r, column), []).append(r)
+            self._secondary[column] = {k: tuple(v) for k, v in index.items()}
+        return self._secondary[column]
+
+
+class RefCache():
+    """
+    Cache of reference tables, loaded on first use.
+
+    Parameters
+    ----------
+    tables : list, optional
+        Names of the tables which may be cached. Defaults to REFERENCE_TABLES.
+    ttl : float, optional
+        Seconds after which a cached table is re-checked. None (the default) means
+        tables are held until invalidated.
+    version_parameter : str, optional
+        Name of the row in ``_parameter`` holding the version stamp. If None, tables
+        are reloaded every time the TTL expires.
+    """
+
+    def __init__(self, tables=None, ttl=None, version_parameter=VERSION_PARAMETER):
+        self.tables = list(REFERENCE_TABLES if tables is None else tables)
+        self.ttl = ttl
+        self.version_parameter = version_parameter
+        self._tm = table_map(Base)
+        self._records = {}
+        self._snapshots = {}
+        self._loaded_at = {}
+        self._versions = {}
+        self._lock = threading.RLock()
+
+    def table(self, con, name):
+        """
+        Returns the cached snapshot of a table, loading it if necessary.
+
+        Parameters
+        ----------
+        con : Session or Connection
+            Used to (re)load the table, if it isn't cached or has expired.
+        name : str
+            Name of the table in the DB.
+
+        Returns
+        -------
+        RefTable
+        """
+        if name not in self.tables:
+            raise KeyError(f"{name} is not a cached reference table.")
+        with self._lock:
+            if name in self._snapshots and not self._expired(con, name):
+                return self._snapshots[name]
+            return self._load(con, name)
+
+    def lookup(self, con, name, key, default=None):
+        """
+        Returns a single record from a cached table, by primary key.
+        """
+        return self.table(con, name).get(key, default)
+
+    def load_all(self, con):
+        """
+        Loads every cacheable table; useful to warm the cache at start-up.
+        """
+        return {name: self.table(con, name) for name in self.tables}
+
+    def invalidate(self, name=None):
+        """
+        Drops a table (or all tables, if name is None) from the cache.
+        """
+        with self._lock:
+            names = self.tables if name is None else [name]
+            for n in names:
+                self._snapshots.pop(n, None)
+                self._loaded_at.pop(n, None)
+                self._versions.pop(n, None)
+
+    def version(self, con):
+        """
+        Returns the current version stamp from the DB (None if there isn't one).
+        """
+        if self.version_parameter is None:
+            return None
+        stmt = select(parameter.value) \
+            .where(parameter.parameter == self.version_parameter)
+        return con.execute(stmt).scalar()
+
+    def _expired(self, con, name):
+        if self.ttl is None or time.monotonic() - self._loaded_at[name] < self.ttl:
+            return False
+        if self.version_parameter is not None:
+            current = self.version(con)
+            if current is not None and current == self._versions[name]:
+                # Nothing changed, so restart the clock without reloading
+                self._loaded_at[name] = time.monotonic()
+                return False
+        return True
+
+    def _load(self, con, name):
+        version = self.version(con)
+        tbl = self._tm[name].__table__
+        if name not in self._records:
+            self._records[name] = namedtuple(self._tm[name].__name__,
+                                             [c.name for c in tbl.columns])
+        record = self._records[name]
+        rows = [record(*row) for row in con.execute(select(tbl))]
+        snapshot = RefTable(name, record, rows,
+                            [c.name for c in tbl.primary_key])
+        self._snapshots[name] = snapshot
+        self._loaded_at[name] = time.monotonic()
+        self._versions[name] = version
+        return snapshot
+
+
+def bump_version(session, version_parameter=VERSION_PARAMETER):
+    """
+    Writes a new version stamp to ``_parameter``, invalidating every process's cache.
+
+    Doesn't commit; the stamp is written as part of the caller's transaction.
+
+    Parameters
+    ----------
+    session : Session
+        SQLAlchemy session.
+    version_parameter : str, optional
+        Name of the parameter row.
+
+    Returns
+    -------
+    str
+        The new version stamp.
+    """
+    stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    row = session.query(parameter).get(version_parameter)
+    if row is None:
+        session.add(parameter(parameter=version_parameter, value=stamp))
+    else:
+        row.value = stamp
+    session.flush()
+    return stamp
+
+
+# Shared cache for the process
+reference_cache = RefCache(ttl=SHARED_TTL)
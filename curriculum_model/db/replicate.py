@@ -0,0 +1,273 @@
+"""
+A local SQLite copy of a curriculum model database, kept current incrementally.
+
+:py:class:`Replicator` copies every table of the schema that exists in the
+source into the target, reading in chunks from a server-side cursor and writing
+with one executemany per chunk. Progress is kept in the target's
+``_replica_state`` table, so later runs only move what changed. How a table is
+brought up to date depends on its shape:
+
+``pk``
+    Audited tables (course, cost, ...; see :py:data:`~curriculum_model.db.audit.AUDIT_TABLES`),
+    which have a single integer key. Rows with keys above the high-water mark are
+    new. Rows named in the table's audit table since the last run are re-read,
+    which also removes those that were deleted.
+``child``
+    Tables keyed on a foreign key to a ``pk`` table (cost_week, the config
+    tables, timetabling memberships, ...). Rows are re-read for every parent
+    that changed in this run, and for parents named in ``audit_relationships``.
+``datestamp``
+    Append-only logs without a key (the audit tables). Rows from the last
+    datestamp seen onwards are re-read.
+``full``
+    Everything else, reloaded every time: reference tables, and tables whose
+    edits no audit table records (curriculum, student_number_instance, tt_tgroup,
+    week, ...), even if they have an integer key.
+
+Changes the audit trail doesn't see (e.g. edits made directly in the database,
+or audit history removed by compaction) are only picked up by a full refresh.
+"""
+from datetime import datetime
+from sqlalchemy import (Column, DateTime, Integer, MetaData, String, Table, delete, func, insert,
+                        inspect, select)
+from curriculum_model.db.audit import AUDIT_TABLES
+from curriculum_model.db.export import stream_chunks
+from curriculum_model.db.schema import audit as audit_schema
+
+FULL = 'full'
+PK = 'pk'
+CHILD = 'child'
+DATESTAMP = 'datestamp'
+
+# Maximum number of values in one IN clause
+IN_CHUNK = 1000
+
+state_metadata = MetaData()
+
+t_replica_state = Table(
+    '_replica_state', state_metadata,
+    Column('table_name', String(100), primary_key=True),
+    Column('strategy', String(20), nullable=False),
+    Column('high_water', Integer, comment="Highest key copied (pk tables)."),
+    Column('audit_mark', DateTime, comment="Latest audit (or log) datestamp seen."),
+    Column('synced_at', DateTime, nullable=False)
+)
+
+
+def strategy(tbl):
+    """
+    Returns how a table is kept up to date: one of 'pk', 'child', 'datestamp' or 'full'.
+    """
+    pk = list(tbl.primary_key)
+    # Edits are only found through the audit trail, so other keyed tables are reloaded
+    if tbl.name in AUDIT_TABLES and len(pk) == 1 and isinstance(pk[0].type, Integer):
+        return PK
+    if len(pk) > 1 and _parent_columns(tbl):
+        return CHILD
+    if not pk and 'datestamp' in tbl.c:
+        return DATESTAMP
+    return FULL
+
+
+class Replicator():
+    """
+    Copies tables from a source database into a local one.
+
+    Parameters
+    ----------
+    source : Engine
+        Database to copy from.
+    target : Engine
+        Database to copy to; usually SQLite.
+    metadata : MetaData
+        Schema of the tables to copy, e.g. ``Base.metadata``.
+    chunk_size : int, optional
+        Number of rows read and written at a time.
+    verbose_print : function, optional
+        Called with progress messages.
+    """
+
+    def __init__(self, source, target, metadata, chunk_size=5000, verbose_print=None):
+        self.source = source
+        self.target = target
+        self.metadata = metadata
+        self.chunk_size = chunk_size
+        self.verbose_print = verbose_print or (lambda msg: None)
+        self._source_tables = None
+
+    def tables(self):
+        """
+        Returns the schema's tables which exist in the source, parents first.
+        """
+        self._source_tables = set(inspect(self.source).get_table_names())
+        return [t for t in self.metadata.sorted_tables if t.name in self._source_tables]
+
+    def sync(self, full=False):
+        """
+        Brings the target up to date.
+
+        Parameters
+        ----------
+        full : bool, optional
+            Reload every table, ignoring the saved state.
+
+        Returns
+        -------
+        dict
+            Table name to (strategy, number of rows written).
+        """
+        tables = self.tables()
+        self.metadata.create_all(self.target, tables=tables)
+        state_metadata.create_all(self.target)
+        with self.target.connect() as con:
+            state = {r.table_name: r for r in con.execute(select(t_replica_state))}
+        # Changed parents in this run, by table; None means the whole table was reloaded
+        changed = {}
+        results = {}
+        with self.source.connect() as src:
+            for tbl in tables:
+                how = strategy(tbl)
+                previous = None if full else state.get(tbl.name)
+                if previous is not None and previous.strategy != how:
+                    previous = None
+                if how == PK:
+                    n, new_state = self._sync_pk(src, tbl, previous, changed)
+                elif how == CHILD:
+                    n, new_state = self._sync_child(src, tbl, previous, changed)
+                elif how == DATESTAMP:
+                    n, new_state = self._sync_datestamp(src, tbl, previous)
+                else:
+                    n, new_state = self._reload(src, tbl), {}
+                    changed[tbl.name] = None
+                self._save_state(tbl.name, how, new_state)
+                results[tbl.name] = (how, n)
+                self.verbose_print(f"{tbl.name}: {n} rows ({how}).")
+        return results
+
+    def _sync_pk(self, src, tbl, previous, changed):
+        pk = list(tbl.primary_key)[0]
+        audit_mark = self._audit_mark(src, tbl.name)
+        # Taken before copying, so rows inserted while copying are left for the next run
+        mark = src.execute(select(func.max(pk))).scalar()
+        if previous is None or previous.high_water is None:
+            with self.target.begin() as con:
+                con.execute(delete(tbl))
+            n = 0 if mark is None else self._copy(src, tbl, select(tbl).where(pk <= mark))
+            changed[tbl.name] = None
+            return n, {'high_water': mark, 'audit_mark': audit_mark}
+        high_water = previous.high_water
+        new_high = high_water if mark is None else max(mark, high_water)
+        n, added = 0, set()
+        if new_high > high_water:
+            # New rows, above the high-water mark
+            window = (pk > high_water, pk <= new_high)
+            added = set(src.execute(select(pk).where(*window)).scalars())
+            n = self._copy(src, tbl, select(tbl).where(*window).order_by(pk))
+        # Rows edited or deleted since the last run, according to the audit trail;
+        # re-reading a deleted row removes it
+        updated = {i for i in self._audited_ids(src, tbl.name, previous.audit_mark) - added
+                   if i <= new_high}
+        if updated:
+            n += self._replace(src, tbl, pk, updated)
+        changed[tbl.name] = added | updated
+        return n, {'high_water': new_high, 'audit_mark': audit_mark or previous.audit_mark}
+
+    def _sync_child(self, src, tbl, previous, changed):
+        rel = audit_schema.t_audit_relationships
+        rel_mark = src.execute(select(func.max(rel.c.datestamp))).scalar() \
+            if self._has_table(rel.name) else None
+        parents = _parent_columns(tbl)
+        if previous is None or any(changed.get(p, None) is None for p in parents.values()):
+            n = self._reload(src, tbl)
+            changed[tbl.name] = None
+            return n, {'audit_mark': rel_mark}
+        n = 0
+        for col_name, parent in parents.items():
+            ids = set(changed[parent])
+            if col_name == list(tbl.primary_key)[0].name and rel_mark is not None:
+                # Links added or removed without the parent changing
+                stmt = select(rel.c.parent).where(rel.c.tbl == tbl.name)
+                if previous.audit_mark is not None:
+                    stmt = stmt.where(rel.c.datestamp >= previous.audit_mark)
+                ids |= set(src.execute(stmt).scalars())
+            if ids:
+                n += self._replace(src, tbl, tbl.c[col_name], ids)
+        changed[tbl.name] = set()
+        return n, {'audit_mark': rel_mark or previous.audit_mark}
+
+    def _sync_datestamp(self, src, tbl, previous):
+        mark = src.execute(select(func.max(tbl.c.datestamp))).scalar()
+        if previous is None or previous.audit_mark is None:
+            return self._reload(src, tbl), {'audit_mark': mark}
+        # Rows stamped at the mark may have arrived after the last run, so re-read them too
+        with self.target.begin() as con:
+            con.execute(delete(tbl).where(tbl.c.datestamp >= previous.audit_mark))
+        n = self._copy(src, tbl, select(tbl).where(tbl.c.datestamp >= previous.audit_mark))
+        return n, {'audit_mark': mark or previous.audit_mark}
+
+    def _reload(self, src, tbl):
+        with self.target.begin() as con:
+            con.execute(delete(tbl))
+        return self._copy(src, tbl, select(tbl))
+
+    def _copy(self, src, tbl, stmt):
+        n = 0
+        for chunk in stream_chunks(src, stmt, self.chunk_size):
+            with self.target.begin() as con:
+                con.execute(insert(tbl), [dict(r._mapping) for r in chunk])
+            n += len(chunk)
+        return n
+
+    def _replace(self, src, tbl, col, ids):
+        self._delete_in(tbl, col, ids)
+        n = 0
+        for chunk in _chunks(sorted(ids)):
+            n += self._copy(src, tbl, select(tbl).where(col.in_(chunk)))
+        return n
+
+    def _delete_in(self, tbl, col, ids):
+        with self.target.begin() as con:
+            for chunk in _chunks(sorted(ids)):
+                con.execute(delete(tbl).where(col.in_(chunk)))
+
+    def _audit_mark(self, src, name):
+        if name not in AUDIT_TABLES or not self._has_table(AUDIT_TABLES[name][0].name):
+            return None
+        audit_tbl = AUDIT_TABLES[name][0]
+        return src.execute(select(func.max(audit_tbl.c.datestamp))).scalar()
+
+    def _audited_ids(self, src, name, since):
+        if name not in AUDIT_TABLES or not self._has_table(AUDIT_TABLES[name][0].name):
+            return set()
+        audit_tbl, id_col = AUDIT_TABLES[name]
+        stmt = select(audit_tbl.c[id_col]).distinct()
+        if since is not None:
+            stmt = stmt.where(audit_tbl.c.datestamp >= since)
+        return set(src.execute(stmt).scalars())
+
+    def _has_table(self, name):
+        return name in self._source_tables
+
+    def _save_state(self, name, how, values):
+        row = {'table_name': name, 'strategy': how, 'high_water': values.get('high_water'),
+               'audit_mark': values.get('audit_mark'), 'synced_at': datetime.now()}
+        with self.target.begin() as con:
+            con.execute(delete(t_replica_state).where(t_replica_state.c.table_name == name))
+            con.execute(insert(t_replica_state), [row])
+
+
+def _parent_columns(tbl):
+    """Primary key columns which reference a table with a single integer key, and that table."""
+    parents = {}
+    for col in tbl.primary_key:
+        for fk in col.foreign_keys:
+            parent_pk = list(fk.column.table.primary_key)
+            if len(parent_pk) == 1 and isinstance(parent_pk[0].type, Integer):
+                parents[col.name] = fk.column.table.name
+    return parents
+
+
+def _chunks(values):
+    values = list(values)
+    for i in range(0, len(values), IN_CHUNK):
+        yield values[i:i+IN_CHUNK]
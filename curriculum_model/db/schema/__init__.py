@@ -9,6 +9,7 @@ import sys
 import inspect
 
 Base = declarative_base()
+metadata = Base.metadata
 
 
 BoolField = BOOLEAN()
@@ -339,7 +340,7 @@ class CourseSession(Base):
     notes = Column(Unicode, server_default=text("(NULL)"),
                    comment="Additional notes on the course session.")
     curriculum_id = Column(
-        Integer, comment="The curriculum to which the course_session belongs.")
+        Integer, index=True, comment="The curriculum to which the course_session belongs.")
 
 
 class Curriculum(Base):
@@ -378,7 +379,7 @@ class Course(Base):
     combined_with = Column(
         String(50), comment="Optional - name of the minor pathway, if combined.")
     award = Column(String(10), comment="Short name of the final award.")
-    curriculum_id = Column(ForeignKey("curriculum.curriculum_id"))
+    curriculum_id = Column(ForeignKey("curriculum.curriculum_id"), index=True)
 
     def __repr__(self):
         return f"{self.course_id}-{self.pathway}: from curriculum {self.curriculum_id}"
@@ -433,7 +434,7 @@ class CalendarMap(Base):
     acad_week = Column(Integer, primary_key=True, nullable=False,
                        comment="Week of the academic calendar.")
     curriculum_id = Column(ForeignKey(
-        'curriculum.curriculum_id'), primary_key=True, nullable=False)
+        'curriculum.curriculum_id'), primary_key=True, nullable=False, index=True)
     term = Column(Integer, nullable=False,
                   comment="Epoch to which the week belongs.")
     description = Column(
@@ -456,7 +457,7 @@ class CGroup(Base):
     strand = Column(ForeignKey('cgroup_strand.strand_id'),
                     nullable=False, server_default=text("('MISC')"))
     notes = Column(String(8000), comment="Notes about the compoennt group.")
-    curriculum_id = Column(ForeignKey('curriculum.curriculum_id'))
+    curriculum_id = Column(ForeignKey('curriculum.curriculum_id'), index=True)
 
 
 class Component(Base):
@@ -477,7 +478,7 @@ class Component(Base):
         BoolField, nullable=False, comment="If the component should incur the additional Module Coordination cost.")
     hecos = Column(ForeignKey('hecos_code.hecos'))
     staffing_band = Column(Integer, ForeignKey('component_staffing.band_id'))
-    curriculum_id = Column(ForeignKey('curriculum.curriculum_id'))
+    curriculum_id = Column(ForeignKey('curriculum.curriculum_id'), index=True)
 
 
 class SN(Base):
@@ -509,7 +510,7 @@ class CGroupConfig(Base):
     cgroup_id = Column(ForeignKey('cgroup.cgroup_id'),
                        primary_key=True, nullable=False, index=True)
     component_id = Column(ForeignKey('component.component_id'),
-                          primary_key=True, nullable=False)
+                          primary_key=True, nullable=False, index=True)
     ratio = Column(Integer, nullable=False, server_default=text(
         "((1))"), comment="Number to control prediction of relative enrolment of students within the component group.")
 
@@ -523,7 +524,7 @@ class Cost(Base):
     cost_id = Column(Integer, primary_key=True,
                      comment="Unique identifier for the cost.")
     component_id = Column(ForeignKey(
-        'component.component_id'), nullable=False,)
+        'component.component_id'), nullable=False, index=True)
     room_type = Column(ForeignKey('room_type.room_type'))
     cost_type = Column(ForeignKey('cost_type.cost_type'), nullable=False)
     description = Column(String(200), nullable=False,
@@ -561,7 +562,7 @@ class TGroup(Base):
 
     tgroup_id = Column(Integer, primary_key=True,
                        comment="Unique identifier for the group.")
-    cost_id = Column(ForeignKey('cost.cost_id'), nullable=False)
+    cost_id = Column(ForeignKey('cost.cost_id'), nullable=False, index=True)
     notes = Column(String(
         255), comment="Notes for the benefit of either academic staff or timetabling staff.")
     room_type = Column(ForeignKey('room_type.room_type'))
@@ -599,7 +600,7 @@ class CourseConfig(Base):
     course_id = Column(Integer(), ForeignKey('course.course_id'),
                        primary_key=True, nullable=False)
     course_session_id = Column(Integer(), ForeignKey('course_session.course_session_id'),
-                               primary_key=True, nullable=False)
+                               primary_key=True, nullable=False, index=True)
 
 
 class CourseSessionConfig(Base):
@@ -610,7 +611,7 @@ class CourseSessionConfig(Base):
     course_session_id = Column(Integer(), ForeignKey('course_session.course_session_id'),
                                primary_key=True, nullable=False)
     cgroup_id = Column(Integer(), ForeignKey('cgroup.cgroup_id'),
-                       primary_key=True, nullable=False)
+                       primary_key=True, nullable=False, index=True)
 
 
 tbl_classes = inspect.getmembers(sys.modules[__name__], inspect.isclass)
@@ -0,0 +1,296 @@
+"""
+Copying a curriculum object, and everything below it, to one or more parents.
+
+:py:func:`read_subtree` reads the source a level at a time, with one query per
+table in the dependency chain however many objects the level holds.
+:py:func:`copy_subtree` then writes a copy under every target parent, again a
+level at a time: objects with generated keys are added and flushed together,
+and rows without them (cost weeks and config links) are written with one
+executemany per level. Copying to many parents therefore costs one read of the
+source plus the insert volume of the copies.
+
+The read needs nothing but SELECTs, and :py:func:`plan` previews the rows a copy
+will write from the subtree alone, so callers can end the read transaction,
+confirm, and then write everything in one short transaction.
+"""
+from contextlib import nullcontext
+from sqlalchemy import insert, select
+from curriculum_model.db import table_map
+from curriculum_model.db.schema import Base
+
+# Maximum number of values in one IN clause (SQL Server allows ~2100 parameters)
+IN_CHUNK = 1000
+
+
+def dependency_chain(key_only=False):
+    c = ['curriculum',
+         'course',
+         'course_config',
+         'course_session',
+         'course_session_config',
+         'cgroup',
+         'cgroup_config',
+         'component',
+         'cost',
+         'cost_week'
+         ]
+    key_objects = [1, 3, 5, 7]
+    if key_only:
+        return [o for i, o in enumerate(c) if i in key_objects]
+    else:
+        return c
+
+
+class Node():
+    """
+    A row of the source subtree, and the rows below it.
+
+    Parameters
+    ----------
+    table : str
+        Name of the table.
+    key : int
+        Primary key value, or None for tables without a single generated key.
+    data : dict
+        Values of the columns to copy.
+    """
+    __slots__ = ('table', 'key', 'data', 'children')
+
+    def __init__(self, table, key, data):
+        self.table = table
+        self.key = key
+        self.data = data
+        self.children = []
+
+    def count(self):
+        """
+        Returns the number of rows in this node's subtree, by table.
+        """
+        counts = {self.table: 1}
+        for child in self.children:
+            for t, n in child.count().items():
+                counts[t] = counts.get(t, 0) + n
+        return counts
+
+
+def read_subtree(con, obj_name, obj_ids):
+    """
+    Reads objects and everything below them in the dependency chain.
+
+    Objects linked through a config table are read once, but appear under each
+    parent they're linked to (and so are copied once per link).
+
+    Parameters
+    ----------
+    con : Session or Connection
+        Connection to the database.
+    obj_name : str
+        Name of the table of the objects; one of ``dependency_chain(True)``.
+    obj_ids : list
+        Primary keys of the objects.
+
+    Returns
+    -------
+    list
+        A :py:class:`Node` per object.
+    """
+    tm = table_map(Base)
+    dc = dependency_chain()
+    tbl = tm[obj_name].__table__
+    roots = [_node(obj_name, tbl, row) for row in _select_in(con, tbl, _pk(tbl), obj_ids)]
+    level = roots
+    name = obj_name
+    while level and dc.index(name) < len(dc) - 1:
+        parent_pk = _pk(tm[name].__table__)
+        by_key = {}
+        for node in level:
+            by_key.setdefault(node.key, []).append(node)
+        child_name = dc[dc.index(name) + 1]
+        if child_name.endswith('config'):
+            # Follow the links in the config table to the next object
+            config_tbl = tm[child_name].__table__
+            child_name = dc[dc.index(child_name) + 1]
+            child_tbl = tm[child_name].__table__
+            child_pk = _pk(child_tbl)
+            links = {}
+            for chunk in _chunks(list(by_key)):
+                for parent, child in con.execute(select(config_tbl.c[parent_pk.name],
+                                                        config_tbl.c[child_pk.name])
+                                                 .where(config_tbl.c[parent_pk.name].in_(chunk))):
+                    links.setdefault(child, []).append(parent)
+            rows = _select_in(con, child_tbl, child_pk, list(links))
+            parents_of = {row[child_pk.name]: links[row[child_pk.name]] for row in rows}
+        else:
+            child_tbl = tm[child_name].__table__
+            rows = _select_in(con, child_tbl, child_tbl.c[parent_pk.name], list(by_key))
+            parents_of = None
+        next_level = []
+        for row in rows:
+            parent_keys = parents_of[row[_pk(child_tbl).name]] if parents_of is not None \
+                else [row[parent_pk.name]]
+            for parent_key in parent_keys:
+                for parent in by_key[parent_key]:
+                    child = _node(child_name, child_tbl, row)
+                    parent.children.append(child)
+                    next_level.append(child)
+        level = next_level
+        name = child_name
+    return roots
+
+
+def plan(roots, parent_name, n_parents):
+    """
+    Returns the number of rows copying subtrees will write, by table.
+
+    Parameters
+    ----------
+    roots : list
+        Source subtrees, from :py:func:`read_subtree`.
+    parent_name : str
+        Name of the table of the parents.
+    n_parents : int
+        Number of parents being copied to.
+
+    Returns
+    -------
+    dict
+        Number of rows, by table, in dependency chain order.
+    """
+    dc = dependency_chain()
+    counts = {}
+    stack = [(node, parent_name) for node in roots]
+    while stack:
+        node, p_name = stack.pop()
+        counts[node.table] = counts.get(node.table, 0) + n_parents
+        if dc.index(node.table) - dc.index(p_name) == 2:
+            config_name = p_name + '_config'
+            counts[config_name] = counts.get(config_name, 0) + n_parents
+        stack.extend((child, node.table) for child in node.children)
+    return {t: counts[t] for t in dc if t in counts}
+
+
+def parent_curricula(con, parent_name, parent_ids):
+    """
+    Returns the curriculum of each parent, by ID.
+
+    Raises ValueError if any of the parents don't exist.
+    """
+    parent_tbl = table_map(Base)[parent_name].__table__
+    parent_pk = _pk(parent_tbl)
+    curricula = {}
+    for chunk in _chunks(list(parent_ids)):
+        curricula.update(con.execute(select(parent_pk, parent_tbl.c.curriculum_id)
+                                     .where(parent_pk.in_(chunk))).all())
+    missing = [i for i in parent_ids if i not in curricula]
+    if missing:
+        raise ValueError(f"No {parent_name} with ID {', '.join(str(i) for i in missing)}.")
+    return curricula
+
+
+def copy_subtree(session, roots, parent_name, parent_ids, audit=None, phase=None, verbose_print=None):
+    """
+    Writes a copy of each source subtree under each of several parents.
+
+    Nothing is committed.
+
+    Parameters
+    ----------
+    session : Session
+        SQLAlchemy session.
+    roots : list
+        Source subtrees, from :py:func:`read_subtree`.
+    parent_name : str
+        Name of the table of the parents (course, course_session, cgroup or component).
+    parent_ids : list
+        Primary keys of the parents.
+    audit : AuditWriter, optional
+        Records the new objects and config links, if given.
+    phase : function, optional
+        Called with a label for each level written, returning a context manager
+        (e.g. :py:meth:`curriculum_model.cli.Config.phase`).
+    verbose_print : function, optional
+        Called with progress messages.
+
+    Returns
+    -------
+    dict
+        Number of rows written, by table.
+    """
+    tm = table_map(Base)
+    dc = dependency_chain()
+    phase = phase or (lambda name: nullcontext())
+    curricula = parent_curricula(session, parent_name, parent_ids)
+    level = [(node, parent_name, pid, curricula[pid]) for pid in parent_ids for node in roots]
+    counts = {}
+    while level:
+        name = level[0][0].table
+        model = tm[name]
+        tbl = model.__table__
+        rows = []
+        for node, p_name, p_id, curriculum_id in level:
+            data = dict(node.data)
+            if 'curriculum_id' in data:
+                data['curriculum_id'] = curriculum_id
+            p_pk = _pk(tm[p_name].__table__).name
+            if p_pk in data:
+                data[p_pk] = p_id
+            rows.append(data)
+        with phase(f"insert {name}"):
+            if level[0][0].key is not None:
+                objs = [model(**data) for data in rows]
+                session.add_all(objs)
+                session.flush()
+                new_ids = [getattr(o, _pk(tbl).name) for o in objs]
+                if audit is not None:
+                    for o in objs:
+                        audit.record(o)
+            else:
+                session.execute(insert(tbl), rows)
+                new_ids = [None] * len(rows)
+        counts[name] = counts.get(name, 0) + len(rows)
+        # Config links, where the parent is two steps up the chain
+        p_name = level[0][1]
+        if dc.index(name) - dc.index(p_name) == 2:
+            config_name = p_name + '_config'
+            p_pk, c_pk = _pk(tm[p_name].__table__).name, _pk(tbl).name
+            links = [{p_pk: p_id, c_pk: new_id}
+                     for (_, _, p_id, _), new_id in zip(level, new_ids)]
+            with phase(f"insert {config_name}"):
+                session.execute(insert(tm[config_name].__table__), links)
+            counts[config_name] = counts.get(config_name, 0) + len(links)
+            if audit is not None:
+                for link in links:
+                    audit.relationship(config_name, link[p_pk], link[c_pk])
+        if verbose_print is not None:
+            verbose_print(f"Created {len(rows)} {name} rows.")
+        level = [(child, name, new_id, curriculum_id)
+                 for (node, _, _, curriculum_id), new_id in zip(level, new_ids)
+                 for child in node.children]
+    return counts
+
+
+def _pk(tbl):
+    return list(tbl.primary_key)[0]
+
+
+def _node(name, tbl, row):
+    pk = list(tbl.primary_key)
+    if len(pk) == 1:
+        return Node(name, row[pk[0].name],
+                    {c.name: row[c.name] for c in tbl.columns if c is not pk[0]})
+    # No generated key (cost_week), so copy every column
+    return Node(name, None, {c.name: row[c.name] for c in tbl.columns})
+
+
+def _select_in(con, tbl, col, values):
+    rows = []
+    for chunk in _chunks(values):
+        rows.extend(con.execute(select(tbl).where(col.in_(chunk))
+                                .order_by(*tbl.primary_key)).mappings().all())
+    return rows
+
+
+def _chunks(values):
+    values = list(values)
+    for i in range(0, len(values), IN_CHUNK):
+        yield values[i:i+IN_CHUNK]
@@ -0,0 +1,245 @@
+"""
+Seeded generator of synthetic curricula, for testing and benchmarking.
+
+:py:func:`generate` writes a curriculum of a given number of courses, with
+proportional numbers of course sessions, component groups, components, costs,
+cost weeks, student numbers and timetabling groups, using bulk inserts. The same
+seed always produces the same curriculum.
+
+Reference data (cost types, calendars, cost centres, etc.) is written by
+:py:func:`generate_reference`, which :py:func:`generate` calls if the
+database doesn't already have any.
+"""
+import random
+from datetime import datetime
+from sqlalchemy import func, select
+from curriculum_model.db.schema import (aos_code, Calendar, CalendarMap, CgroupStrand, CGroup, CGroupConfig,
+                                        Component, ComponentStaffing, Cost, Costc, CostType, CostWeek,
+                                        Course, CourseConfig, CourseSession, CourseSessionConfig, Curriculum,
+                                        Department, Fee, FeeCategory, FeeStatus, HecosCode, Module, RoomType,
+                                        SN, SNInstance, SNUsage, Stage, TGroup, TGroupMember, TGroupStaffing, Week)
+
+COST_TYPES = [
+    # cost_type, is_pay, is_contact, nominal_account
+    ('Teaching', True, True, 5110),
+    ('Assessment', True, False, 5110),
+    ('Coordination', True, False, 5110),
+    ('Accompanist', False, True, 5210),
+    ('Materials', False, False, 5320),
+]
+CALENDARS = ['Semester', 'Term', 'Year']
+ROOM_TYPES = ['Classroom', 'Lecture theatre', 'Practice room', 'Studio']
+FEE_STATUSES = [('H', 'Home', 'H'), ('EU', 'European', 'O'), ('OS', 'Overseas', 'O')]
+DEPARTMENTS = ['A', 'B', 'C', 'D']
+WEEKS_PER_YEAR = 52
+ACAD_WEEKS = 36
+USAGE_ID = 'Synthetic'
+
+
+def generate_reference(con, n_costc=20, seed=0):
+    """
+    Writes reference data for synthetic curricula.
+
+    Parameters
+    ----------
+    con : Session or Connection
+        Where to write.
+    n_costc : int, optional
+        Number of cost centres (and areas of study).
+    seed : int, optional
+        Seed for the random number generator.
+    """
+    rng = random.Random(seed)
+    _insert(con, Department, [{'department_id': d, 'description': f"Department {d}",
+                               'long_description': f"Department of {d}"} for d in DEPARTMENTS])
+    _insert(con, FeeCategory, [{'fee_cat_id': c, 'description': c}
+                               for c in ('H', 'O', 'UG')])
+    _insert(con, FeeStatus, [{'fee_status_id': s, 'status_description': d, 'home_overseas': c}
+                             for s, d, c in FEE_STATUSES])
+    _insert(con, aos_code, [{'aos_code': f"AOS{i:03}", 'description': f"Area of study {i}",
+                             'fee_cat_id': 'UG', 'department_id': DEPARTMENTS[i % len(DEPARTMENTS)],
+                             'pathway': f"Pathway {i}", 'valid_for_projection': True,
+                             'require_foundation': i % 5 == 0} for i in range(n_costc)])
+    _insert(con, Costc, [{'costc': f"CC{i:04}", 'description': f"Cost centre {i}", 'pathway': True,
+                          'primary_aos_code': f"AOS{i:03}",
+                          'department_id': DEPARTMENTS[i % len(DEPARTMENTS)]} for i in range(n_costc)])
+    _insert(con, CostType, [{'cost_type': t, 'cost_multiplier': 1, 'is_pay': p, 'is_contact': c,
+                             'nominal_account': a, 'is_assessing': t == 'Assessment',
+                             'is_assignment': False, 'is_taught': t == 'Teaching'}
+                            for t, p, c, a in COST_TYPES])
+    _insert(con, Calendar, [{'calendar_type': c, 'long_description': f"{c} calendar",
+                             'epoch_name': c.lower()} for c in CALENDARS])
+    _insert(con, CgroupStrand, [{'strand_id': s, 'description': f"Strand {s}"}
+                                for s in ('MISC', 'CORE', 'OPT')])
+    _insert(con, ComponentStaffing, [{'band_id': i, 'description': f"Band {i}",
+                                      'multiplier': 1 + i / 10} for i in range(1, 4)])
+    _insert(con, RoomType, [{'room_type': r, 'average_sq_metre': rng.randint(10, 200),
+                             'on_campus': True} for r in ROOM_TYPES])
+    _insert(con, HecosCode, [{'hecos': 100000 + i, 'code_name': f"Subject {i}"}
+                             for i in range(10)])
+    _insert(con, Stage, [{'stage': s, 'is_pending': p}
+                         for s, p in (('Enrolled', False), ('Applied', True))])
+    _insert(con, Week, [{'celcat_week': w, 'period': (w - 1) * 12 // WEEKS_PER_YEAR + 1}
+                        for w in range(1, WEEKS_PER_YEAR + 1)])
+    _insert(con, SNUsage, [{'usage_id': USAGE_ID,
+                            'description': "Synthetic student numbers"}])
+
+
+def generate(con, n_courses=50, seed=0, acad_year=2020, timetable=True):
+    """
+    Writes a synthetic curriculum, and student numbers for it.
+
+    Per course, there are on average 3 course sessions, 4 component groups per
+    session (a quarter of them shared with another session), 2 components per
+    group, 3 costs per component and 20 weeks per cost.
+
+    Parameters
+    ----------
+    con : Session or Connection
+        Where to write.
+    n_courses : int, optional
+        Number of courses in the curriculum.
+    seed : int, optional
+        Seed for the random number generator.
+    acad_year : int, optional
+        Academic year of the curriculum and student numbers.
+    timetable : bool, optional
+        Whether to also create timetabling groups, staffing and memberships.
+
+    Returns
+    -------
+    int
+        ID of the new curriculum.
+    """
+    rng = random.Random(seed)
+    if con.execute(select(func.count()).select_from(CostType.__table__)).scalar() == 0:
+        generate_reference(con, seed=seed)
+    costcs = con.execute(select(Costc.costc, Costc.primary_aos_code)).all()
+    ids = _Ids(con)
+    curriculum_id = ids.next(Curriculum)
+    _insert(con, Curriculum, [{'curriculum_id': curriculum_id, 'description': f"Synthetic curriculum {seed}",
+                               'created_date': datetime.now(), 'acad_year': acad_year,
+                               'usage_id': USAGE_ID, 'can_edit': True}])
+    rows = {t: [] for t in (Course, CourseConfig, CourseSession, CourseSessionConfig, CGroup, CGroupConfig,
+                            Component, Module, Cost, CostWeek, TGroup, TGroupMember, TGroupStaffing)}
+    modules = set()
+    aos_sessions = set()
+    n_staff = max(n_courses // 2, 5)
+    n_students = max(n_courses * 20, 50)
+    for _ in range(n_courses):
+        costc, aos = rng.choice(costcs)
+        course_id = ids.next(Course)
+        rows[Course].append({'course_id': course_id, 'aos_code': aos, 'pathway': f"Course {course_id}",
+                             'award': rng.choice(['BMus', 'BA', 'MA']), 'curriculum_id': curriculum_id})
+        shared = None
+        for session in range(1, rng.randint(2, 4) + 1):
+            aos_sessions.add((aos, session))
+            cs_id = ids.next(CourseSession)
+            rows[CourseSession].append({'course_session_id': cs_id, 'session': session, 'costc': costc,
+                                        'description': f"Course {course_id}", 'level': 3 + session,
+                                        'curriculum_id': curriculum_id})
+            rows[CourseConfig].append(
+                {'course_id': course_id, 'course_session_id': cs_id})
+            if shared is not None:
+                rows[CourseSessionConfig].append(
+                    {'course_session_id': cs_id, 'cgroup_id': shared})
+            for g in range(rng.randint(2, 5)):
+                cgroup_id = ids.next(CGroup)
+                rows[CGroup].append({'cgroup_id': cgroup_id, 'description': f"Group {cgroup_id}",
+                                     'strand': rng.choice(['CORE', 'OPT', 'MISC']),
+                                     'curriculum_id': curriculum_id})
+                rows[CourseSessionConfig].append(
+                    {'course_session_id': cs_id, 'cgroup_id': cgroup_id})
+                if g == 0 and rng.random() < 0.5:
+                    shared = cgroup_id
+                for _ in range(rng.randint(1, 3)):
+                    component_id = ids.next(Component)
+                    module_code = f"M{rng.randint(0, n_courses * 4):06}"
+                    modules.add(module_code)
+                    rows[Component].append({'component_id': component_id,
+                                            'description': f"Component {component_id}",
+                                            'module_code': module_code,
+                                            'calendar_type': rng.choice(CALENDARS),
+                                            'coordination_eligible': rng.random() < 0.5,
+                                            'hecos': 100000 + rng.randrange(10),
+                                            'staffing_band': rng.randint(1, 3),
+                                            'curriculum_id': curriculum_id})
+                    rows[CGroupConfig].append({'cgroup_id': cgroup_id, 'component_id': component_id,
+                                               'ratio': rng.randint(1, 3)})
+                    for _ in range(rng.randint(2, 4)):
+                        _cost(rng, ids, rows, component_id,
+                              n_staff if timetable else 0, n_students)
+    existing = set(con.execute(select(Module.module_code)).scalars())
+    rows[Module] = [{'module_code': m, 'credits': 20, 'description': f"Module {m}"}
+                    for m in sorted(modules - existing)]
+    for table, table_rows in rows.items():
+        _insert(con, table, table_rows)
+    _insert(con, CalendarMap, [{'acad_week': w, 'curriculum_id': curriculum_id, 'term': (w - 1) // 12 + 1,
+                                'calendar_type': c, 'celcat_week': w + offset}
+                               for c, offset in zip(CALENDARS, (2, 3, 4)) for w in range(1, ACAD_WEEKS + 1)])
+    _student_numbers(con, rng, ids, acad_year, aos_sessions)
+    return curriculum_id
+
+
+def _cost(rng, ids, rows, component_id, n_staff, n_students):
+    cost_id = ids.next(Cost)
+    cost_type, is_pay, _, _ = rng.choice(COST_TYPES)
+    rows[Cost].append({'cost_id': cost_id, 'component_id': component_id,
+                       'room_type': rng.choice(ROOM_TYPES), 'cost_type': cost_type,
+                       'description': f"{cost_type} {cost_id}", 'max_group_size': rng.choice([1, 5, 12, 20, 50]),
+                       'mins_per_group': rng.choice([30, 60, 90, 120]) if is_pay else 0,
+                       'cost_per_group': 0 if is_pay else rng.choice([20, 50, 100]),
+                       'number_of_staff': rng.choice([1, 1, 2]), 'tt_type': 1, 'unit_cost': 0})
+    start = rng.randint(1, ACAD_WEEKS - 20)
+    weeks = sorted(rng.sample(range(start, ACAD_WEEKS + 1),
+                              min(20, ACAD_WEEKS - start + 1)))
+    rows[CostWeek].extend({'cost_id': cost_id, 'acad_week': w}
+                          for w in weeks)
+    if n_staff == 0 or not is_pay:
+        return
+    for _ in range(rng.randint(1, 2)):
+        tgroup_id = ids.next(TGroup)
+        rows[TGroup].append({'tgroup_id': tgroup_id, 'cost_id': cost_id})
+        rows[TGroupStaffing].append({'tgroup_id': tgroup_id,
+                                     'staff_id': f"STAFF{rng.randrange(n_staff):05}"})
+        members = rng.sample(range(n_students), 8)
+        rows[TGroupMember].extend({'tgroup_id': tgroup_id, 'student_id': f"S{m:010}"}
+                                  for m in members)
+
+
+def _student_numbers(con, rng, ids, acad_year, aos_sessions):
+    instance_id = ids.next(SNInstance)
+    _insert(con, SNInstance, [{'instance_id': instance_id, 'acad_year': acad_year, 'usage_id': USAGE_ID,
+                               'input_datetime': datetime.now(), 'lcom_username': 'synthetic',
+                               'surpress': False}])
+    _insert(con, SN, [{'instance_id': instance_id, 'fee_status_id': fee_status, 'origin': 'Synthetic',
+                       'aos_code': aos, 'session': session, 'student_count': rng.randint(0, 40)}
+                      for aos, session in sorted(aos_sessions) for fee_status, _, _ in FEE_STATUSES])
+    existing = set(con.execute(select(Fee.fee_status_id, Fee.session)
+                               .where(Fee.acad_year == acad_year)).all())
+    _insert(con, Fee, [{'acad_year': acad_year, 'fee_cat_id': 'UG', 'fee_status_id': fee_status,
+                        'session': session, 'gross_fee': 9250 if fee_status == 'H' else 18000,
+                        'waiver': 0} for fee_status, _, _ in FEE_STATUSES for session in range(0, 5)
+                       if (fee_status, session) not in existing])
+
+
+class _Ids():
+    """Hands out primary keys following on from those already in the DB."""
+
+    def __init__(self, con):
+        self.con = con
+        self._next = {}
+
+    def next(self, model):
+        if model not in self._next:
+            pk = list(model.__table__.primary_key)[0]
+            current = self.con.execute(select(func.max(pk))).scalar()
+            self._next[model] = (current or 0) + 1
+        value = self._next[model]
+        self._next[model] += 1
+        return value
+
+
+def _insert(con, model, rows):
+    if rows:
+        con.execute(model.__table__.insert(), rows)
@@ -0,0 +1,486 @@
+"""
+A local HTTP/JSON service answering costing, fee income and student number queries
+from curricula held in memory.
+
+:py:class:`CostingService` loads each curriculum asked for once: its
+:py:class:`~curriculum_model.calc.frame.CurriculumFrame`, group counts and
+:py:class:`~curriculum_model.calc.costing.Costing`, all sharing one
+:py:class:`~curriculum_model.calc.encoding.Encoding` and one
+:py:class:`~curriculum_model.calc.rollup.RollupIndex`. Fee income and student
+numbers are held per (academic year, usage). Queries are then answered from
+numpy arrays, without touching the database.
+
+Everything held carries the stamp from
+:py:func:`~curriculum_model.db.matview.partition_stamp` it was built from. A
+background thread (:py:meth:`CostingService.start`) re-checks the stamps every
+``refresh_interval`` seconds, and rebuilds anything that has changed; the old
+state is served until the new one is ready. A change of reference data version
+drops everything held, since it was encoded with the old codebooks.
+
+:py:func:`make_server` puts the service behind an HTTP server which handles
+requests on a fixed pool of threads. Routes (all GET unless noted):
+
+``/health``
+    Status, and the curricula held.
+``/curricula/<id>/costs?by=costc|department|aos_code|total``
+    Hours and non-pay, by cost centre (the default) or rolled up.
+``/curricula/<id>/students``
+    Students per course session.
+``/income?acad_year=&usage_id=&by=aos_code|fee_status|department|total``
+    Students and gross fee income.
+``/students?acad_year=&usage_id=``
+    Student numbers by area of study and session.
+``POST /refresh``
+    Re-check every stamp now.
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+from sqlalchemy import select
+from curriculum_model.calc.costing import costing
+from curriculum_model.calc.encoding import Encoding
+from curriculum_model.calc.frame import load_curriculum
+from curriculum_model.calc.groups import group_counts, student_numbers
+from curriculum_model.calc.income import fee_income
+from curriculum_model.calc.rollup import load_rollup
+from curriculum_model.db.matview import partition_stamp
+from curriculum_model.db.refdata import RefCache
+from curriculum_model.db.schema import Curriculum, views
+
+
+class CurriculumState():
+    """
+    A curriculum held in memory, and its costing.
+
+    Parameters
+    ----------
+    curriculum_id, acad_year, usage_id
+        The curriculum, and the student numbers it's costed with.
+    frame : CurriculumFrame
+        The curriculum's structure.
+    costing : Costing
+        Hours and non-pay per cost.
+    stamp : str
+        Stamp of the data it was built from.
+    rollup : RollupIndex
+        Rollups of the reference data it was encoded with.
+    """
+
+    def __init__(self, curriculum_id, acad_year, usage_id, frame, costing, stamp, rollup):
+        self.curriculum_id = curriculum_id
+        self.acad_year = acad_year
+        self.usage_id = usage_id
+        self.frame = frame
+        self.costing = costing
+        self.stamp = stamp
+        self.rollup = rollup
+        self.loaded_at = time.time()
+
+    def summary(self):
+        """
+        Returns a description of the state, for the health route.
+        """
+        return {'curriculum_id': self.curriculum_id, 'acad_year': self.acad_year,
+                'usage_id': self.usage_id, 'costs': len(self.frame.cost),
+                'bytes': int(self.frame.nbytes()), 'loaded_at': self.loaded_at}
+
+
+class StudentState():
+    """
+    Student numbers and fee income for an academic year and usage.
+
+    Parameters
+    ----------
+    acad_year, usage_id
+        The student numbers' year and usage.
+    students : numpy.ndarray
+        Students by area of study code and session.
+    income : FeeIncome
+        Students and income by area of study, session and fee status.
+    stamp : str
+        Stamp of the data it was built from.
+    rollup : RollupIndex
+        Rollups of the reference data it was encoded with.
+    """
+
+    def __init__(self, acad_year, usage_id, students, income, stamp, rollup):
+        self.acad_year = acad_year
+        self.usage_id = usage_id
+        self.students = students
+        self.income = income
+        self.stamp = stamp
+        self.rollup = rollup
+        self.loaded_at = time.time()
+
+
+class CostingService():
+    """
+    Warm in-memory curricula and student numbers, answering queries by route.
+
+    Parameters
+    ----------
+    engine : Engine
+        The database. Each load or stamp check uses its own pooled connection.
+    refresh_interval : float, optional
+        Seconds between background checks for changes.
+    verbose_print : function, optional
+        Called with progress messages.
+    """
+
+    def __init__(self, engine, refresh_interval=60, verbose_print=None):
+        self.engine = engine
+        self.refresh_interval = refresh_interval
+        self.verbose_print = verbose_print or (lambda msg: None)
+        self.reference = RefCache()
+        self._curricula = {}
+        self._students = {}
+        self._rollup = None
+        # Locks of the keys being loaded
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def curriculum(self, curriculum_id):
+        """
+        Returns the state of a curriculum, loading it on first use.
+
+        Raises KeyError if there's no such curriculum.
+        """
+        return self._get_or_load('curriculum', self._curricula, curriculum_id,
+                                 lambda: self._load_curriculum(curriculum_id))
+
+    def student_state(self, acad_year, usage_id):
+        """
+        Returns the student numbers and fee income of a year and usage, loading them on first use.
+        """
+        return self._get_or_load('students', self._students, (acad_year, usage_id),
+                                 lambda: self._load_students(acad_year, usage_id))
+
+    def refresh(self):
+        """
+        Rebuilds anything whose stamp has changed.
+
+        Returns
+        -------
+        list
+            Descriptions of what was rebuilt.
+        """
+        refreshed = []
+        with self.engine.connect() as con:
+            self._check_reference(con, refreshed)
+            with self._lock:
+                students, curricula = list(self._students.items()), list(self._curricula.items())
+            for key, state in students:
+                if self._student_stamp(con, *key) != state.stamp:
+                    self._store(self._students, key, self._load_students(*key))
+                    refreshed.append(f"students {key[0]} {key[1]}")
+            for curriculum_id, state in curricula:
+                if self._curriculum_stamp(con, state.acad_year, state.usage_id,
+                                          curriculum_id) != state.stamp:
+                    try:
+                        self._store(self._curricula, curriculum_id, self._load_curriculum(curriculum_id))
+                    except KeyError:
+                        # Deleted
+                        with self._lock:
+                            self._curricula.pop(curriculum_id, None)
+                    refreshed.append(f"curriculum {curriculum_id}")
+        for msg in refreshed:
+            self.verbose_print(f"Refreshed {msg}.")
+        return refreshed
+
+    def start(self):
+        """
+        Starts refreshing in a background thread.
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name='cm-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background refresh, waiting for a refresh in progress to finish.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def handle(self, method, path, query=None):
+        """
+        Answers a request.
+
+        Parameters
+        ----------
+        method : str
+            'GET' or 'POST'.
+        path : str
+            Path of the route, e.g. ``/curricula/3/costs``.
+        query : dict, optional
+            Query string parameters, to single values.
+
+        Returns
+        -------
+        tuple
+            (HTTP status, JSON-serialisable body).
+        """
+        query = query or {}
+        parts = [p for p in path.split('/') if p]
+        try:
+            if method == 'POST' and parts == ['refresh']:
+                return 200, {'refreshed': self.refresh()}
+            if method != 'GET':
+                return 405, {'error': f"{method} not allowed."}
+            if parts == ['health']:
+                with self._lock:
+                    curricula, students = list(self._curricula.values()), list(self._students)
+                return 200, {'status': 'ok',
+                             'curricula': [s.summary() for s in curricula],
+                             'students': [list(k) for k in students]}
+            if len(parts) == 3 and parts[0] == 'curricula':
+                state = self.curriculum(_int(parts[1], 'curriculum ID'))
+                if parts[2] == 'costs':
+                    return 200, self._costs(state, query.get('by', 'costc'))
+                if parts[2] == 'students':
+                    return 200, self._course_session_students(state)
+            if parts in (['income'], ['students']):
+                state = self.student_state(_int(_required(query, 'acad_year'), 'acad_year'),
+                                           _required(query, 'usage_id'))
+                if parts == ['income']:
+                    return 200, self._income(state, query.get('by', 'aos_code'))
+                return 200, self._student_numbers(state)
+        except KeyError as e:
+            return 404, {'error': e.args[0] if e.args else "Not found."}
+        except ValueError as e:
+            return 400, {'error': str(e)}
+        return 404, {'error': f"No route {path}."}
+
+    def _costs(self, state, by):
+        c = state.costing
+        if by == 'total':
+            return c.totals()
+        if by == 'costc':
+            return c.by_costc()
+        rollups = {'department': ('costc_department', 'department'),
+                   'aos_code': ('costc_aos', 'aos_code')}
+        if by not in rollups:
+            raise ValueError(f"Can't group costs by {by}.")
+        name, book = rollups[by]
+        hours = state.rollup.rollup(c.allocation.by_costc(c.hours), name)
+        nonpay = state.rollup.rollup(c.allocation.by_costc(c.nonpay), name)
+        return _keyed(state.rollup.encoding[book], {'hours': hours, 'nonpay': nonpay})
+
+    def _income(self, state, by):
+        income = state.income
+        if by == 'total':
+            return income.totals()
+        if by in ('aos_code', 'fee_status'):
+            return income.by(by)
+        if by != 'department':
+            raise ValueError(f"Can't group income by {by}.")
+        students, amount = income.by_code('aos_code')
+        return _keyed(state.rollup.encoding['department'],
+                      {'students': state.rollup.rollup(students, 'aos_department'),
+                       'income': state.rollup.rollup(amount, 'aos_department')})
+
+    @staticmethod
+    def _course_session_students(state):
+        ids = state.frame.course_session.course_session_id
+        return {str(int(i)): float(n) for i, n in zip(ids, state.costing.counts.course_session)}
+
+    @staticmethod
+    def _student_numbers(state):
+        book = state.rollup.encoding['aos_code']
+        return {book.value(code): {str(session): float(state.students[code, session])
+                                   for session in np.flatnonzero(state.students[code])}
+                for code in np.flatnonzero(state.students.any(axis=1))}
+
+    def _load_curriculum(self, curriculum_id):
+        with self.engine.connect() as con:
+            rollup = self._check_reference(con)
+            curriculum = con.execute(select(Curriculum.acad_year, Curriculum.usage_id)
+                                     .where(Curriculum.curriculum_id == curriculum_id)).one_or_none()
+            if curriculum is None:
+                raise KeyError(f"No curriculum with ID {curriculum_id}.")
+            acad_year, usage_id = curriculum
+            # Stamp first, so that changes made during the load are picked up next time
+            stamp = self._curriculum_stamp(con, acad_year, usage_id, curriculum_id)
+            frame = load_curriculum(con, curriculum_id, encoding=rollup.encoding)
+            students = student_numbers(con, rollup.encoding, acad_year, usage_id)
+            state = CurriculumState(curriculum_id, acad_year, usage_id, frame,
+                                    costing(frame, group_counts(frame, students),
+                                            self.reference.table(con, 'cost_type')),
+                                    stamp, rollup)
+        self.verbose_print(f"Loaded curriculum {curriculum_id} ({len(frame.cost)} costs).")
+        return state
+
+    def _load_students(self, acad_year, usage_id):
+        with self.engine.connect() as con:
+            rollup = self._check_reference(con)
+            stamp = self._student_stamp(con, acad_year, usage_id)
+            return StudentState(acad_year, usage_id,
+                                student_numbers(con, rollup.encoding, acad_year, usage_id),
+                                fee_income(con, rollup.encoding, acad_year, usage_id), stamp, rollup)
+
+    def _curriculum_stamp(self, con, acad_year, usage_id, curriculum_id):
+        return partition_stamp(con, views.CurriculumHours, acad_year, usage_id, curriculum_id)
+
+    def _student_stamp(self, con, acad_year, usage_id):
+        return partition_stamp(con, views.FeeIncomeInputCostc, acad_year, usage_id)
+
+    def _check_reference(self, con, refreshed=None):
+        """
+        (Re)loads the encoding and rollup index if reference data has changed, and
+        returns the rollup index, which holds the encoding.
+        """
+        with self._lock:
+            version = self.reference.version(con)
+            if self._rollup is not None and version == self._rollup.version:
+                return self._rollup
+            self.reference.invalidate()
+            self._rollup = load_rollup(con, Encoding.load(con))
+            if self._curricula or self._students:
+                # Everything held was encoded with the old codebooks, whichever load
+                # noticed the change
+                self._curricula.clear()
+                self._students.clear()
+                self.verbose_print("Reference data changed; dropped everything held.")
+                if refreshed is not None:
+                    refreshed.append("reference data")
+            return self._rollup
+
+    def _store(self, held, key, state):
+        """Holds a state, unless the reference data changed while it was being built."""
+        with self._lock:
+            if state.rollup is self._rollup:
+                held[key] = state
+
+    def _get_or_load(self, kind, held, key, load):
+        state = held.get(key)
+        if state is not None:
+            return state
+        # One lock per key being loaded, so that concurrent requests load it once
+        lock_key = (kind, key)
+        with self._lock:
+            lock = self._loading.setdefault(lock_key, threading.Lock())
+        try:
+            with lock:
+                state = held.get(key)
+                if state is None:
+                    state = load()
+                    self._store(held, key, state)
+        finally:
+            with self._lock:
+                if self._loading.get(lock_key) is lock:
+                    del self._loading[lock_key]
+        return state
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving what's held; try again next time
+                self.verbose_print(f"Refresh failed: {e}")
+
+
+def make_server(service, host='127.0.0.1', port=8080, max_workers=8):
+    """
+    Returns an HTTP server for a service; call ``serve_forever()`` to run it.
+
+    Parameters
+    ----------
+    service : CostingService
+        The service answering requests.
+    host : str, optional
+        Address to listen on.
+    port : int, optional
+        Port to listen on; 0 picks a free one (see ``server.server_address``).
+    max_workers : int, optional
+        Number of threads handling requests.
+
+    Returns
+    -------
+    HTTPServer
+    """
+    handler = type('Handler', (_Handler,), {'service': service})
+    return _PooledHTTPServer((host, port), handler, max_workers)
+
+
+class _PooledHTTPServer(HTTPServer):
+    """HTTP server handing each request to a fixed pool of threads."""
+
+    def __init__(self, address, handler, max_workers):
+        super().__init__(address, handler)
+        self._pool = ThreadPoolExecutor(max_workers, thread_name_prefix='cm-serve')
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service = None
+
+    def do_GET(self):
+        self._respond('GET')
+
+    def do_POST(self):
+        self._respond('POST')
+
+    def _respond(self, method):
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            status, body = self.service.handle(method, url.path, query)
+        except Exception as e:
+            status, body = 500, {'error': str(e)}
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Requests are logged through the service's verbose_print
+        self.service.verbose_print(f"{self.address_string()} {format % args}")
+
+
+def _keyed(book, measures):
+    """Dictionary of codebook value to measures, for codes with any non-zero measure."""
+    nonzero = np.zeros(len(next(iter(measures.values()))), dtype=bool)
+    for values in measures.values():
+        nonzero |= values != 0
+    return {book.value(code): {m: float(v[code]) for m, v in measures.items()}
+            for code in np.flatnonzero(nonzero)}
+
+
+def _required(query, name):
+    if name not in query:
+        raise ValueError(f"{name} is required.")
+    return query[name]
+
+
+def _int(value, name):
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a whole number.")
@@ -0,0 +1,149 @@
+"""
+Fixtures for the test suite.
+
+The schema is created and seeded with a synthetic curriculum (from
+:py:mod:`curriculum_model.db.synthetic`) once per run, into a SQLite template
+file. Each worker (one per ``pytest-xdist`` process, or just one without it)
+tests against its own copy of the template, and each test runs inside a
+transaction that is rolled back afterwards, so tests neither see each other's
+changes nor depend on the order they run in, e.g. ::
+
+    pytest tests -n auto
+
+Tests get the database through the ``db`` fixture: as an argument for plain
+test functions, or on ``self`` for ``unittest.TestCase`` classes marked with
+``@pytest.mark.usefixtures("db")`` (which skip themselves when run by plain
+unittest, without the fixture). Code under test may commit or roll back the
+session; it is working in a SAVEPOINT, which is restarted each time.
+"""
+import os
+import shutil
+import threading
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+from curriculum_model.db import schema
+from curriculum_model.db.synthetic import USAGE_ID, generate
+
+# Size and seed of the template's synthetic curriculum
+TEMPLATE_COURSES = 20
+TEMPLATE_SEED = 1
+
+
+class TestDatabase():
+    """
+    A test's view of the template database.
+
+    Attributes
+    ----------
+    con : Connection
+        Connection, inside the test's transaction.
+    session : Session
+        ORM session on ``con``.
+    curriculum_id : int
+        ID of the template's synthetic curriculum.
+    usage_id : str
+        Student number usage of the synthetic curriculum.
+    """
+    __test__ = False
+
+    def __init__(self, con, session, curriculum_id):
+        self.con = con
+        self.session = session
+        self.curriculum_id = curriculum_id
+        self.usage_id = USAGE_ID
+
+
+def sqlite_engine(path):
+    """
+    Returns an engine on a SQLite file, with foreign keys enforced and working SAVEPOINTs.
+
+    pysqlite starts and ends transactions itself, which breaks SAVEPOINT; it is
+    switched off so SQLAlchemy emits BEGIN.
+    """
+    engine = create_engine(f"sqlite:///{path}")
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_con, record):
+        dbapi_con.isolation_level = None
+        dbapi_con.execute("pragma foreign_keys=on")
+
+    @event.listens_for(engine, "begin")
+    def begin(con):
+        con.exec_driver_sql("BEGIN")
+    return engine
+
+
+def build_template(path):
+    """
+    Builds the seeded template at ``path``, returning the ID of its curriculum.
+
+    It is built under a temporary name and renamed, so other workers never copy
+    half a file; workers racing to build it each produce the same database.
+    """
+    building = f"{path}.{os.getpid()}.{threading.get_ident()}"
+    engine = create_engine(f"sqlite:///{building}")
+    schema.Base.metadata.create_all(engine)
+    with engine.begin() as con:
+        curriculum_id = generate(con, TEMPLATE_COURSES, seed=TEMPLATE_SEED)
+    engine.dispose()
+    os.replace(building, path)
+    return curriculum_id
+
+
+@pytest.fixture(scope="session")
+def template_db(tmp_path_factory):
+    """
+    Path of the seeded template, and the ID of its curriculum; built once per run.
+    """
+    root = tmp_path_factory.getbasetemp()
+    if os.environ.get("PYTEST_XDIST_WORKER"):
+        # Workers share the parent of their own temporary directories
+        root = root.parent
+    path = root / "template.db"
+    if path.exists():
+        engine = create_engine(f"sqlite:///{path}")
+        with engine.connect() as con:
+            curriculum_id = con.exec_driver_sql("SELECT min(curriculum_id) FROM curriculum").scalar()
+        engine.dispose()
+    else:
+        curriculum_id = build_template(path)
+    return path, curriculum_id
+
+
+@pytest.fixture(scope="session")
+def db_engine(template_db, tmp_path_factory):
+    """
+    Engine on this worker's copy of the template.
+    """
+    path, _ = template_db
+    clone = tmp_path_factory.mktemp("db") / "test.db"
+    shutil.copyfile(path, clone)
+    engine = sqlite_engine(clone)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db(request, db_engine, template_db):
+    """
+    The template database, inside a transaction that is rolled back after the test.
+    """
+    con = db_engine.connect()
+    transaction = con.begin()
+    session = Session(bind=con)
+    session.begin_nested()
+
+    @event.listens_for(session, "after_transaction_end")
+    def restart_savepoint(session, ended):
+        if ended.nested and not ended._parent.nested:
+            session.expire_all()
+            session.begin_nested()
+
+    database = TestDatabase(con, session, template_db[1])
+    if request.instance is not None:
+        request.instance.db = database
+    yield database
+    session.close()
+    transaction.rollback()
+    con.close()
@@ -0,0 +1,54 @@
+"""
+Checks AsyncDB runs view queries concurrently, with async and blocking drivers
+"""
+import asyncio
+import os
+import tempfile
+import unittest
+from curriculum_model.db import schema
+from curriculum_model.db.aio import AsyncDB, fetch_views
+from curriculum_model.db.schema import views
+from sqlalchemy import create_engine
+
+try:
+    import aiosqlite
+except ImportError:
+    aiosqlite = None
+
+
+class TestAsyncDB(unittest.TestCase):
+
+    def setUp(self):
+        fldr = tempfile.mkdtemp()
+        db_path = os.path.join(fldr, "test.db")
+        self.config = os.path.join(fldr, "config.ini")
+        with open(self.config, "w") as f:
+            f.write(f"[TEST]\nuri = sqlite:///{db_path}\n" +
+                    f"[TEST_ASYNC]\nuri = sqlite+aiosqlite:///{db_path}\n")
+        engine = create_engine(f"sqlite:///{db_path}")
+        schema.Base.metadata.create_all(engine)
+        with engine.begin() as con:
+            con.execute(views.CurriculumHours.insert(),
+                        [{'usage_id': 'Main', 'acad_year': y, 'curriculum_id': 1,
+                          'costc': 'CC0001', 'hours': 10} for y in (2020, 2021, 2022)])
+        engine.dispose()
+
+    def fetch(self, section):
+        async def run():
+            async with AsyncDB(config_section=section, config_name=self.config) as adb:
+                return await fetch_views(adb, [2020, 2021], 'Main', ['v_fm_curriculum_hours'])
+        return asyncio.run(run())
+
+    def test_threaded(self):
+        result = self.fetch("TEST")
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result[('v_fm_curriculum_hours', 2021)][0].acad_year, 2021)
+
+    @unittest.skipIf(aiosqlite is None, "aiosqlite not installed")
+    def test_async_driver(self):
+        result = self.fetch("TEST_ASYNC")
+        self.assertEqual(len(result[('v_fm_curriculum_hours', 2020)]), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
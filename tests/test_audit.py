@@ -0,0 +1,57 @@
+"""
+Checks audit events are written in batches and that compaction keeps a snapshot per object
+"""
+import unittest
+from datetime import datetime
+from curriculum_model.db import schema
+from curriculum_model.db.audit import AuditWriter, compact, UPDATE
+from curriculum_model.db.schema.audit import t_audit_course, t_audit_relationships
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.orm import sessionmaker
+
+
+class TestAudit(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:", echo=False)
+        Session = sessionmaker(bind=self.engine)
+        self.session = Session()
+        schema.Base.metadata.create_all(self.engine)
+
+    def count(self, tbl):
+        with self.engine.connect() as con:
+            return con.execute(select(func.count()).select_from(tbl)).scalar()
+
+    def test_writer(self):
+        course = schema.Course(course_id=1, pathway="Jazz", curriculum_id=1)
+        with AuditWriter(self.session, username="test", batch_size=3) as writer:
+            writer.record(course)
+            writer.relationship('course_config', 1, 2)
+            self.assertEqual(self.session.execute(
+                select(func.count()).select_from(t_audit_course)).scalar(), 0)
+            writer.record(course, UPDATE)
+            # Third event reaches the batch size
+            self.assertEqual(self.session.execute(
+                select(func.count()).select_from(t_audit_course)).scalar(), 2)
+            writer.relationship('course_config', 1, 3)
+        self.session.commit()
+        self.assertEqual(self.count(t_audit_relationships), 2)
+
+    def test_compact(self):
+        rows = [{'course_id': i, 'pathway': f"v{d}", 'curriculum_id': 1,
+                 'datestamp': datetime(2020, 1, d), 'cmd': 'update'}
+                for i in range(1, 4) for d in range(1, 6)]
+        with self.engine.begin() as con:
+            con.execute(t_audit_course.insert(), rows)
+        removed = compact(self.engine, datetime(2020, 1, 4), chunk_size=2)
+        # Each course keeps its 3rd Jan snapshot, plus the 4th and 5th
+        self.assertEqual(removed['audit_course'], 6)
+        with self.engine.connect() as con:
+            kept = con.execute(select(t_audit_course.c.pathway)
+                               .where(t_audit_course.c.course_id == 2)
+                               .order_by(t_audit_course.c.datestamp)).scalars().all()
+        self.assertEqual(kept, ['v3', 'v4', 'v5'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Checks cm batch runs many commands over one connection
+"""
+import io
+import os
+import tempfile
+import unittest
+import click
+from curriculum_model.cli import Config, cm
+from curriculum_model.cli.batch import _parse, batch
+from curriculum_model.db import DB, schema
+from curriculum_model.db.synthetic import generate
+from sqlalchemy import func, select
+
+
+class _TestConfig(Config):
+    """Config whose connections go to a temporary SQLite file."""
+
+    def __init__(self, config_name):
+        super().__init__(environment='TEST')
+        self.config_name = config_name
+        self.opened = 0
+
+    def db(self):
+        if self.shared_db is None:
+            self.opened += 1
+            return DB(False, self.environment, self.config_name)
+        return super().db()
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.ini = os.path.join(self.dir.name, 'config.ini')
+        with open(self.ini, 'w') as f:
+            f.write(f"[TEST]\nuri=sqlite:///{os.path.join(self.dir.name, 'cm.db')}\n")
+        self.config = _TestConfig(self.ini)
+        with self.config.db() as db:
+            session = db.session()
+            generate(session, 4, seed=3, timetable=False)
+            session.commit()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def run_batch(self, text, **kwargs):
+        path = os.path.join(self.dir.name, 'batch.txt')
+        with open(path, 'w') as f:
+            f.write(text)
+        ctx = click.Context(cm, obj=self.config)
+        with ctx, open(path) as f:
+            ctx.invoke(batch, file=f, transaction=kwargs.get('transaction', False),
+                       keep_going=kwargs.get('keep_going', False))
+
+    def sessions(self):
+        with self.config.db() as db:
+            return db.con.execute(select(func.count()).select_from(schema.CourseSession)).scalar()
+
+    def test_parse(self):
+        lines = _parse(io.StringIO("# copies\n\ncopy course_session 1 2 -y  # first\n"
+                                   "workload 1 -o 'a file.csv'\n"))
+        self.assertEqual(lines, [(3, ['copy', 'course_session', '1', '2', '-y']),
+                                 (4, ['workload', '1', '-o', 'a file.csv'])])
+        with self.assertRaises(ValueError):
+            _parse(io.StringIO("batch other.txt\n"))
+
+    def test_one_connection(self):
+        before = self.sessions()
+        opened = self.config.opened
+        self.run_batch("copy course_session 1 2 -y\ncopy course_session 1 3 -y\nworkload 1\n")
+        self.assertEqual(self.config.opened, opened + 1)
+        self.assertIsNone(self.config.shared_db)
+        self.assertEqual(self.sessions(), before + 2)
+
+    def test_transaction_rolls_back(self):
+        before = self.sessions()
+        with self.assertRaises(click.ClickException):
+            self.run_batch("copy course_session 1 2 -y\ncopy course_session 1 999 -y\n",
+                           transaction=True)
+        self.assertEqual(self.sessions(), before)
+
+    def test_keep_going(self):
+        before = self.sessions()
+        with self.assertRaises(click.ClickException) as cm_error:
+            self.run_batch("copy course_session 1 999 -y\ncopy course_session 1 2 -y\n",
+                           keep_going=True)
+        self.assertIn("1 of 2", cm_error.exception.format_message())
+        self.assertEqual(self.sessions(), before + 1)
+
+    def test_no_prompts(self):
+        before = self.sessions()
+        with self.assertRaises(click.ClickException) as cm_error:
+            self.run_batch("copy course_session 1 2 -y\ncopy course_session 1 3\n", transaction=True)
+        self.assertIn("--yes", cm_error.exception.format_message())
+        self.assertEqual(self.sessions(), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+"""
+Checks cached SELECTs match the database, and are dropped by writes
+"""
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime
+import pytest
+from curriculum_model.db import schema
+from curriculum_model.db.cache import QueryCache
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.orm import Session
+from tests.conftest import sqlite_engine
+
+
+@pytest.mark.usefixtures("db")
+class TestQueryCache(unittest.TestCase):
+    db = None
+
+    def setUp(self):
+        if self.db is None:
+            self.skipTest("needs the db fixture from conftest.py; run with pytest")
+        self.cache = QueryCache(max_size=3)
+        self.session = self.cache.attach(self.db.session)
+        self.statements = []
+        event.listen(self.db.con, 'before_cursor_execute', self.record)
+
+    def tearDown(self):
+        event.remove(self.db.con, 'before_cursor_execute', self.record)
+        self.cache.detach(self.session)
+
+    def record(self, *args):
+        self.statements.append(args[2])
+
+    def curriculum(self):
+        stmt = select(schema.Curriculum).where(schema.Curriculum.curriculum_id == self.db.curriculum_id)
+        return self.session.execute(stmt).scalar_one()
+
+    def test_repeats_from_memory(self):
+        first = self.curriculum()
+        n = len(self.statements)
+        self.assertIs(self.curriculum(), first)
+        costcs = self.session.query(schema.Costc.costc).order_by(schema.Costc.costc).all()
+        self.assertEqual(self.session.query(schema.Costc.costc).order_by(schema.Costc.costc).all(), costcs)
+        self.assertEqual(len(self.statements), n + 1)
+        self.assertEqual(self.cache.stats()['hits'], 2)
+        self.assertEqual(self.cache.stats()['misses'], 2)
+        # Different parameters are different entries
+        self.assertIsNone(self.session.execute(select(schema.Curriculum)
+                                               .where(schema.Curriculum.curriculum_id == -1)).scalar())
+        self.assertEqual(self.cache.stats()['misses'], 3)
+
+    def test_flush_invalidates(self):
+        course = self.session.query(schema.Course).order_by(schema.Course.course_id).first()
+        self.curriculum()
+        course.pathway = "Changed"
+        self.session.flush()
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(self.session.query(schema.Course.pathway)
+                         .filter_by(course_id=course.course_id).scalar(), "Changed")
+        # Tables written in the open transaction bypass the cache
+        self.assertEqual(len(self.cache), 1)
+
+    def test_bulk_update_and_rollback(self):
+        self.curriculum()
+        self.session.execute(update(schema.Curriculum).values(description="Bulk"))
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.curriculum().description, "Bulk")
+        self.session.rollback()
+        self.assertNotEqual(self.curriculum().description, "Bulk")
+        # The fixture only rolled back a SAVEPOINT, so the table is still written
+        self.assertEqual(len(self.cache), 0)
+
+    def test_views_invalidated_by_any_write(self):
+        from curriculum_model.db.schema.views import CurriculumHours
+        self.assertEqual(self.cache._tables(select(CurriculumHours)), {None})
+        self.cache._store('view', None, {None})
+        self.cache._store('curriculum', None, {'curriculum'})
+        self.assertEqual(self.cache.invalidate(['course']), 1)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_limits(self):
+        for i in range(5):
+            self.session.execute(select(schema.Curriculum).where(schema.Curriculum.curriculum_id == i)).all()
+        self.assertEqual(len(self.cache), 3)
+        self.assertEqual(self.cache.stats()['evictions'], 2)
+        self.cache.ttl = 0.01
+        time.sleep(0.02)
+        self.session.execute(select(schema.Curriculum).where(schema.Curriculum.curriculum_id == 4)).all()
+        self.assertEqual(self.cache.stats()['hits'], 0)
+        uncached = select(schema.Curriculum).execution_options(query_cache=False)
+        self.session.execute(uncached).all()
+        self.assertEqual(self.cache.stats()['misses'], 6)
+
+    def test_shared_between_sessions(self):
+        first = self.curriculum()
+        other = self.cache.attach(Session(bind=self.db.con))
+        try:
+            again = other.execute(select(schema.Curriculum)
+                                  .where(schema.Curriculum.curriculum_id == self.db.curriculum_id)).scalar_one()
+        finally:
+            self.cache.detach(other)
+            other.close()
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertIsNot(again, first)
+        self.assertEqual(again.description, first.description)
+
+
+class TestCommitInvalidates(unittest.TestCase):
+    """Sessions on separate connections, as in an application"""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.engine = sqlite_engine(os.path.join(self.dir.name, 'cm.db'))
+        schema.Base.metadata.create_all(self.engine)
+        with self.engine.begin() as con:
+            con.execute(insert(schema.Curriculum), [{'curriculum_id': 1, 'description': "old",
+                                                     'created_date': datetime.now(), 'acad_year': 2020}])
+        self.cache = QueryCache()
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.dir.cleanup()
+
+    def description(self, session):
+        return session.execute(select(schema.Curriculum.description)
+                               .where(schema.Curriculum.curriculum_id == 1)).scalar()
+
+    def test_read_between_flush_and_commit(self):
+        writer = self.cache.attach(Session(self.engine))
+        writer.get(schema.Curriculum, 1).description = "new"
+        writer.flush()
+        # Another session reads (and caches) the committed row before the commit
+        with self.cache.attach(Session(self.engine)) as reader:
+            self.assertEqual(self.description(reader), "old")
+        writer.commit()
+        writer.close()
+        with self.cache.attach(Session(self.engine)) as reader:
+            self.assertEqual(self.description(reader), "new")
+        self.assertEqual(self.cache.stats()['hits'], 0)
+
+
+    def test_savepoint_rollback(self):
+        writer = self.cache.attach(Session(self.engine))
+        writer.get(schema.Curriculum, 1).description = "new"
+        writer.flush()
+        with self.cache.attach(Session(self.engine)) as reader:
+            self.assertEqual(self.description(reader), "old")
+        # Rolling back a SAVEPOINT leaves the outer transaction's write in place,
+        # and its uncommitted rows mustn't be cached
+        writer.begin_nested()
+        writer.rollback()
+        self.assertEqual(self.description(writer), "new")
+        writer.rollback()
+        writer.close()
+        with self.cache.attach(Session(self.engine)) as reader:
+            self.assertEqual(self.description(reader), "old")
+
+    def test_write_during_read(self):
+        with self.engine.connect() as con:
+            # WAL lets the writer commit while the reader's SELECT is open
+            con.exec_driver_sql("pragma journal_mode=wal")
+
+        def write():
+            with self.cache.attach(Session(self.engine)) as writer:
+                writer.get(schema.Curriculum, 1).description = "new"
+                writer.commit()
+
+        writers = [threading.Thread(target=write)]
+
+        def read_then_write(con, cursor, statement, *args):
+            # The SELECT has started, and will return the old row
+            if statement.startswith("SELECT curriculum.description") and writers:
+                thread = writers.pop()
+                thread.start()
+                thread.join()
+        event.listen(self.engine, 'after_cursor_execute', read_then_write)
+        with self.cache.attach(Session(self.engine)) as reader:
+            self.assertEqual(self.description(reader), "old")
+        self.assertEqual(writers, [])
+        with self.cache.attach(Session(self.engine)) as reader:
+            self.assertEqual(self.description(reader), "new")
+
+
+if __name__ == '__main__':
+    unittest.main()
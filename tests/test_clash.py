@@ -0,0 +1,55 @@
+"""
+Checks week bitsets find the same clashes as a self-join of memberships
+"""
+import unittest
+from curriculum_model.calc.clash import bit_weeks, load_clash_index, week_bits
+from curriculum_model.db import schema
+from curriculum_model.db.synthetic import generate
+from sqlalchemy import and_, create_engine, select
+from sqlalchemy.orm import aliased
+
+
+class TestClash(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(cls.engine)
+        with cls.engine.begin() as con:
+            cls.curriculum_id = generate(con, 3, seed=7)
+            cls.index = load_clash_index(con, cls.curriculum_id, chunk_size=100)
+
+    def test_bits(self):
+        self.assertEqual(bit_weeks(week_bits([3, 1, 40])), [1, 3, 40])
+        self.assertEqual(bit_weeks(0), [])
+
+    def test_matches_self_join(self):
+        s = schema
+        m1, m2 = aliased(s.TGroupMember), aliased(s.TGroupMember)
+
+        with self.engine.connect() as con:
+            weeks = {}
+            for tgroup, week in con.execute(
+                    select(s.TGroup.tgroup_id, s.CalendarMap.celcat_week)
+                    .join(s.Cost, s.Cost.cost_id == s.TGroup.cost_id)
+                    .join(s.Component, s.Component.component_id == s.Cost.component_id)
+                    .join(s.CostWeek, s.CostWeek.cost_id == s.Cost.cost_id)
+                    .join(s.CalendarMap, and_(s.CalendarMap.curriculum_id == s.Component.curriculum_id,
+                                              s.CalendarMap.calendar_type == s.Component.calendar_type,
+                                              s.CalendarMap.acad_week == s.CostWeek.acad_week))):
+                weeks.setdefault(tgroup, set()).add(week)
+            pairs = con.execute(select(m1.student_id, m1.tgroup_id, m2.tgroup_id)
+                                .join(m2, and_(m1.student_id == m2.student_id,
+                                               m1.tgroup_id < m2.tgroup_id))).all()
+        expected = set()
+        for student, a, b in pairs:
+            overlap = weeks.get(a, set()) & weeks.get(b, set())
+            if overlap:
+                expected.add((student, a, b, tuple(sorted(overlap))))
+        actual = {(c.student_id, c.tgroup_a, c.tgroup_b, tuple(c.weeks)) for c in self.index.all_clashes()}
+        self.assertEqual(actual, expected)
+        self.assertGreater(len(actual), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
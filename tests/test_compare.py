@@ -0,0 +1,53 @@
+"""
+Checks multi-year cubes aggregate view rows by year and key
+"""
+import unittest
+from datetime import datetime
+from curriculum_model.calc.compare import compare
+from curriculum_model.db import schema
+from curriculum_model.db.schema import views
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+
+class TestCompare(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        self.session.add_all([schema.Curriculum(curriculum_id=y - 2000, description="Main", acad_year=y,
+                                                usage_id='Main', created_date=datetime.now())
+                              for y in (2020, 2021, 2022)])
+        self.session.add_all([schema.Costc(costc='CC0001', description="A", pathway=True, primary_aos_code='AOS001'),
+                              schema.Costc(costc='CC0002', description="B", pathway=True, primary_aos_code='AOS002')])
+        hours = [{'usage_id': 'Main', 'acad_year': y, 'curriculum_id': y - 2000,
+                  'costc': c, 'hours': h} for y in (2020, 2021, 2022)
+                 for c, h in (('CC0001', y - 2019), ('CC0002', 5), ('CC0002', 5))]
+        # A curriculum with another usage shouldn't be counted
+        hours.append({'usage_id': 'Other', 'acad_year': 2020, 'curriculum_id': 99,
+                      'costc': 'CC0001', 'hours': 1000})
+        self.session.execute(views.CurriculumHours.insert(), hours)
+        self.session.execute(views.FeeIncomeInputCostc.insert(),
+                             [{'Year': 2021, 'CostC': 'CC0002', 'aos_code': 'AOS009', 'usage_id': 'Main',
+                               'Income': 9250, 'Students': 1, 'Origin': 'Test'}])
+
+    def test_costc(self):
+        cube = compare(self.session, [2022, 2020, 2021], 'Main', chunk_size=2)
+        self.assertEqual(cube.years, [2020, 2021, 2022])
+        self.assertEqual(cube.keys, ['CC0001', 'CC0002'])
+        self.assertEqual(list(cube['hours'][:, 0]), [1, 2, 3])
+        self.assertEqual(cube.value('hours', 2021, 'CC0002'), 10)
+        self.assertEqual(cube.value('income', 2021, 'CC0002'), 9250)
+        self.assertEqual(list(cube.change('hours')[:, 0]), [1, 1])
+
+    def test_aos_code(self):
+        cube = compare(self.session, [2021], 'Main', key='aos_code',
+                       measures=['hours', 'students'])
+        self.assertEqual(cube.keys, ['AOS001', 'AOS002', 'AOS009'])
+        self.assertEqual(cube.value('hours', 2021, 'AOS002'), 10)
+        self.assertEqual(cube.value('students', 2021, 'AOS009'), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
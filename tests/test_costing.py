@@ -0,0 +1,83 @@
+"""
+Checks vectorised costing against a walk of the costs
+"""
+import unittest
+from collections import defaultdict
+import numpy as np
+from curriculum_model.calc.costing import costing
+from curriculum_model.calc.frame import load_curriculum
+from curriculum_model.calc.groups import group_counts, student_numbers
+from curriculum_model.calc.income import fee_income
+from curriculum_model.db import schema
+from curriculum_model.db.refdata import RefCache
+from curriculum_model.db.synthetic import USAGE_ID, generate
+from sqlalchemy import create_engine, func, select
+
+
+class TestCosting(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(cls.engine)
+        with cls.engine.begin() as con:
+            cls.curriculum_id = generate(con, 8, seed=6, timetable=False)
+            cls.frame = load_curriculum(con, cls.curriculum_id)
+            students = student_numbers(con, cls.frame.encoding, 2020, USAGE_ID)
+            cls.counts = group_counts(cls.frame, students)
+            cls.costing = costing(cls.frame, cls.counts, RefCache().table(con, 'cost_type'))
+            cls.income = fee_income(con, cls.frame.encoding, 2020, USAGE_ID)
+
+    def test_cost_amounts(self):
+        groups = dict(zip(self.frame.cost.cost_id.tolist(), self.counts.groups.tolist()))
+        hours, nonpay = defaultdict(float), defaultdict(float)
+        s = schema
+        with self.engine.connect() as con:
+            weeks = dict(con.execute(select(s.CostWeek.cost_id, func.count())
+                                     .group_by(s.CostWeek.cost_id)).all())
+            for cost in con.execute(select(s.Cost.cost_id, s.Cost.mins_per_group, s.Cost.cost_per_group,
+                                           s.Cost.number_of_staff, s.CostType.cost_multiplier,
+                                           s.CostType.is_pay)
+                                    .join(s.CostType, s.CostType.cost_type == s.Cost.cost_type)):
+                n = groups[cost.cost_id] * weeks.get(cost.cost_id, 0) * cost.cost_multiplier
+                if cost.is_pay:
+                    staff = 1 if cost.number_of_staff is None else float(cost.number_of_staff)
+                    hours[cost.cost_id] = n * cost.mins_per_group * staff / 60
+                else:
+                    nonpay[cost.cost_id] = n * cost.cost_per_group
+        for i, cost_id in enumerate(self.frame.cost.cost_id.tolist()):
+            self.assertAlmostEqual(self.costing.hours[i], hours[cost_id])
+            self.assertAlmostEqual(self.costing.nonpay[i], nonpay[cost_id])
+        self.assertGreater(sum(hours.values()), 0)
+        self.assertGreater(sum(nonpay.values()), 0)
+
+    def test_allocation_conserves(self):
+        by_costc = self.costing.by_costc()
+        totals = self.costing.totals()
+        # Costs nobody takes have no groups, so nothing is lost in the split
+        self.assertAlmostEqual(sum(v['hours'] for v in by_costc.values()), totals['hours'])
+        self.assertAlmostEqual(sum(v['nonpay'] for v in by_costc.values()), totals['nonpay'])
+        self.assertTrue(set(by_costc) <= set(self.frame.course_session.decoded('costc')))
+
+    def test_allocation_2d(self):
+        allocation = self.costing.allocation
+        values = np.vstack([self.costing.hours, 2 * self.costing.hours])
+        summed = allocation.by_costc(values)
+        np.testing.assert_allclose(summed[0], allocation.by_costc(self.costing.hours))
+        np.testing.assert_allclose(summed[1], 2 * summed[0])
+
+    def test_fee_income(self):
+        with self.engine.connect() as con:
+            expected = con.execute(
+                select(func.sum(schema.SN.student_count * (schema.Fee.gross_fee - schema.Fee.waiver)))
+                .join(schema.Fee, (schema.Fee.fee_status_id == schema.SN.fee_status_id)
+                      & (schema.Fee.session == schema.SN.session)
+                      & (schema.Fee.acad_year == 2020))).scalar()
+        self.assertAlmostEqual(self.income.totals()['income'], float(expected), places=2)
+        by_status = self.income.by('fee_status')
+        self.assertAlmostEqual(sum(v['students'] for v in by_status.values()),
+                               self.income.totals()['students'])
+
+
+if __name__ == '__main__':
+    unittest.main()
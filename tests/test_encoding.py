@@ -0,0 +1,55 @@
+"""
+Checks key columns are encoded to dense codes and decoded back
+"""
+import unittest
+import numpy as np
+from curriculum_model.calc.encoding import Codebook, Encoding, NULL
+from curriculum_model.calc.frame import load_curriculum
+from curriculum_model.db import schema
+from curriculum_model.db.synthetic import generate
+from sqlalchemy import create_engine, select
+
+
+class TestCodebook(unittest.TestCase):
+
+    def test_round_trip(self):
+        book = Codebook('costc', ['AA', 'BB'])
+        codes = book.encode(['BB', None, 'CC', 'AA', 'CC'])
+        self.assertEqual(codes.dtype, np.int32)
+        self.assertEqual(list(codes), [1, NULL, 2, 0, 2])
+        self.assertEqual(list(book.decode(codes)), ['BB', None, 'CC', 'AA', 'CC'])
+        self.assertEqual(book.value(2), 'CC')
+        self.assertEqual(len(book), 3)
+
+
+class TestEncoding(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(cls.engine)
+        with cls.engine.begin() as con:
+            cls.curriculum_id = generate(con, 5, seed=3)
+            cls.encoding = Encoding.load(con)
+            cls.frame = load_curriculum(con, cls.curriculum_id, encoding=cls.encoding)
+
+    def test_reference_order(self):
+        # Codes follow key order, so sorting codes sorts the keys
+        with self.engine.connect() as con:
+            costcs = con.execute(select(schema.Costc.costc)).scalars().all()
+        self.assertEqual(self.encoding['costc'].values, sorted(costcs))
+
+    def test_frame_columns(self):
+        cost = self.frame.cost
+        self.assertEqual(cost.cost_type.dtype, np.int32)
+        with self.engine.connect() as con:
+            expected = con.execute(select(schema.Cost.cost_type)
+                                   .join(schema.Component)
+                                   .where(schema.Component.curriculum_id == self.curriculum_id)
+                                   .order_by(schema.Cost.cost_id)).scalars().all()
+        self.assertEqual(list(cost.decoded('cost_type')), expected)
+        self.assertEqual(cost[0].cost_type, expected[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
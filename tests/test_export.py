@@ -0,0 +1,90 @@
+"""
+Checks query results are streamed to each output format
+"""
+import csv
+import os
+import tempfile
+import unittest
+from decimal import Decimal
+from curriculum_model.db import schema
+from curriculum_model.db.export import ParquetWriter, export
+from curriculum_model.db.queries import view_query
+from curriculum_model.db.schema import views
+from sqlalchemy import create_engine
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(self.engine)
+        with self.engine.begin() as con:
+            con.execute(views.CurriculumNonPay.insert(),
+                        [{'usage_id': 'Main', 'acad_year': 2020 + i % 2, 'curriculum_id': 1,
+                          'costc': 'CC0001', 'account': '5210', 'amount': i} for i in range(25)])
+        self.fldr = tempfile.mkdtemp()
+
+    def test_csv(self):
+        path = os.path.join(self.fldr, "out.csv")
+        with self.engine.connect() as con:
+            n = export(con, view_query('v_fm_curriculum_nonpay', acad_year=2020),
+                       path, 'csv', chunk_size=4)
+        with open(path) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(n, 13)
+        self.assertEqual(rows[0], [c.name for c in views.CurriculumNonPay.columns])
+        self.assertEqual(len(rows), 14)
+
+    def test_empty(self):
+        path = os.path.join(self.fldr, "empty.csv")
+        with self.engine.connect() as con:
+            n = export(con, view_query('v_fm_curriculum_nonpay', acad_year=1999), path)
+        with open(path) as f:
+            self.assertEqual(len(f.readlines()), 1)
+        self.assertEqual(n, 0)
+
+    def test_parquet(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest("pyarrow not installed")
+        path = os.path.join(self.fldr, "out.parquet")
+        with self.engine.connect() as con:
+            export(con, view_query('v_fm_curriculum_nonpay'),
+                   path, 'parquet', chunk_size=10)
+        f = pq.ParquetFile(path)
+        self.assertEqual(f.metadata.num_rows, 25)
+        self.assertEqual(f.metadata.num_row_groups, 3)
+
+    def test_parquet_error(self):
+        try:
+            import pyarrow
+        except ImportError:
+            self.skipTest("pyarrow not installed")
+        path = os.path.join(self.fldr, "out.parquet")
+        stmt = view_query('v_fm_curriculum_nonpay')
+        with self.engine.connect() as con, self.assertRaises(RuntimeError):
+            with ParquetWriter(path, list(stmt.selected_columns)) as writer:
+                writer.write(con.execute(stmt).all())
+                raise RuntimeError("Connection lost")
+        self.assertFalse(os.path.exists(path))
+
+    def test_xlsx(self):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            self.skipTest("openpyxl not installed")
+        path = os.path.join(self.fldr, "out.xlsx")
+        with self.engine.connect() as con:
+            n = export(con, view_query('v_fm_curriculum_nonpay', acad_year=2020),
+                       path, 'xlsx', chunk_size=4)
+            expected = con.execute(view_query('v_fm_curriculum_nonpay', acad_year=2020)).all()
+        rows = list(load_workbook(path, read_only=True).active.values)
+        self.assertEqual(n, 13)
+        self.assertEqual(list(rows[0]), [c.name for c in views.CurriculumNonPay.columns])
+        self.assertEqual([tuple(r) for r in rows[1:]],
+                         [tuple(float(v) if isinstance(v, Decimal) else v for v in r) for r in expected])
+
+
+if __name__ == '__main__':
+    unittest.main()
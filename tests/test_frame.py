@@ -0,0 +1,53 @@
+"""
+Checks curricula load into compact frames which match the database
+"""
+import unittest
+from curriculum_model.calc.frame import load_curriculum
+from curriculum_model.db import schema
+from curriculum_model.db.synthetic import generate
+from sqlalchemy import create_engine, desc, func, select
+
+
+class TestFrame(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(cls.engine)
+        with cls.engine.begin() as con:
+            generate(con, 5, seed=1)
+            cls.curriculum_id = generate(con, 5, seed=2)
+            cls.frame = load_curriculum(con, cls.curriculum_id, chunk_size=50)
+
+    def test_counts(self):
+        with self.engine.connect() as con:
+            n_costs = con.execute(select(func.count()).select_from(schema.Cost)
+                                  .join(schema.Component)
+                                  .where(schema.Component.curriculum_id == self.curriculum_id)).scalar()
+        self.assertEqual(len(self.frame.cost), n_costs)
+        self.assertEqual(len(self.frame.course), 5)
+
+    def test_navigation(self):
+        with self.engine.connect() as con:
+            cost = con.execute(select(schema.Cost.cost_id, schema.Cost.mins_per_group,
+                                      schema.Component.calendar_type)
+                               .join(schema.Component)
+                               .where(schema.Component.curriculum_id == self.curriculum_id)
+                               .order_by(desc(schema.Cost.cost_id))).first()
+            n_weeks = con.execute(select(func.count()).select_from(schema.CostWeek)
+                                  .where(schema.CostWeek.cost_id == cost.cost_id)).scalar()
+        record = self.frame.cost.get(cost.cost_id)
+        self.assertEqual(record.mins_per_group, cost.mins_per_group)
+        self.assertEqual(record.component.calendar_type, cost.calendar_type)
+        self.assertEqual(len(record.children('cost_week')), n_weeks)
+        self.assertIsNone(self.frame.cost.get(-1))
+
+    def test_config_links(self):
+        # Every course session belongs to a course in the same curriculum
+        idx = self.frame.course_config.course_session_idx
+        self.assertEqual(sorted(set(idx)), list(
+            range(len(self.frame.course_session))))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+Checks vectorised group counts against a walk of the curriculum tree
+"""
+import math
+import unittest
+from collections import defaultdict
+from curriculum_model.calc.frame import load_curriculum
+from curriculum_model.calc.groups import group_counts, student_numbers
+from curriculum_model.db import schema
+from curriculum_model.db.synthetic import USAGE_ID, generate
+from sqlalchemy import create_engine, select
+
+
+class TestGroups(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(cls.engine)
+        with cls.engine.begin() as con:
+            cls.curriculum_id = generate(con, 8, seed=4)
+            frame = load_curriculum(con, cls.curriculum_id)
+            students = student_numbers(con, frame.encoding, 2020, USAGE_ID)
+            cls.counts = group_counts(frame, students)
+
+    def _expected(self):
+        with self.engine.connect() as con:
+            sn = defaultdict(float)
+            for aos, session, count in con.execute(select(schema.SN.aos_code, schema.SN.session,
+                                                          schema.SN.student_count)):
+                sn[aos, session] += float(count)
+            cs_students = defaultdict(float)
+            for cs_id, session, aos in con.execute(
+                    select(schema.CourseSession.course_session_id, schema.CourseSession.session,
+                           schema.Course.aos_code)
+                    .join(schema.CourseConfig, schema.CourseConfig.course_session_id
+                          == schema.CourseSession.course_session_id)
+                    .join(schema.Course, schema.Course.course_id == schema.CourseConfig.course_id)
+                    .where(schema.Course.curriculum_id == self.curriculum_id)):
+                cs_students[cs_id] += sn[aos, session]
+            cg_students = defaultdict(float)
+            for cs_id, cg_id in con.execute(select(schema.CourseSessionConfig.course_session_id,
+                                                   schema.CourseSessionConfig.cgroup_id)):
+                cg_students[cg_id] += cs_students[cs_id]
+            members = defaultdict(list)
+            for cg_id, comp_id, ratio in con.execute(select(schema.CGroupConfig.cgroup_id,
+                                                            schema.CGroupConfig.component_id,
+                                                            schema.CGroupConfig.ratio)):
+                members[cg_id].append((comp_id, ratio))
+            comp_students = defaultdict(float)
+            for cg_id, comps in members.items():
+                total = sum(r for _, r in comps)
+                for comp_id, ratio in comps:
+                    comp_students[comp_id] += cg_students[cg_id] * ratio / total
+            return {cost_id: (comp_students[comp_id], math.ceil(round(comp_students[comp_id] / size, 9)))
+                    for cost_id, comp_id, size in con.execute(
+                        select(schema.Cost.cost_id, schema.Cost.component_id, schema.Cost.max_group_size))}
+
+    def test_matches_tree_walk(self):
+        expected = self._expected()
+        rows = list(self.counts.rows())
+        self.assertEqual(len(rows), len(expected))
+        for cost_id, _, students, groups in rows:
+            self.assertAlmostEqual(students, expected[cost_id][0])
+            self.assertEqual(groups, expected[cost_id][1])
+        self.assertGreater(sum(r[3] for r in rows), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+"""
+Checks curricula are rebuilt correctly from audit history
+"""
+import unittest
+from datetime import datetime
+from curriculum_model.db import schema
+from curriculum_model.db.history import Reconstructor
+from curriculum_model.db.schema.audit import t_audit_component, t_audit_cost, t_audit_relationships
+from sqlalchemy import create_engine
+
+
+def _cost(cost_id, component_id, description, day, cmd='insert'):
+    return {'cost_id': cost_id, 'component_id': component_id, 'cost_type': 'Teaching',
+            'description': description, 'max_group_size': 10, 'mins_per_group': 60,
+            'cost_per_group': 0, 'datestamp': datetime(2021, 3, day), 'cmd': cmd}
+
+
+class TestReconstructor(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(self.engine)
+        components = [{'component_id': i, 'description': f"Component {i}",
+                       'curriculum_id': curriculum_id,
+                       'datestamp': datetime(2021, 3, 1), 'cmd': 'insert'}
+                      for i, curriculum_id in [(1, 1), (2, 1), (3, 2)]]
+        costs = [_cost(1, 1, "Lecture", 2),
+                 _cost(2, 2, "Seminar", 2),
+                 _cost(3, 3, "Other curriculum", 2),
+                 _cost(1, 1, "Lecture (revised)", 4, 'update'),
+                 _cost(2, 2, "Seminar", 5, 'delete')]
+        relationships = [{'tbl': 'cgroup_config', 'lcom_username': 'test', 'cmd': 'insert',
+                          'datestamp': datetime(2021, 3, 1), 'parent': 7, 'child': 1}]
+        with self.engine.begin() as con:
+            con.execute(t_audit_component.insert(), components)
+            con.execute(t_audit_cost.insert(), costs)
+            con.execute(t_audit_relationships.insert(), relationships)
+
+    def test_point_in_time(self):
+        r = Reconstructor(self.engine)
+        before = r.at(1, datetime(2021, 3, 3))
+        self.assertEqual(before.tables['cost'][1]['description'], "Lecture")
+        self.assertEqual(set(before.tables['cost']), {1, 2})
+        after = r.at(1, datetime(2021, 3, 6))
+        self.assertEqual(after.tables['cost'][1]['description'],
+                         "Lecture (revised)")
+        self.assertEqual(set(after.tables['cost']), {1})
+        # Earlier snapshot isn't changed by later replay
+        self.assertEqual(set(before.tables['cost']), {1, 2})
+
+    def test_checkpoints(self):
+        r = Reconstructor(self.engine, checkpoint_every=1)
+        late = r.at(1, datetime(2021, 3, 6))
+        early = r.at(1, datetime(2021, 3, 2))
+        self.assertEqual(set(early.tables['cost']), {1, 2})
+        self.assertEqual(set(r.at(1, datetime(2021, 3, 6)).tables['cost']),
+                         set(late.tables['cost']))
+        self.assertEqual(len(r._checkpoints[1][0]), 4)
+
+    def test_relationships(self):
+        r = Reconstructor(self.engine)
+        # cgroup 7 isn't audited in curriculum 1, so its link is excluded
+        self.assertEqual(r.at(1, datetime(2021, 3, 6))
+                         .relationships['cgroup_config'], set())
+
+
+if __name__ == '__main__':
+    unittest.main()
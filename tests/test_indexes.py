@@ -0,0 +1,48 @@
+"""
+Checks the index advisor finds and creates missing indexes
+"""
+import unittest
+from curriculum_model.db import indexes, schema
+from sqlalchemy import Column, ForeignKey, Integer, MetaData, Table, create_engine, inspect, text
+
+
+class TestIndexes(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(self.engine)
+
+    def test_schema_fully_indexed(self):
+        self.assertEqual(indexes.advise(self.engine, schema.Base.metadata), [])
+
+    def test_missing_declared_index(self):
+        with self.engine.begin() as con:
+            con.execute(text("DROP INDEX ix_cost_component_id"))
+        proposals = indexes.advise(self.engine, schema.Base.metadata)
+        self.assertEqual([(p.table, p.columns) for p in proposals], [('cost', ['component_id'])])
+        indexes.create(self.engine, schema.Base.metadata, proposals)
+        self.assertEqual(indexes.advise(self.engine, schema.Base.metadata), [])
+
+    def test_undeclared_foreign_key(self):
+        # Foreign keys to traversed tables need indexes, unless they lead the primary key
+        metadata = MetaData()
+        Table('cgroup', metadata, Column('cgroup_id', Integer, primary_key=True))
+        Table('course_session', metadata, Column('course_session_id', Integer, primary_key=True))
+        Table('cgroup_strand', metadata, Column('strand_id', Integer, primary_key=True))
+        tbl = Table('course_session_config', metadata,
+                    Column('course_session_id', ForeignKey('course_session.course_session_id'), primary_key=True),
+                    Column('cgroup_id', ForeignKey('cgroup.cgroup_id'), primary_key=True),
+                    Column('strand', ForeignKey('cgroup_strand.strand_id')))
+        engine = create_engine("sqlite:///:memory:", echo=False)
+        metadata.create_all(engine)
+        proposals = indexes.advise(engine, metadata)
+        self.assertEqual([(p.table, p.name, p.columns) for p in proposals],
+                         [('course_session_config', 'ix_course_session_config_cgroup_id', ['cgroup_id'])])
+        indexes.create(engine, metadata, proposals)
+        names = [i['name'] for i in inspect(engine).get_indexes('course_session_config')]
+        self.assertIn('ix_course_session_config_cgroup_id', names)
+        self.assertEqual(len(tbl.indexes), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
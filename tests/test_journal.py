@@ -0,0 +1,120 @@
+"""
+Checks the non-pay journal against the costing, and its export formats
+"""
+import csv
+import os
+import tempfile
+import unittest
+from curriculum_model.calc.costing import costing, rates
+from curriculum_model.calc.frame import load_curriculum
+from curriculum_model.calc.groups import group_counts, student_numbers
+from curriculum_model.calc.journal import COLUMNS, journal, week_periods
+from curriculum_model.cli.journal import _write
+from curriculum_model.db import schema
+from curriculum_model.db.export import CsvWriter, FixedWidthWriter
+from curriculum_model.db.refdata import RefCache, RefTable
+from curriculum_model.db.synthetic import USAGE_ID, generate
+from sqlalchemy import create_engine
+
+
+class TestJournal(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(engine)
+        cache = RefCache()
+        with engine.begin() as con:
+            cls.curriculum_id = generate(con, 8, seed=3, timetable=False)
+            cls.frame = load_curriculum(con, cls.curriculum_id)
+            students = student_numbers(con, cls.frame.encoding, 2020, USAGE_ID)
+            cls.cost_types = cache.table(con, 'cost_type')
+            cls.periods = week_periods(con, cls.curriculum_id, cls.frame.encoding, cache.table(con, 'week'))
+        cls.counts = group_counts(cls.frame, students)
+        cls.rates = rates(cls.frame, cls.cost_types)
+        cls.costing = costing(cls.frame, cls.counts, cls.cost_types)
+
+    def journal(self, periods=None, cost_types=None, **kwargs):
+        return journal(self.frame, self.counts, self.rates, self.costing.allocation,
+                       self.periods if periods is None else periods,
+                       self.cost_types if cost_types is None else cost_types, 2020, **kwargs)
+
+    def test_matches_costing(self):
+        result = self.journal(chunk_size=97)
+        self.assertEqual(result.unmapped, 0)
+        self.assertEqual(result.untyped, 0)
+        self.assertAlmostEqual(result.total(), self.costing.totals()['nonpay'], places=6)
+        by_costc = self.costing.by_costc()
+        for i, costc in enumerate(result.costc):
+            self.assertAlmostEqual(result.amounts[i].sum(), by_costc[costc]['nonpay'], places=6)
+        # Chunking doesn't change the result
+        self.assertEqual(result.by_period(), self.journal().by_period())
+        self.assertGreater(len(result.by_period()), 1)
+
+    def test_unmapped_weeks(self):
+        periods = self.periods.copy()
+        periods[:, :5] = -1
+        result = self.journal(periods)
+        self.assertGreater(result.unmapped, 0)
+        self.assertAlmostEqual(result.total() + result.unmapped, self.costing.totals()['nonpay'], places=6)
+
+    def test_untyped(self):
+        # A cost type with non-pay, missing from the cost types
+        book = self.frame.encoding['cost_type']
+        missing = book.value(self.frame.cost.cost_type[self.rates.nonpay.argmax()])
+        types = RefTable('cost_type', self.cost_types.record,
+                         [r for r in self.cost_types if r.cost_type != missing], self.cost_types.key)
+        result = self.journal(cost_types=types)
+        self.assertGreater(result.untyped, 0)
+        self.assertAlmostEqual(result.total() + result.untyped, self.costing.totals()['nonpay'], places=6)
+
+    def test_writers(self):
+        result = self.journal()
+        with tempfile.TemporaryDirectory() as d:
+            csv_path, fixed_path = os.path.join(d, 'gl.csv'), os.path.join(d, 'gl.txt')
+            with CsvWriter(csv_path, COLUMNS) as writer:
+                writer.write(result.rows('Budget'))
+            with FixedWidthWriter(fixed_path, COLUMNS) as writer:
+                writer.write(result.rows('Budget'))
+            with open(csv_path, newline='') as f:
+                rows = list(csv.DictReader(f))
+            with open(fixed_path) as f:
+                lines = f.read().splitlines()
+        self.assertEqual(len(rows), len(result))
+        self.assertEqual(len(lines), len(result))
+        self.assertAlmostEqual(sum(float(r['amount']) for r in rows), result.total(), places=0)
+        # acad_year, period, costc, account, amount (15 digits, sign and point), description
+        self.assertEqual({len(line) for line in lines}, {10 + 10 + 6 + 10 + 17 + 100})
+        self.assertEqual(lines[0][20:26].strip(), rows[0]['costc'])
+        self.assertEqual(lines[0][26:36].strip(), rows[0]['account'])
+        self.assertEqual(float(lines[0][36:53]), float(rows[0]['amount']))
+
+    def test_fixed_width_limits(self):
+        with tempfile.TemporaryDirectory() as d:
+            with FixedWidthWriter(os.path.join(d, 'gl.txt'), COLUMNS) as writer:
+                # Full precision, negative, fits
+                writer.write([(2020, 1, 'CC0001', 123456, -9999999999999.99, '')])
+                for row in [(2020, 1, 'CC00001', 5210, 1.0, ''),
+                            (2020, 1, 'CC0001', 5210, 1.0, 'x' * 101),
+                            (2020, 1, 'CC0001', 5210, 10.0 ** 15, '')]:
+                    with self.assertRaises(ValueError):
+                        writer.write([row])
+            with open(os.path.join(d, 'gl.txt')) as f:
+                self.assertIn('  123456-9999999999999.99', f.read())
+
+    def test_failed_write(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'gl.txt')
+            _write('fixed', path, self.journal().rows('Budget'))
+            with open(path) as f:
+                before = f.read()
+            with self.assertRaises(ValueError):
+                _write('fixed', path, self.journal().rows('x' * 101))
+            # The earlier journal is untouched, and nothing is left behind
+            with open(path) as f:
+                self.assertEqual(f.read(), before)
+            self.assertEqual(os.listdir(d), ['gl.txt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Checks view partitions are cached and invalidated by changes to their base tables
+"""
+import unittest
+from datetime import datetime
+from curriculum_model.db import schema
+from curriculum_model.db.matview import MaterialisedViews
+from curriculum_model.db.schema import views
+from curriculum_model.db.schema.audit import t_audit_course
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+
+class TestMaterialisedViews(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        self.session.execute(views.CurriculumHours.insert(),
+                             [{'usage_id': 'Main', 'acad_year': 2020, 'curriculum_id': c,
+                               'costc': 'CC0001', 'hours': 10} for c in (1, 2)])
+        self.session.execute(views.FeeIncomeInputCostc.insert(),
+                             [{'Year': 2020, 'CostC': 'CC0001', 'usage_id': 'Main',
+                               'Income': 100, 'Origin': 'Test'}])
+        self.mv = MaterialisedViews()
+
+    def set_hours(self, hours):
+        self.session.execute(views.CurriculumHours.update().values(hours=hours))
+
+    def test_cached(self):
+        self.assertEqual(self.mv.read(self.session, 'v_fm_curriculum_hours', 2020, 'Main', 1)[0].hours, 10)
+        self.set_hours(20)
+        self.assertEqual(self.mv.read(self.session, 'v_fm_curriculum_hours', 2020, 'Main', 1)[0].hours, 10)
+        self.assertEqual(len(self.mv.read(self.session, 'v_fm_curriculum_hours', 2020, 'Main')), 2)
+
+    def test_invalidate(self):
+        self.mv.read(self.session, 'v_fm_curriculum_hours', 2020, 'Main', 1)
+        self.mv.read(self.session, 'v_fm_curriculum_hours', 2020, 'Main', 2)
+        self.mv.read(self.session, 'vFeeIncomeInputCostc', 2020, 'Main')
+        # Only curriculum 1's hours depend on a cost in curriculum 1
+        self.assertEqual(self.mv.invalidate('component', curriculum_id=1), 1)
+        self.assertEqual(self.mv.invalidate('fee'), 1)
+        self.assertEqual(self.mv.invalidate('hecos_code'), 0)
+
+    def test_watch(self):
+        self.mv.watch(self.session)
+        self.mv.read(self.session, 'v_fm_curriculum_hours', 2020, 'Main', 1)
+        self.set_hours(20)
+        self.session.add(schema.Course(course_id=1, pathway="Jazz", curriculum_id=1))
+        self.session.flush()
+        self.assertEqual(self.mv.read(self.session, 'v_fm_curriculum_hours', 2020, 'Main', 1)[0].hours, 20)
+
+    def test_watch_transaction_end(self):
+        self.mv.watch(self.session)
+        self.session.add(schema.Course(course_id=1, pathway="Jazz", curriculum_id=1))
+        self.session.flush()
+        # Materialised after the flush, e.g. by another session still seeing the old rows
+        self.mv.read(self.session, 'v_fm_curriculum_hours', 2020, 'Main', 1)
+        self.set_hours(20)
+        self.session.commit()
+        self.assertEqual(self.mv.read(self.session, 'v_fm_curriculum_hours', 2020, 'Main', 1)[0].hours, 20)
+        self.session.add(schema.Course(course_id=2, pathway="Folk", curriculum_id=2))
+        self.session.flush()
+        self.mv.read(self.session, 'v_fm_curriculum_hours', 2020, 'Main', 2)
+        self.session.rollback()
+        self.assertEqual(self.mv.invalidate('course', curriculum_id=2), 0)
+
+    def test_stale(self):
+        self.mv.read(self.session, 'v_fm_curriculum_hours', 2020, 'Main', 1)
+        self.mv.read(self.session, 'vFeeIncomeInputCostc', 2020, 'Main')
+        self.assertEqual(self.mv.refresh_stale(self.session), [])
+        self.session.execute(t_audit_course.insert().values(
+            course_id=1, pathway="Jazz", curriculum_id=1, datestamp=datetime.now(), cmd='insert'))
+        self.assertEqual(self.mv.refresh_stale(self.session),
+                         [('v_fm_curriculum_hours', 2020, 'Main', 1)])
+
+    def test_stale_unaudited(self):
+        self.session.add(schema.Component(component_id=1, description="Harmony", calendar_type='UG',
+                                          coordination_eligible=False, curriculum_id=1))
+        self.session.add(schema.Cost(cost_id=1, component_id=1, cost_type='Lecture', description="Lecture",
+                                     max_group_size=20, mins_per_group=60, cost_per_group=0))
+        self.session.flush()
+        changes = [schema.CostWeek(cost_id=1, acad_week=1),
+                   schema.CalendarMap(acad_week=1, curriculum_id=1, term=1, calendar_type='UG', celcat_week=1),
+                   schema.CostType(cost_type='Lecture', cost_multiplier=1, is_pay=True, is_contact=True,
+                                   nominal_account=5000),
+                   schema.Fee(acad_year=2020, fee_cat_id='UG', fee_status_id='H', session=1, gross_fee=9250)]
+        for change in changes:
+            self.mv.read(self.session, 'v_fm_curriculum_hours', 2020, 'Main', 1)
+            self.mv.read(self.session, 'vFeeIncomeInputCostc', 2020, 'Main')
+            self.session.add(change)
+            self.session.flush()
+            stale = self.mv.refresh_stale(self.session)
+            expected = 'vFeeIncomeInputCostc' if isinstance(change, schema.Fee) else 'v_fm_curriculum_hours'
+            self.assertEqual([p[0] for p in stale], [expected], change.__tablename__)
+
+
+if __name__ == '__main__':
+    unittest.main()
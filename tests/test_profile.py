@@ -0,0 +1,46 @@
+"""
+Checks statements are timed and attributed to phases
+"""
+import json
+import os
+import tempfile
+import unittest
+from curriculum_model.db import schema
+from curriculum_model.db.profile import Profiler
+from sqlalchemy import create_engine, select
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(self.engine)
+        self.profiler = Profiler()
+        self.profiler.attach(self.engine)
+
+    def test_phases(self):
+        with self.engine.begin() as con:
+            with self.profiler.phase("load"):
+                con.execute(select(schema.Week.__table__)).all()
+                with self.profiler.phase("insert"):
+                    con.execute(schema.Week.__table__.insert(),
+                                [{'celcat_week': i, 'period': 1} for i in range(3)])
+        summary = {p['phase']: p for p in self.profiler.summary()}
+        self.assertEqual(summary['load']['statements'], 1)
+        self.assertEqual(summary['load > insert']['rows'], 3)
+        self.assertTrue(self.profiler.statements[-1].executemany)
+        self.assertIn("load > insert", self.profiler.report())
+
+    def test_detach_and_json(self):
+        self.profiler.detach(self.engine)
+        with self.engine.connect() as con:
+            con.execute(select(schema.Week.__table__)).all()
+        self.assertEqual(self.profiler.statements, [])
+        path = os.path.join(tempfile.mkdtemp(), "trace.json")
+        self.profiler.write_json(path)
+        with open(path) as f:
+            self.assertEqual(json.load(f)['statements'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
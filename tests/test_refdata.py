@@ -0,0 +1,60 @@
+"""
+Checks the reference data cache loads, indexes and invalidates tables
+"""
+import unittest
+from curriculum_model.db import schema
+from curriculum_model.db.refdata import SHARED_TTL, RefCache, bump_version, reference_cache
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+
+class TestRefCache(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:", echo=False)
+        Session = sessionmaker(bind=self.engine)
+        self.session = Session()
+        schema.Base.metadata.create_all(self.engine)
+        self.session.add_all([schema.Week(celcat_week=1, period=1),
+                              schema.Week(celcat_week=2, period=1),
+                              schema.Week(celcat_week=6, period=2)])
+        self.session.flush()
+
+    def test_lookup(self):
+        cache = RefCache()
+        self.assertEqual(cache.lookup(self.session, 'week', 6).period, 2)
+        self.assertIsNone(cache.lookup(self.session, 'week', 3))
+        by_period = cache.table(self.session, 'week').index_by('period')
+        self.assertEqual(len(by_period[1]), 2)
+
+    def test_held_until_invalidated(self):
+        cache = RefCache()
+        self.assertEqual(len(cache.table(self.session, 'week')), 3)
+        self.session.add(schema.Week(celcat_week=7, period=2))
+        self.session.flush()
+        self.assertEqual(len(cache.table(self.session, 'week')), 3)
+        cache.invalidate('week')
+        self.assertEqual(len(cache.table(self.session, 'week')), 4)
+
+    def test_version_stamp(self):
+        cache = RefCache(ttl=0)
+        bump_version(self.session)
+        self.assertEqual(len(cache.table(self.session, 'week')), 3)
+        self.session.add(schema.Week(celcat_week=7, period=2))
+        self.session.flush()
+        # Unchanged stamp means the snapshot is kept
+        self.assertEqual(len(cache.table(self.session, 'week')), 3)
+        bump_version(self.session)
+        self.assertEqual(len(cache.table(self.session, 'week')), 4)
+
+    def test_shared_cache_checks_version(self):
+        self.assertEqual(reference_cache.ttl, SHARED_TTL)
+        self.assertIsNotNone(reference_cache.version_parameter)
+
+    def test_not_reference(self):
+        with self.assertRaises(KeyError):
+            RefCache().table(self.session, 'cost')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Checks the local replica matches the source after full and incremental syncs
+"""
+import unittest
+from curriculum_model.db import schema
+from curriculum_model.db.audit import DELETE, UPDATE, AuditWriter
+from curriculum_model.db.replicate import CHILD, DATESTAMP, FULL, PK, Replicator, strategy
+from curriculum_model.db.subtree import copy_subtree, read_subtree
+from curriculum_model.db.synthetic import generate
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+
+def _engine():
+    return create_engine("sqlite://", connect_args={'check_same_thread': False},
+                         poolclass=StaticPool)
+
+
+class TestReplicate(unittest.TestCase):
+
+    def setUp(self):
+        self.source = _engine()
+        self.target = _engine()
+        schema.Base.metadata.create_all(self.source)
+        self.session = sessionmaker(bind=self.source)()
+        generate(self.session, 3, seed=9)
+        self.session.commit()
+        self.replicator = Replicator(self.source, self.target, schema.Base.metadata, chunk_size=200)
+
+    def assertReplicated(self):
+        for tbl in self.replicator.tables():
+            with self.source.connect() as src, self.target.connect() as tgt:
+                expected = sorted(map(tuple, src.execute(select(tbl))), key=repr)
+                actual = sorted(map(tuple, tgt.execute(select(tbl))), key=repr)
+            self.assertEqual(actual, expected, tbl.name)
+
+    def test_strategies(self):
+        self.assertEqual(strategy(schema.Cost.__table__), PK)
+        self.assertEqual(strategy(schema.CostWeek.__table__), CHILD)
+        self.assertEqual(strategy(schema.CourseConfig.__table__), CHILD)
+        self.assertEqual(strategy(schema.audit.t_audit_cost), DATESTAMP)
+        self.assertEqual(strategy(schema.CostType.__table__), FULL)
+        # Integer keys, but no audit table to find edits with
+        for table in (schema.Curriculum, schema.SNInstance, schema.Week):
+            self.assertEqual(strategy(table.__table__), FULL, table.__tablename__)
+
+    def test_unaudited_edits(self):
+        self.replicator.sync()
+        curriculum = self.session.get(schema.Curriculum, 1)
+        curriculum.description = "Edited"
+        self.session.query(schema.SNInstance).update({'surpress': True})
+        self.session.query(schema.Week).filter(schema.Week.celcat_week == 1).update({'period': 12})
+        self.session.commit()
+        results = self.replicator.sync()
+        self.assertReplicated()
+        self.assertEqual(results['curriculum'][0], FULL)
+        with self.target.connect() as con:
+            self.assertEqual(con.execute(select(schema.Curriculum.description)
+                                         .where(schema.Curriculum.curriculum_id == 1)).scalar(), "Edited")
+
+    def test_incremental(self):
+        self.replicator.sync()
+        self.assertReplicated()
+        # Copy (new rows and links), edit a component and remove a cost
+        audit = AuditWriter(self.session)
+        roots = read_subtree(self.session, 'cgroup', [1])
+        copy_subtree(self.session, roots, 'course_session', [2], audit)
+        component = self.session.get(schema.Component, 1)
+        component.description = "Edited"
+        self.session.flush()
+        audit.record(component, UPDATE)
+        cost = self.session.get(schema.Cost, 3)
+        self.session.query(schema.CostWeek).filter(schema.CostWeek.cost_id == cost.cost_id).delete()
+        self.session.query(schema.TGroupMember).filter(schema.TGroupMember.tgroup_id.in_(
+            select(schema.TGroup.tgroup_id).where(schema.TGroup.cost_id == cost.cost_id))).delete(synchronize_session=False)
+        self.session.query(schema.TGroupStaffing).filter(schema.TGroupStaffing.tgroup_id.in_(
+            select(schema.TGroup.tgroup_id).where(schema.TGroup.cost_id == cost.cost_id))).delete(synchronize_session=False)
+        self.session.query(schema.TGroup).filter(schema.TGroup.cost_id == cost.cost_id).delete()
+        audit.record(cost, DELETE)
+        self.session.delete(cost)
+        audit.flush()
+        self.session.commit()
+        results = self.replicator.sync()
+        self.assertReplicated()
+        changed = sum(n for how, n in results.values() if how in (PK, CHILD))
+        self.assertEqual(results['cost_type'][0], FULL)
+        with self.source.connect() as con:
+            n_weeks = len(con.execute(select(schema.CostWeek.__table__)).all())
+        self.assertLess(results['cost_week'][1], n_weeks)
+        # Nothing changed, so only objects audited at the last mark are re-read
+        results = self.replicator.sync()
+        self.assertReplicated()
+        self.assertLess(sum(n for how, n in results.values() if how in (PK, CHILD)), changed)
+
+    def test_insert_during_copy(self):
+        self.replicator.sync()
+        cost = schema.Cost.__table__
+        with self.source.begin() as con:
+            row = dict(con.execute(select(cost).order_by(cost.c.cost_id.desc())).first()._mapping)
+            rows = [dict(row, cost_id=row['cost_id'] + i) for i in (2, 1)]
+            con.execute(cost.insert(), [rows.pop()])
+        copy = self.replicator._copy
+
+        def copy_then_insert(src, tbl, stmt):
+            n = copy(src, tbl, stmt)
+            if tbl is cost and rows:
+                # Committed after the new rows were read
+                src.execute(cost.insert(), [rows.pop()])
+            return n
+        self.replicator._copy = copy_then_insert
+        self.replicator.sync()
+        self.assertEqual(rows, [])
+        del self.replicator._copy
+        self.replicator.sync()
+        self.assertReplicated()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+Checks cost centre rollups match the equivalent joins, and refresh on change
+"""
+import unittest
+import numpy as np
+from curriculum_model.calc.rollup import RollupCache, load_rollup
+from curriculum_model.db import schema
+from curriculum_model.db.refdata import bump_version
+from curriculum_model.db.synthetic import generate_reference
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+
+class TestRollup(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        generate_reference(self.session, n_costc=12)
+        self.session.flush()
+        self.index = load_rollup(self.session)
+
+    def test_department_totals(self):
+        costcs = self.index.encoding['costc'].values
+        values = np.arange(1, len(costcs) + 1, dtype=np.float64)
+        totals = self.index.rollup(np.vstack([values, values * 2]))
+        expected = dict(self.session.execute(select(schema.Costc.department_id,
+                                                    func.count())
+                                             .group_by(schema.Costc.department_id)).all())
+        departments = self.index.encoding['department'].values
+        for d, n in expected.items():
+            in_dept = [i for i, c in enumerate(costcs)
+                       if c in self.index.children(d)]
+            self.assertEqual(len(in_dept), n)
+            j = departments.index(d)
+            self.assertEqual(totals[0, j], values[in_dept].sum())
+            self.assertEqual(totals[1, j], 2 * values[in_dept].sum())
+
+    def test_by_key(self):
+        values = self.index.by_key(['CC0001', 'CC0001', 'CC0002'], [1, 2, 4])
+        aos = self.index.rollup(values, 'costc_aos')
+        book = self.index.encoding['aos_code']
+        self.assertEqual(aos[book.code('AOS001')], 3)
+        self.assertEqual(aos.sum(), 7)
+
+    def test_refresh_on_version(self):
+        bump_version(self.session)
+        cache = RollupCache(ttl=0)
+        first = cache.get(self.session)
+        self.assertIs(cache.get(self.session), first)
+        self.session.add(schema.Costc(costc='CCNEW', description='New', pathway=True))
+        bump_version(self.session)
+        second = cache.get(self.session)
+        self.assertIsNot(second, first)
+        self.assertIn('CCNEW', second.encoding['costc'])
+
+
+if __name__ == '__main__':
+    unittest.main()
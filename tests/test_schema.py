@@ -1,9 +1,13 @@
 """
 Checks that the database schema doesn't throw any obvious errors
 """
+import os
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+import pytest
 from curriculum_model.db import schema
-from sqlalchemy import create_engine
+from tests.conftest import build_template
+from sqlalchemy import create_engine, func, select
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 from sqlalchemy.exc import IntegrityError
@@ -34,19 +38,18 @@ class TestDocs(unittest.TestCase):
         self.assertIn("Attributes", Course.__doc__)
 
 
+@pytest.mark.usefixtures("db")
 class TestTables(unittest.TestCase):
+    """Inserts into the template database; each test is rolled back afterwards."""
+    db = None
 
-    @classmethod
-    def setUpClass(cls):
-        # In memory database for testing
-        cls.engine = create_engine("sqlite:///:memory:", echo=False)
-        Session = sessionmaker(bind=cls.engine)
-        cls.session = Session()
-        schema.Base.metadata.create_all(cls.engine)
-        cls.session.execute('pragma foreign_keys=on')
-
-    def test_1curriculum(self):
-        test_curriculum = schema.Curriculum(curriculum_id=1,
+    def setUp(self):
+        if self.db is None:
+            self.skipTest("needs the db fixture from conftest.py; run with pytest")
+        self.session = self.db.session
+
+    def test_curriculum(self):
+        test_curriculum = schema.Curriculum(curriculum_id=next_id(self.session, schema.Curriculum.curriculum_id),
                                             description="Test curriculum",
                                             created_date=datetime.now(),
                                             acad_year=2020)
@@ -54,21 +57,60 @@ class TestTables(unittest.TestCase):
                                            test_curriculum, schema.Curriculum)
         self.assertEqual(test_curriculum, inserted_curriculum)
 
-    def test_2course(self):
-        test_course = schema.Course(course_id=1,
+    def test_course(self):
+        test_course = schema.Course(course_id=next_id(self.session, schema.Course.course_id),
                                     pathway="Jazz",
-                                    curriculum_id=1)
+                                    curriculum_id=self.db.curriculum_id)
         inserted_course = insert_query(
             self.session, test_course, schema.Course)
         self.assertEqual(inserted_course, test_course)
-        setattr(test_course, "curriculum_id", 2)
+        setattr(test_course, "curriculum_id", next_id(self.session, schema.Curriculum.curriculum_id))
         self.session.add(test_course)
+        with self.assertRaises(IntegrityError):
+            self.session.flush()
+
+    def test_isolation(self):
+        """Changes, even committed ones, don't outlive the test"""
+        curriculum_id = next_id(self.session, schema.Curriculum.curriculum_id)
+        self.assertEqual(curriculum_id, self.db.curriculum_id + 1)
+        self.session.add(schema.Curriculum(curriculum_id=curriculum_id, description="Committed",
+                                           created_date=datetime.now(), acad_year=2020))
+        self.session.commit()
+        self.session.query(schema.Curriculum).update({'description': "Changed"})
+        self.session.commit()
+        self.assertEqual(self.session.query(schema.Curriculum).filter_by(description="Changed").count(), 2)
+
+
+def test_template(db):
+    """The template is seeded, whatever other tests have done"""
+    assert db.session.query(schema.Curriculum.curriculum_id).all() == [(db.curriculum_id,)]
+    assert db.session.get(schema.Curriculum, db.curriculum_id).description != "Changed"
+    assert db.session.query(schema.Course).count() > 0
+
+
+def test_template_built_concurrently(tmp_path):
+    """Workers racing to build the template end up with the same curriculum"""
+    path = tmp_path / "template.db"
+    with ThreadPoolExecutor(2) as pool:
+        ids = list(pool.map(build_template, [path, path]))
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.connect() as con:
+        in_file = con.execute(select(schema.Curriculum.curriculum_id)).scalars().all()
+    engine.dispose()
+    assert ids[0] == ids[1]
+    assert in_file == [ids[0]]
+    assert os.listdir(tmp_path) == ["template.db"]
+
+
+def next_id(session, column):
+    return (session.query(func.max(column)).scalar() or 0) + 1
 
 
 def insert_query(session, test_obj, base_obj):
     session.add(test_obj)
     session.flush()
-    return session.query(base_obj).one()
+    key = {c.key: getattr(test_obj, c.key) for c in base_obj.__mapper__.primary_key}
+    return session.query(base_obj).filter_by(**key).one()
 
 
 if __name__ == '__main__':
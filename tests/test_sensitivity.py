@@ -0,0 +1,78 @@
+"""
+Checks sampled costs against the point costing
+"""
+import unittest
+import click
+import numpy as np
+from curriculum_model.calc.costing import costing, rates
+from curriculum_model.calc.frame import load_curriculum
+from curriculum_model.calc.groups import group_counts, student_numbers
+from curriculum_model.calc.sensitivity import Uncertainty, simulate
+from curriculum_model.cli.sensitivity import _overrides
+from curriculum_model.db import schema
+from curriculum_model.db.refdata import RefCache
+from curriculum_model.db.synthetic import USAGE_ID, generate
+from sqlalchemy import create_engine
+
+
+class TestSensitivity(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(engine)
+        with engine.begin() as con:
+            curriculum_id = generate(con, 8, seed=5, timetable=False)
+            cls.frame = load_curriculum(con, curriculum_id)
+            cls.students = student_numbers(con, cls.frame.encoding, 2020, USAGE_ID)
+            cost_types = RefCache().table(con, 'cost_type')
+        cls.rates = rates(cls.frame, cost_types)
+        cls.costing = costing(cls.frame, group_counts(cls.frame, cls.students), cost_types)
+
+    def simulate(self, n_samples, uncertainty, **kwargs):
+        return simulate(self.frame, self.students, self.rates, self.costing.allocation,
+                        n_samples, uncertainty, **kwargs)
+
+    def test_fixed_matches_point(self):
+        result = self.simulate(7, Uncertainty('fixed'), whole_students=False, chunk_size=3)
+        self.assertEqual(len(result), 7)
+        by_costc = self.costing.by_costc()
+        for measure in ('hours', 'nonpay'):
+            np.testing.assert_allclose(result.totals(measure), self.costing.totals()[measure])
+            for j, costc in enumerate(result.costc):
+                self.assertAlmostEqual(result.point[measure][j], by_costc[costc][measure])
+
+    def test_spread(self):
+        result = self.simulate(400, Uncertainty('normal', 0.2), seed=1)
+        low, mid, high = result.percentiles('hours')
+        self.assertTrue((low <= mid).all() and (mid <= high).all())
+        self.assertGreater((high - low).sum(), 0)
+        # Same seed, same samples
+        again = self.simulate(400, Uncertainty('normal', 0.2), seed=1)
+        np.testing.assert_array_equal(result.measures['hours'], again.measures['hours'])
+        rows = list(result.to_rows())
+        self.assertEqual([r['costc'] for r in rows], result.costc)
+        self.assertIn('nonpay_p95', rows[0])
+
+    def test_overrides(self):
+        aos = self.frame.course.decoded('aos_code')[0]
+        fixed = Uncertainty('fixed')
+        result = self.simulate(50, fixed, overrides={aos: Uncertainty('uniform', 0.5)}, seed=2)
+        everything_fixed = self.simulate(50, fixed)
+        self.assertGreater(result.totals('hours').std(), 0)
+        self.assertEqual(everything_fixed.totals('hours').std(), 0)
+
+    def test_override_option(self):
+        self.assertEqual(_overrides(['A1=uniform:0.5', 'A2:1=poisson']),
+                         {'A1': ('uniform', 0.5), ('A2', 1): ('poisson', None)})
+        for bad in ('A1', 'A1=lognormal', 'A1:x=normal', 'A1=normal:wide'):
+            with self.assertRaises(click.BadParameter):
+                _overrides([bad])
+
+    def test_unknown_distribution(self):
+        with self.assertRaises(ValueError):
+            Uncertainty('lognormal')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+"""
+Checks the costing service answers from memory and picks up changes
+"""
+import json
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timedelta
+from urllib.request import Request, urlopen
+from curriculum_model.db import schema
+from curriculum_model.db.synthetic import USAGE_ID, generate
+from curriculum_model.service import CostingService, make_server
+from curriculum_model.db.refdata import bump_version
+from sqlalchemy import create_engine, event, func, insert, select, update
+from sqlalchemy.orm import Session
+
+
+class TestService(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.dir.name, 'cm.db')}")
+        schema.Base.metadata.create_all(self.engine)
+        with self.engine.begin() as con:
+            self.curriculum_id = generate(con, 6, seed=2, timetable=False)
+        self.service = CostingService(self.engine, refresh_interval=0.05)
+        self.statements = []
+        event.listen(self.engine, 'before_cursor_execute',
+                     lambda *args: self.statements.append(args[2]))
+
+    def tearDown(self):
+        self.service.stop()
+        self.engine.dispose()
+        self.dir.cleanup()
+
+    def get(self, path, **query):
+        status, body = self.service.handle('GET', path, {k: str(v) for k, v in query.items()})
+        self.assertEqual(status, 200, body)
+        return body
+
+    def test_costs_from_memory(self):
+        total = self.get(f"/curricula/{self.curriculum_id}/costs", by='total')
+        self.assertGreater(total['hours'], 0)
+        self.statements.clear()
+        by_costc = self.get(f"/curricula/{self.curriculum_id}/costs")
+        by_department = self.get(f"/curricula/{self.curriculum_id}/costs", by='department')
+        self.get(f"/curricula/{self.curriculum_id}/students")
+        self.assertEqual(self.statements, [])
+        for by in (by_costc, by_department):
+            self.assertAlmostEqual(sum(v['hours'] for v in by.values()), total['hours'])
+
+    def test_income_and_students(self):
+        income = self.get("/income", acad_year=2020, usage_id=USAGE_ID, by='total')
+        by_department = self.get("/income", acad_year=2020, usage_id=USAGE_ID, by='department')
+        self.assertAlmostEqual(sum(v['income'] for v in by_department.values()), income['income'])
+        students = self.get("/students", acad_year=2020, usage_id=USAGE_ID)
+        self.assertAlmostEqual(sum(sum(s.values()) for s in students.values()), income['students'])
+
+    def test_errors(self):
+        self.assertEqual(self.service.handle('GET', "/curricula/999/costs")[0], 404)
+        self.assertEqual(self.service.handle('GET', "/curricula/x/costs")[0], 400)
+        self.assertEqual(self.service.handle('GET', f"/curricula/{self.curriculum_id}/costs",
+                                             {'by': 'module'})[0], 400)
+        self.assertEqual(self.service.handle('GET', "/income", {'acad_year': '2020'})[0], 400)
+        self.assertEqual(self.service.handle('GET', "/nowhere")[0], 404)
+
+    def test_refresh_on_change(self):
+        before = self.get("/income", acad_year=2020, usage_id=USAGE_ID, by='total')
+        costs = self.get(f"/curricula/{self.curriculum_id}/costs", by='total')
+        self.assertEqual(self.service.refresh(), [])
+        # A new student number instance, with every count doubled
+        with self.engine.begin() as con:
+            old = con.execute(select(func.max(schema.SNInstance.instance_id))).scalar()
+            rows = [dict(r._mapping) for r in con.execute(select(schema.SN).where(schema.SN.instance_id == old))]
+            con.execute(insert(schema.SNInstance), [{'instance_id': old + 1, 'acad_year': 2020,
+                                                     'usage_id': USAGE_ID, 'surpress': False,
+                                                     'input_datetime': datetime.now() + timedelta(seconds=1)}])
+            con.execute(insert(schema.SN), [dict(r, instance_id=old + 1,
+                                                 student_count=2 * r['student_count']) for r in rows])
+        self.assertEqual(len(self.service.refresh()), 2)
+        after = self.get("/income", acad_year=2020, usage_id=USAGE_ID, by='total')
+        self.assertAlmostEqual(after['students'], 2 * before['students'])
+        self.assertGreaterEqual(self.get(f"/curricula/{self.curriculum_id}/costs", by='total')['hours'],
+                                costs['hours'])
+
+    def test_fee_change(self):
+        before = self.get("/income", acad_year=2020, usage_id=USAGE_ID, by='total')
+        with self.engine.begin() as con:
+            con.execute(update(schema.Fee).where(schema.Fee.acad_year == 2020)
+                        .values(gross_fee=schema.Fee.gross_fee * 2))
+        self.assertEqual(self.service.refresh(), [f"students 2020 {USAGE_ID}"])
+        after = self.get("/income", acad_year=2020, usage_id=USAGE_ID, by='total')
+        self.assertEqual(after['students'], before['students'])
+        self.assertGreater(after['income'], before['income'])
+
+    def test_reference_change_seen_by_a_load(self):
+        path = f"/curricula/{self.curriculum_id}/costs"
+        before = self.get(path, by='department')
+        # New codes sorting first shift every other code up by one
+        with self.engine.begin() as con:
+            con.execute(insert(schema.Department), [{'department_id': '000', 'description': "New",
+                                                     'long_description': "New"}])
+            con.execute(insert(schema.Costc), [{'costc': '000000', 'description': "New", 'pathway': False,
+                                                'department_id': '000'}])
+        with Session(self.engine) as session:
+            bump_version(session)
+            session.commit()
+        # Noticed by loading something new, rather than by refresh()
+        self.get("/income", acad_year=2021, usage_id=USAGE_ID, by='total')
+        self.assertEqual(self.get(path, by='department'), before)
+        self.assertEqual(self.service.refresh(), [])
+
+    def test_reference_change_during_load(self):
+        path = f"/curricula/{self.curriculum_id}/costs"
+        before = self.get(path, by='department')
+        load = self.service._load_curriculum
+
+        def load_then_change(curriculum_id):
+            state = load(curriculum_id)
+            # The reference data changes, and is noticed, before the state is held
+            with self.engine.begin() as con:
+                con.execute(insert(schema.Department), [{'department_id': '000', 'description': "New",
+                                                         'long_description': "New"}])
+                con.execute(insert(schema.Costc), [{'costc': '000000', 'description': "New",
+                                                    'pathway': False, 'department_id': '000'}])
+            with Session(self.engine) as session:
+                bump_version(session)
+                session.commit()
+            self.service.refresh()
+            return state
+        self.service._curricula.clear()
+        self.service._load_curriculum = load_then_change
+        # Answered with the codebooks it was loaded with, but not held
+        self.assertEqual(self.get(path, by='department'), before)
+        self.assertEqual(self.service._curricula, {})
+        self.assertEqual(self.service._loading, {})
+        del self.service._load_curriculum
+        self.assertEqual(self.get(path, by='department'), before)
+
+    def test_http(self):
+        server = make_server(self.service, port=0, max_workers=4)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.service.start()
+        try:
+            host, port = server.server_address[:2]
+            url = f"http://{host}:{port}"
+            results = []
+
+            def fetch():
+                with urlopen(f"{url}/curricula/{self.curriculum_id}/costs?by=total") as r:
+                    results.append(json.loads(r.read()))
+            threads = [threading.Thread(target=fetch) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(len(results), 8)
+            self.assertTrue(all(r == results[0] for r in results))
+            with urlopen(Request(f"{url}/refresh", method='POST')) as r:
+                self.assertEqual(json.loads(r.read()), {'refreshed': []})
+            with urlopen(f"{url}/health") as r:
+                health = json.loads(r.read())
+            self.assertEqual([c['curriculum_id'] for c in health['curricula']], [self.curriculum_id])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+Checks subtrees are read once and copied under several parents
+"""
+import unittest
+from curriculum_model.db import schema
+from curriculum_model.db.audit import AuditWriter
+from curriculum_model.db.subtree import copy_subtree, plan, read_subtree
+from curriculum_model.db.synthetic import generate
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+
+class TestSubtree(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(self.engine)
+        self.session = sessionmaker(bind=self.engine)()
+        self.curriculum_id = generate(self.session, 4, seed=8, timetable=False)
+        self.session.commit()
+
+    def count(self, model):
+        return self.session.execute(select(func.count()).select_from(model)).scalar()
+
+    def test_fan_out(self):
+        s = schema
+        source = self.session.execute(select(s.CourseSession.course_session_id)
+                                      .order_by(s.CourseSession.course_session_id)).scalars().first()
+        courses = self.session.execute(select(s.Course.course_id)).scalars().all()[:3]
+        roots = read_subtree(self.session, 'course_session', [source])
+        expected = roots[0].count()
+        before = {m: self.count(m) for m in (s.CourseSession, s.CGroup, s.Component, s.Cost,
+                                             s.CostWeek, s.CourseConfig, s.CourseSessionConfig)}
+        audit = AuditWriter(self.session)
+        counts = copy_subtree(self.session, roots, 'course', courses, audit)
+        audit.flush()
+        self.assertEqual(counts['course_config'], 3)
+        self.assertEqual(counts['course_session_config'], 3 * expected['cgroup'])
+        for table, n in expected.items():
+            self.assertEqual(counts[table], 3 * n)
+        for model, n in before.items():
+            self.assertEqual(self.count(model) - n, counts.get(model.__tablename__, 0))
+        # Each target course has a new session linked to it, with the same shape as the source
+        for course_id in courses:
+            linked = self.session.execute(select(s.CourseConfig.course_session_id)
+                                          .where(s.CourseConfig.course_id == course_id)).scalars().all()
+            new = max(linked)
+            self.assertEqual(read_subtree(self.session, 'course_session', [new])[0].count(), expected)
+        self.assertEqual(self.count(schema.audit.t_audit_course_session), 3)
+
+    def test_plan_matches_copy(self):
+        roots = read_subtree(self.session, 'cgroup', [1, 2])
+        planned = plan(roots, 'course_session', 2)
+        self.assertFalse(self.session.new)
+        self.assertEqual(copy_subtree(self.session, roots, 'course_session', [1, 2]), planned)
+
+    def test_missing_parent(self):
+        roots = read_subtree(self.session, 'cost', [1])
+        with self.assertRaises(ValueError):
+            copy_subtree(self.session, roots, 'component', [10 ** 6])
+
+
+if __name__ == '__main__':
+    unittest.main()
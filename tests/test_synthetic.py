@@ -0,0 +1,45 @@
+"""
+Checks synthetic curricula are reproducible and complete
+"""
+import unittest
+from curriculum_model.db import schema
+from curriculum_model.db.synthetic import generate
+from sqlalchemy import create_engine, func, select
+
+
+def _counts(engine, curriculum_id):
+    with engine.connect() as con:
+        return {model.__tablename__: con.execute(select(func.count()).select_from(model)
+                                                 .where(model.curriculum_id == curriculum_id)).scalar()
+                for model in (schema.Course, schema.CourseSession, schema.CGroup, schema.Component)}
+
+
+class TestSynthetic(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(self.engine)
+
+    def test_reproducible(self):
+        with self.engine.begin() as con:
+            first = generate(con, 10, seed=3)
+            second = generate(con, 10, seed=3)
+        self.assertNotEqual(first, second)
+        self.assertEqual(_counts(self.engine, first),
+                         _counts(self.engine, second))
+        self.assertEqual(_counts(self.engine, first)['course'], 10)
+
+    def test_costs_linked(self):
+        with self.engine.begin() as con:
+            curriculum_id = generate(con, 5)
+            orphans = con.execute(select(func.count()).select_from(schema.Cost)
+                                  .where(schema.Cost.component_id.not_in(
+                                      select(schema.Component.component_id)))).scalar()
+            weeks = con.execute(select(func.count())
+                                .select_from(schema.CostWeek)).scalar()
+        self.assertEqual(orphans, 0)
+        self.assertGreater(weeks, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
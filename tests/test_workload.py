@@ -0,0 +1,56 @@
+"""
+Checks staff workload matches the hours of the groups staff are assigned to
+"""
+import unittest
+from collections import defaultdict
+from curriculum_model.calc.workload import load_workload
+from curriculum_model.db import schema
+from curriculum_model.db.synthetic import generate
+from sqlalchemy import and_, create_engine, select
+
+
+class TestWorkload(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.engine = create_engine("sqlite:///:memory:", echo=False)
+        schema.Base.metadata.create_all(cls.engine)
+        with cls.engine.begin() as con:
+            generate(con, 4, seed=5)
+            cls.curriculum_id = generate(con, 6, seed=6)
+            cls.workload = load_workload(con, cls.curriculum_id, chunk_size=100)
+
+    def test_matches_join(self):
+        s = schema
+        expected = defaultdict(float)
+        with self.engine.connect() as con:
+            rows = con.execute(select(s.TGroupStaffing.staff_id, s.CalendarMap.celcat_week,
+                                      s.Cost.mins_per_group, s.CostType.cost_multiplier)
+                               .join(s.TGroup, s.TGroup.tgroup_id == s.TGroupStaffing.tgroup_id)
+                               .join(s.Cost, s.Cost.cost_id == s.TGroup.cost_id)
+                               .join(s.CostType, s.CostType.cost_type == s.Cost.cost_type)
+                               .join(s.Component, s.Component.component_id == s.Cost.component_id)
+                               .join(s.CostWeek, s.CostWeek.cost_id == s.Cost.cost_id)
+                               .join(s.CalendarMap, and_(s.CalendarMap.curriculum_id == s.Component.curriculum_id,
+                                                         s.CalendarMap.calendar_type == s.Component.calendar_type,
+                                                         s.CalendarMap.acad_week == s.CostWeek.acad_week))
+                               .where(s.Component.curriculum_id == self.curriculum_id,
+                                      s.CostType.is_pay)).all()
+        for staff_id, week, mins, multiplier in rows:
+            expected[staff_id, week] += mins * multiplier / 60
+        actual = {(staff_id, week): hours for staff_id, week, hours in self.workload.to_rows()}
+        self.assertEqual(set(actual), set(expected))
+        for k, v in expected.items():
+            self.assertAlmostEqual(actual[k], v)
+
+    def test_thresholds(self):
+        totals = self.workload.totals()
+        limit = float(sorted(totals)[len(totals) // 2])
+        flagged = self.workload.over(total_hours=limit)
+        self.assertEqual(len(flagged), int((totals > limit).sum()))
+        self.assertEqual([f[1] for f in flagged], sorted((f[1] for f in flagged), reverse=True))
+        self.assertEqual(self.workload.over(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()